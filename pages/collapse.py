@@ -1,13 +1,65 @@
 import streamlit as st
 import networkx as nx
-from pandas import concat, DataFrame, read_csv, merge
+from pandas import concat, DataFrame, merge
 from matplotlib import pyplot as plt
-from toolbox.net_utils import generate_graph, get_k_connected_components, get_basic_statistics
+from matplotlib.collections import LineCollection
+from io import BytesIO
+from os import path
+from toolbox.net_utils import generate_graph, get_k_connected_components
+from toolbox.cache import ScenarioCache, StatsCache
+from toolbox.criticality import BlockCutIndex
+from toolbox.graph import CSRGraph
+from toolbox.incremental import CollapseEngine
+from toolbox.snapshot import load_network
+from toolbox.metrics import efficiency_sweep
+from toolbox.stats import GraphStats
+from toolbox.storage import load_table
 from toolbox.genai import OpenAIManager
 from toolbox.utils import add_data_to_complete_chat
 from loguru import logger
 from json import loads
 
+
+@st.cache_resource
+def get_stats_cache() -> StatsCache:
+    """On-disk statistics cache shared by every session of this process."""
+    return StatsCache()
+
+
+@st.cache_resource
+def get_scenario_cache() -> ScenarioCache:
+    """Results of the scenarios already computed by any session of this process."""
+    return ScenarioCache()
+
+
+def get_network_version(option: str) -> float:
+    """
+    Modification time of the network of a node type, which changes when `toolbox.refresh` rewrites it.
+
+    The resources keyed by it keep three entries, one per node type, so the
+    ones of replaced versions are released.
+    """
+    return path.getmtime(f"data/net_{option}.csv")
+
+
+@st.cache_resource(max_entries=3)
+def get_network_data(option: str, version: float) -> DataFrame:
+    """Edges of the network of every node type, read once per version. Do not modify it."""
+    return load_table(f"net_{option}")
+
+
+@st.cache_resource(max_entries=3)
+def get_collapse_engine(option: str, version: float) -> CollapseEngine:
+    """Baseline of the what-if engine of every node type, shared by every session."""
+    return CollapseEngine.from_snapshot(load_network(f"net_{option}"), precompute=option != "busstop")
+
+
+@st.cache_resource(max_entries=3)
+def get_cut_index(option: str, version: float) -> BlockCutIndex:
+    """Articulation points and bridges of the baseline graph of every node type."""
+    return BlockCutIndex(get_collapse_engine(option, version).graph)
+
+
 hide_img_fs = """
 <style>
 button[title="View fullscreen"]{
@@ -50,9 +102,10 @@ option = st.selectbox(
    index=0, format_func=lambda c: selectbox_dict[c]
 )
 cols = st.columns(spec=2, gap="small")
-data = read_csv(f"data/net_{option}.csv")
-if option == "busstop":
-    data = data[data["n_buses"] > 1]
+version = get_network_version(option)
+data = get_network_data(option, version)
+approximate = 500 if option == "busstop" else None
+new_line = False
 
 text = st.text_area(
     label="¿Quieres conectar una línea nueva? (GPT Powered)",
@@ -88,13 +141,18 @@ if text:
             new_df_aux = merge(new_df_aux, ll.drop(columns=["n_buses", "weight"]).rename(columns={"from_lat": "to_lat", "from_lon": "to_lon", "from_node": "to_node"}), on="to_node", how="inner")
             new_df_aux = new_df_aux[data.columns].drop_duplicates(keep="first", subset=["from_node", "to_node", "edge"])
             data = concat([data, new_df_aux], axis=0, ignore_index=True)
+            new_line = True
         except Exception as err:
             logger.error(err)
 
-edge_options = sorted(data["edge"].str.zfill(5).unique())
-node_options = sorted(list(set(
-    data["from_node"].unique().tolist() + data["to_node"].unique().tolist()
-    )))
+if new_line:
+    edge_options = sorted(data["edge"].str.zfill(5).unique())
+    node_options = sorted(list(set(
+        data["from_node"].unique().tolist() + data["to_node"].unique().tolist()
+        )))
+else:
+    edge_options = get_collapse_engine(option, version).lines
+    node_options = sorted(get_collapse_engine(option, version).graph.node_ids.tolist())
 edges = cols[0].multiselect(
     "¿Quieres eliminar alguna línea?",
     edge_options,
@@ -105,63 +163,119 @@ nodos = cols[1].multiselect(
     node_options,
     placeholder="Elige uno o varios nodos a eliminar"
     )
+if nodos and not new_line:
+    cut_index = get_cut_index(option, version)
+    for nodo in nodos:
+        disconnected = cut_index.node_disconnects(nodo)
+        if disconnected:
+            cols[1].caption(f"Quitar {nodo} por sí solo deja {disconnected} nodos separados del resto de la red.")
 
 cols = st.columns(spec=2, gap="small")
 cols[1].markdown("### Grafo.")
-if edges:
-    logger.info("Filtrando edges")
-    data = data[~data["edge"].str.zfill(5).isin(edges)]
-if nodos:
-    logger.info("Filtrando nodos")
-    data = data[~data["from_node"].isin(nodos)]
-    data = data[~data["to_node"].isin(nodos)]
-graph = generate_graph(dataframe=data)
-is_connected = nx.is_connected(G=graph)
-if not is_connected:
-    connected_nodes = get_k_connected_components(network=graph, k=100000)
-    graph = graph.subgraph(nodes=connected_nodes[0])
-pos = nx.get_node_attributes(graph, "pos")
-ww = [graph[u][v]["weight"] * 2 for u,v in graph.edges()]
-fig, ax = plt.subplots(figsize=(4,4))
-nx.draw(
-    graph, pos, width=ww, ax=ax,
-    with_labels=False, node_color="#2c7abf", font_size=8, 
-    node_size=1, edge_color="#686c6f", font_color="#fff", 
-    font_weight="bold"
-    )
-cols[1].pyplot(fig=fig, clear_figure=True, use_container_width=True)
+scenario_cache = get_scenario_cache()
+scenario_key = None if new_line else ScenarioCache.key(option=option, lines=edges, nodes=nodos, version=version)
+cached = scenario_cache.get(scenario_key) if scenario_key is not None else None
+if cached is None:
+    precomputed = None
+    if new_line:
+        if edges:
+            logger.info("Filtrando edges")
+            data = data[~data["edge"].str.zfill(5).isin(edges)]
+        if nodos:
+            logger.info("Filtrando nodos")
+            data = data[~data["from_node"].isin(nodos)]
+            data = data[~data["to_node"].isin(nodos)]
+        graph = generate_graph(dataframe=data)
+        efficiency = efficiency_sweep(graph=CSRGraph.from_networkx(graph))
+        is_connected = nx.is_connected(G=graph)
+        if not is_connected:
+            connected_nodes = get_k_connected_components(network=graph, k=100000)
+            graph = graph.subgraph(nodes=connected_nodes[0])
+        graph = CSRGraph.from_networkx(graph)
+    else:
+        scenario = st.session_state.get(f"collapse_{option}")
+        if scenario is None or not scenario.extends(lines=edges, nodes=nodos):
+            scenario = get_collapse_engine(option, version).copy()
+        scenario.remove_lines(lines=edges).remove_nodes(nodes=nodos)
+        st.session_state[f"collapse_{option}"] = scenario
+        logger.info(f"Escenario actualizado: {scenario.last_update}")
+        efficiency = efficiency_sweep(graph=scenario.subgraph())
+        connected_nodes = scenario.components()
+        is_connected = len(connected_nodes) == 1
+        graph = scenario.subgraph(nodes=connected_nodes[0])
+        if approximate is None:
+            precomputed = scenario.statistics(nodes=connected_nodes[0], betweenness=True)
+    fig, ax = plt.subplots(figsize=(4,4))
+    segments = list(zip(graph.pos[graph.edge_src], graph.pos[graph.edge_dst]))
+    ax.add_collection(LineCollection(segments, linewidths=graph.weight * 2, colors="#686c6f"))
+    ax.scatter(graph.pos[:, 0], graph.pos[:, 1], s=1, c="#2c7abf", zorder=2)
+    ax.autoscale()
+    ax.set_axis_off()
+    figure = BytesIO()
+    fig.savefig(figure, format="png", bbox_inches="tight", dpi=200)
+    plt.close(fig)
+    statistics = GraphStats(
+        network=graph, approximate=approximate, cache=get_stats_cache(), precomputed=precomputed,
+        eig_start=st.session_state.get(f"eig_{option}")
+    ).compute([
+        "num_nodes", "num_edges", "density", "diameter", "mean_ncn", "mean_net_sp",
+        "centrality", "betweeness_centrality", "closeness_centrality", "eig_centrality",
+    ])
+    st.session_state[f"eig_{option}"] = statistics["eig_centrality"]
+    logger.info(f"Centralidad propia: {statistics['eig_diagnostics']}")
+    cached = {
+        "graph": graph,
+        "statistics": {metric: statistics[metric] for metric in statistics.computed()},
+        "figure": figure.getvalue(),
+        "num_components": 1 if is_connected else len(connected_nodes),
+        "global_efficiency": efficiency["global_efficiency"],
+        "reachability": efficiency["reachability"],
+    }
+    if scenario_key is not None:
+        scenario_cache.put(scenario_key, cached)
+logger.info(f"Caché de escenarios: {scenario_cache.counters()}, acierto {scenario_cache.hit_rate():.0%}")
+graph, statistics = cached["graph"], cached["statistics"]
+nodes = graph.node_ids.tolist()
+is_connected = cached["num_components"] == 1
+cols[1].image(cached["figure"], use_column_width=True)
 cols[0].markdown("### Métricas.")
-statistics = get_basic_statistics(network=graph)
+diameter_body = f"{round(statistics.get('diameter'), 3)}"
+mean_net_sp_body = f"{round(statistics.get('mean_net_sp'), 3)}"
+if "diameter_bounds" in statistics:
+    diameter_body += f" (entre {statistics['diameter_bounds'][0]} y {statistics['diameter_bounds'][1]})"
+    mean_net_sp_body += f" ± {round(statistics.get('mean_net_sp_error'), 3)}"
 statistics_body = (
     f"- Número de nodos del grafo: {statistics.get('num_nodes')}\n"
     f"- Número de conexiones del grafo: {statistics.get('num_edges')}\n"
     f"- Densidad del grafo: {round(statistics.get('density'), 3)}\n"
-    f"- Diámetro del grafo: {round(statistics.get('diameter'), 3)}\n"
+    f"- Diámetro del grafo: {diameter_body}\n"
     f"- Grado medio del grafo: {round(statistics.get('mean_ncn'), 3)}\n"
-    f"- Media de caminos más cortos del grafo: {round(statistics.get('mean_net_sp'), 3)}\n"
+    f"- Media de caminos más cortos del grafo: {mean_net_sp_body}\n"
+    f"- Eficiencia global de la red completa: {round(cached['global_efficiency'], 3)}\n"
+    f"- Pares de nodos conectados en la red completa: {round(100 * cached['reachability'], 1)} %\n"
 )
 cols[0].markdown(body=statistics_body)
-ns = [100 * statistics["centrality"].get(node) for node in graph.nodes]
-df = DataFrame({selectbox_dict[option]: graph.nodes, "% conectados": ns})
+ns = [100 * statistics["centrality"].get(node) for node in nodes]
+df = DataFrame({selectbox_dict[option]: nodes, "% conectados": ns})
 df = df.sort_values(by="% conectados", ascending=False).head(5).reset_index(drop=True)
 cols = st.columns(spec=2, gap="small")
 cols[0].table(df)
-ns = [100 * statistics["closeness_centrality"].get(node) for node in graph.nodes]
-df = DataFrame({selectbox_dict[option]: graph.nodes, "Grado de centralidad de cercanía": [_/100 for _ in ns]})
+ns = [100 * statistics["closeness_centrality"].get(node) for node in nodes]
+df = DataFrame({selectbox_dict[option]: nodes, "Grado de centralidad de cercanía": [_/100 for _ in ns]})
 df = df.sort_values(by="Grado de centralidad de cercanía", ascending=False).head(5).reset_index(drop=True)
 cols[1].table(df)
 cols = st.columns(spec=2, gap="small")
 
-ns = [100 * statistics["eig_centrality"].get(node) for node in graph.nodes]
-df = DataFrame({selectbox_dict[option]: graph.nodes, "Grado de centralidad propia": [_/100 for _ in ns]})
+ns = [100 * statistics["eig_centrality"].get(node) for node in nodes]
+df = DataFrame({selectbox_dict[option]: nodes, "Grado de centralidad propia": [_/100 for _ in ns]})
 df = df.sort_values(by="Grado de centralidad propia", ascending=False).head(5).reset_index(drop=True)
 cols[0].table(df)
 
-ns = [100 * statistics["betweeness_centrality"].get(node) for node in graph.nodes]
-df = DataFrame({selectbox_dict[option]: graph.nodes, "Grado de intermediación": ns})
+ns = [100 * statistics["betweeness_centrality"].get(node) for node in nodes]
+df = DataFrame({selectbox_dict[option]: nodes, "Grado de intermediación": ns})
 df = df.sort_values(by="Grado de intermediación", ascending=False).head(5).reset_index(drop=True)
 cols[1].table(df)
 
 if not is_connected:
-    warning_body = f"> :warning: <small style='font-size: 10px;'>Con las elecciones tomadas el grafo inicial se ha desconectado en {len(connected_nodes)} subgrafos.</small>"
+    warning_body = f"> :warning: <small style='font-size: 10px;'>Con las elecciones tomadas el grafo inicial se ha desconectado en {cached['num_components']} subgrafos.</small>"
     st.markdown(body=warning_body, unsafe_allow_html=True)
\ No newline at end of file
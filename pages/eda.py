@@ -2,6 +2,7 @@ import streamlit as st
 import folium
 from folium.plugins import MarkerCluster
 import pandas as pd
+from toolbox.storage import load_table
 hide_img_fs = """
 <style>
 button[title="View fullscreen"]{
@@ -39,7 +40,7 @@ el funcionamiento del sistema de transporte público en la capital española.
 """
 st.write(texto)
 
-df_combinado_nonull = pd.read_csv('data/df_combinado_latlon.csv')
+df_combinado_nonull = load_table("df_combinado_latlon")
 # Crear un mapa centrado en Madrid
 madrid_map = folium.Map(location=[40.4168, -3.7038], zoom_start=12)
 # Crear un cluster de marcadores
@@ -87,8 +88,8 @@ la capacidad del sistema para satisfacer dicha demanda.
 st.write(texto)
 
 st.markdown(body="##### Paradas con mayor afluencia")
-emt_csv = pd.read_csv('data/df_combinado_latlon.csv')
-df_distritos = pd.read_csv('data/df_distritos.csv')
+emt_csv = load_table("df_combinado_latlon")
+df_distritos = load_table("df_distritos")
 df_distritos.rename(columns={'numero_distrito':'distrito_parada'}, inplace=True)
 important_stops = emt_csv[['codigo_parada','direccion_parada','distrito_parada','latitud','longitud']].value_counts().reset_index().head(9)
 df_merged = pd.merge(important_stops, df_distritos[['distrito_parada', 'nombre_distrito']], on='distrito_parada', how='left')
@@ -158,7 +159,7 @@ comprender la extensión y la cobertura de cada línea a lo largo de la ciudad,
 """
 st.write(texto)
 
-recorrido_toA = pd.read_csv('data/stops_toA.csv')
+recorrido_toA = load_table("stops_toA")
 
 import matplotlib.pyplot as plt
 
@@ -407,12 +408,12 @@ y la eficiencia del servicio. Además, se podrá identificar posibles áreas de
 """
 st.write(texto)
 
-df_distancias = pd.read_csv('data/stops_toA.csv')
+df_distancias = load_table("stops_toA")
 
 st.markdown(body="#### Líneas con la distancia más larga y más corta")
 
-distancias_maximas = df_distancias.groupby('linea')['distance'].max()
-distancias_minimas = df_distancias.groupby('linea')['distance'].max()
+distancias_maximas = df_distancias.groupby('linea', observed=True)['distance'].max()
+distancias_minimas = df_distancias.groupby('linea', observed=True)['distance'].max()
 distancias_maximas = distancias_maximas.sort_values(ascending=False).head(5)
 distancias_minimas = distancias_minimas.sort_values(ascending=False).tail(5)
 
@@ -520,12 +521,12 @@ st.write(texto)
 
 st.markdown(body="#### Mayor y menor distancia entre paradas ")
 # Calcular la distancia entre paradas
-df_distancias['distancia_entre_paradas'] = df_distancias.groupby('linea')['distance'].diff().fillna(0)
+df_distancias['distancia_entre_paradas'] = df_distancias.groupby('linea', observed=True)['distance'].diff().fillna(0)
 # Resetear la distancia cuando cambia la línea
 linea_cambia = df_distancias['linea'] != df_distancias['linea'].shift(1)
 df_distancias['distancia_entre_paradas'] = df_distancias['distancia_entre_paradas'].where(~linea_cambia, 0).astype(int)
-distancias_parada_maximas = df_distancias.groupby('linea')['distancia_entre_paradas'].max()
-distancias_parada_minimas = df_distancias.groupby('linea')['distancia_entre_paradas'].nsmallest(2).groupby(level=0).nth(1)
+distancias_parada_maximas = df_distancias.groupby('linea', observed=True)['distancia_entre_paradas'].max()
+distancias_parada_minimas = df_distancias.groupby('linea', observed=True)['distancia_entre_paradas'].nsmallest(2).groupby(level=0, observed=True).nth(1)
 distancias_parada_maximas = distancias_parada_maximas.sort_values(ascending=False).head(5)
 distancias_parada_minimas = distancias_parada_minimas.sort_values(ascending=False).tail(6)
 df_distancias_parada_max = df_distancias[df_distancias['linea'].isin(distancias_parada_maximas.index)]
@@ -641,8 +642,8 @@ st.write(texto)
 
 st.markdown(body="#### Distritos más contaminantes")
 
-df_info = pd.read_csv('data/emt-data-clean.csv')
-df_paradas = pd.read_csv('data/stops_toA.csv')
+df_info = load_table("emt-data-clean")
+df_paradas = load_table("stops_toA")
 
 df2_unique = df_info.drop_duplicates(subset='codigo_parada')
 distritos_df = pd.merge(df_paradas, df2_unique[['codigo_parada', 'distrito_parada']], left_on='stopNum', right_on='codigo_parada', how='left')
@@ -650,11 +651,11 @@ distritos_df.drop(columns=['codigo_parada'], inplace=True)
 distritos_df.rename(columns={'distrito_parada': 'distrito'}, inplace=True)
 distritos_df.dropna(inplace=True)
 distritos_df['distrito'] = distritos_df['distrito'].astype(int)
-distritos_df['distancia_entre_paradas'] = distritos_df.groupby('linea')['distance'].diff().fillna(0)
+distritos_df['distancia_entre_paradas'] = distritos_df.groupby('linea', observed=True)['distance'].diff().fillna(0)
 linea_cambia = distritos_df['linea'] != distritos_df['linea'].shift(1)
 distritos_df['distancia_entre_paradas'] = distritos_df['distancia_entre_paradas'].where(~linea_cambia, 0).astype(int)
 
-dic_distr = pd.read_csv('data/df_distritos.csv')
+dic_distr = load_table("df_distritos")
 dic_distr.drop(columns=['Unnamed: 0'], inplace=True)
 distrito_distancia = distritos_df.groupby('distrito')['distancia_entre_paradas'].sum()
 distrito_distancia_sorted = distrito_distancia.sort_values(ascending=False)
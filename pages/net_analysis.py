@@ -1,12 +1,22 @@
 import networkx as nx
 import streamlit as st
 from matplotlib import pyplot as plt
-from pandas import DataFrame, read_csv
+from pandas import DataFrame
 
-from toolbox.net_utils import generate_graph, get_basic_statistics, get_k_connected_components
+from toolbox.net_utils import generate_graph, get_k_connected_components
+from toolbox.cache import StatsCache
+from toolbox.stats import GraphStats
+from toolbox.storage import load_table
 
 from loguru import logger
 
+
+@st.cache_resource
+def get_stats_cache() -> StatsCache:
+    """On-disk statistics cache shared by every session of this process."""
+    return StatsCache()
+
+
 hide_img_fs = """
 <style>
 button[title="View fullscreen"]{
@@ -46,16 +56,19 @@ option = st.selectbox(
    index=0, format_func=lambda c: selectbox_dict[c]
 )
 cols = st.columns(spec=2, gap="small")
-data = read_csv(f"data/net_{option}.csv")
-if option == "busstop":
-    data = data[data["n_buses"] > 1]
+data = load_table(f"net_{option}")
+approximate = 500 if option == "busstop" else None
 graph = generate_graph(dataframe=data)
 is_connected = nx.is_connected(G=graph)
 if not is_connected:
     connected_nodes = get_k_connected_components(network=graph, k=1)
     graph = graph.subgraph(nodes=connected_nodes[0])
 
-statistics = get_basic_statistics(network=graph)
+statistics = GraphStats(network=graph, approximate=approximate, cache=get_stats_cache()).compute([
+    "num_nodes", "num_edges", "density", "diameter", "mean_ncn", "mean_net_sp",
+    "ncn", "mean_sp",
+    "centrality", "betweeness_centrality", "closeness_centrality", "eig_centrality",
+])
 pos = nx.get_node_attributes(graph, "pos")
 ww = [graph[u][v]["weight"] * 2 for u,v in graph.edges()]
 fig, ax = plt.subplots(figsize=(4,4))
@@ -66,19 +79,24 @@ nx.draw(
     font_weight="bold"
     )
 cols[0].pyplot(fig=fig, clear_figure=True, use_container_width=True)
-if option == "busstop":
-    warning_body = "> :warning: <small style='font-size: 10px;'>Para el grafo basado en paradas de autobús se han filtrado aquellas paradas que están conectadas solo por 1 autobús por motivos de cómputo.</small>"
+if "pivots" in statistics:
+    warning_body = f"> :warning: <small style='font-size: 10px;'>Para el grafo basado en paradas de autobús los caminos más cortos, el diámetro y las centralidades de intermediación y cercanía se estiman a partir de {len(statistics['pivots'])} paradas elegidas al azar (intervalos de confianza del 95%).</small>"
     cols[1].markdown(body=warning_body, unsafe_allow_html=True)
 if not is_connected:
     warning_body = "> :warning: <small style='font-size: 10px;'>El grafo inicial no está completamente conectado. La visualización y cálculos se realiza sobre el conjunto de nodos que más conexiones tiene.</small>"
     cols[1].markdown(body=warning_body, unsafe_allow_html=True)
+diameter_body = f"{round(statistics.get('diameter'), 3)}"
+mean_net_sp_body = f"{round(statistics.get('mean_net_sp'), 3)}"
+if "diameter_bounds" in statistics:
+    diameter_body += f" (entre {statistics['diameter_bounds'][0]} y {statistics['diameter_bounds'][1]})"
+    mean_net_sp_body += f" ± {round(statistics.get('mean_net_sp_error'), 3)}"
 statistics_body = (
     f"- Número de nodos del grafo: {statistics.get('num_nodes')}\n"
     f"- Número de conexiones del grafo: {statistics.get('num_edges')}\n"
     f"- Densidad del grafo: {round(statistics.get('density'), 3)}\n"
-    f"- Diámetro del grafo: {round(statistics.get('diameter'), 3)}\n"
+    f"- Diámetro del grafo: {diameter_body}\n"
     f"- Grado medio del grafo: {round(statistics.get('mean_ncn'), 3)}\n"
-    f"- Media de caminos más cortos del grafo: {round(statistics.get('mean_net_sp'), 3)}\n"
+    f"- Media de caminos más cortos del grafo: {mean_net_sp_body}\n"
 )
 cols[1].markdown(body=statistics_body)
 st.markdown("### Distribución de grado.")
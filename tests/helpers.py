@@ -0,0 +1,30 @@
+from os import path
+from typing import Hashable, Iterable
+
+import networkx as nx
+from pandas import DataFrame, read_csv
+
+DATA_DIR = path.join(path.dirname(path.dirname(path.abspath(__file__))), "data")
+NETWORKS = ["net_distrito", "net_cp"]
+
+
+def read_network(name: str) -> DataFrame:
+    """Shipped `net_*.csv` table with the line of every row as a string."""
+    return read_csv(path.join(DATA_DIR, f"{name}.csv"), dtype={"edge": str})
+
+
+def reference_graph(dataframe: DataFrame, nodes: Iterable[Hashable]=()) -> nx.Graph:
+    """NetworkX graph of the rows, built as `generate_graph` first did over the de-duplicated rows."""
+    network = nx.Graph()
+    network.add_nodes_from(nodes)
+    for row in dataframe[["from_node", "to_node", "weight"]].drop_duplicates().itertuples():
+        network.add_edge(row.from_node, row.to_node, weight=row.weight)
+    return network
+
+
+def without(dataframe: DataFrame, lines: Iterable[str]=(), nodes: Iterable[Hashable]=()) -> DataFrame:
+    """Rows left after removing `lines` and every row touching `nodes`."""
+    keep = ~dataframe["edge"].str.zfill(5).isin(list(lines))
+    nodes = list(nodes)
+    keep &= ~dataframe["from_node"].isin(nodes) & ~dataframe["to_node"].isin(nodes)
+    return dataframe[keep]
@@ -0,0 +1,43 @@
+import networkx as nx
+import pytest
+from numpy import abs as absolute, mean
+from numpy.testing import assert_allclose
+
+from tests.helpers import read_network
+from toolbox.graph import CSRGraph
+from toolbox.metrics import approximate_sweep, bfs_sweep
+
+METRICS = ["mean_sp", "closeness", "betweenness"]
+
+
+@pytest.fixture(scope="module")
+def graph():
+    return CSRGraph.from_dataframe(read_network("net_cp"))
+
+
+def test_every_pivot_is_exact(graph):
+    exact = bfs_sweep(graph)
+    sweep = approximate_sweep(graph, k=graph.number_of_nodes())
+    for metric in METRICS:
+        assert_allclose(sweep[metric], exact[metric], atol=1e-12)
+        assert_allclose(sweep[f"{metric}_error"], 0.0, atol=1e-12)
+    assert sweep["diameter"] == exact["eccentricity"].max()
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_error_bounds_cover_the_exact_values(graph, seed):
+    exact = bfs_sweep(graph)
+    sweep = approximate_sweep(graph, k=25, seed=seed)
+    for metric in METRICS:
+        covered = absolute(sweep[metric] - exact[metric]) <= sweep[f"{metric}_error"] + 1e-12
+        assert mean(covered) >= 0.8, metric
+    assert abs(sweep["mean_net_sp"] - exact["mean_sp"].mean()) <= sweep["mean_net_sp_error"]
+    lower, upper = sweep["diameter_bounds"]
+    assert lower <= exact["eccentricity"].max() <= upper
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_diameter_bounds_of_a_disconnected_graph(seed):
+    network = nx.disjoint_union(nx.path_graph(30), nx.star_graph(5))
+    lower, upper = approximate_sweep(CSRGraph.from_networkx(network), k=3, seed=seed)["diameter_bounds"]
+    assert lower <= 29 <= upper
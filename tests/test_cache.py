@@ -0,0 +1,130 @@
+from os import utime
+from threading import Thread
+
+import networkx as nx
+import pytest
+from loguru import logger
+from numpy import zeros
+
+from toolbox.cache import ScenarioCache, StatsCache
+from toolbox.graph import CSRGraph
+from toolbox.stats import GraphStats
+
+
+@pytest.fixture
+def warnings():
+    messages = []
+    handler = logger.add(messages.append, level="WARNING")
+    yield messages
+    logger.remove(handler)
+
+
+def test_stats_cache_miss_store_and_hit(tmp_path):
+    cache = StatsCache(directory=str(tmp_path))
+    network = nx.karate_club_graph()
+    first = GraphStats(network, cache=cache).compute(["diameter", "sp", "betweeness_centrality"])
+    assert cache.counters() == {"hits": 0, "misses": 1, "stores": 1, "evictions": 0}
+    second = GraphStats(network, cache=cache)
+    assert cache.counters()["hits"] == 1
+    assert second.computed() == first.computed()
+    assert second["betweeness_centrality"] == first["betweeness_centrality"]
+    assert (second["sp"].data == first["sp"].data).all()
+    assert cache.counters()["stores"] == 1
+
+
+def test_stats_cache_treats_a_truncated_matrix_as_a_miss(tmp_path):
+    cache = StatsCache(directory=str(tmp_path))
+    GraphStats(nx.path_graph(6), cache=cache).compute(["sp", "diameter"])
+    entry = next(tmp_path.iterdir())
+    with open(entry / "sp.npy", "r+b") as file:
+        file.truncate(20)
+    statistics = GraphStats(nx.path_graph(6), cache=cache)
+    assert cache.counters()["misses"] == 2
+    assert statistics["diameter"] == 5
+
+
+def test_stats_cache_evicts_the_least_recently_used_entry(tmp_path):
+    cache = StatsCache(directory=str(tmp_path))
+    nodes = list(range(1000))
+    values = {"mean_sp": [float(node) for node in nodes]}
+    cache.store("old", values, nodes)
+    cache.store("new", values, nodes)
+    utime(tmp_path / "old", (0, 0))
+    utime(tmp_path / "new", (1, 1))
+    cache.load("old", nodes)
+    cache.max_bytes = cache.size() // 2 + 1
+    assert cache.evict() == ["new"]
+    assert cache.load("old", nodes) == values
+    assert cache.load("new", nodes) == {}
+    assert cache.counters()["evictions"] == 1
+
+
+def test_stats_cache_keeps_node_metrics_in_any_order(tmp_path, warnings):
+    cache = StatsCache(directory=str(tmp_path))
+    nodes = ["a", "b", 3]
+    cache.store("key", {"closeness_centrality": {3: 0.5, "a": 0.1, "b": 0.2}, "bad": {(1, 2): 1}}, nodes)
+    assert cache.load("key", nodes) == {"closeness_centrality": {"a": 0.1, "b": 0.2, 3: 0.5}}
+    assert len(warnings) == 1 and "bad" in warnings[0]
+
+
+def test_stats_cache_key_depends_on_the_graph_and_parameters(tmp_path):
+    cache = StatsCache(directory=str(tmp_path))
+    graph = CSRGraph.from_networkx(nx.path_graph(5))
+    assert cache.key(graph, {"approximate": None}) != cache.key(graph, {"approximate": 3})
+    assert cache.key(graph, {}) != cache.key(CSRGraph.from_networkx(nx.cycle_graph(5)), {})
+
+
+def test_scenario_cache_key_ignores_order_and_padding():
+    assert ScenarioCache.key("cp", ["27", "1"], [3, 2]) == ScenarioCache.key("cp", ["00001", "00027"], [2, 3])
+    assert ScenarioCache.key("cp", ["27"], []) != ScenarioCache.key("distrito", ["27"], [])
+    assert ScenarioCache.key("cp", ["27"], [], version=1) != ScenarioCache.key("cp", ["27"], [], version=2)
+
+
+def test_scenario_cache_evicts_the_least_recently_used_entries():
+    cache = ScenarioCache(max_bytes=300)
+    for name in "abc":
+        cache.put(name, name.upper(), size=100)
+    assert cache.get("a") == "A"
+    cache.put("d", "D", size=100)
+    assert "b" not in cache and list("acd") == [name for name in "abcd" if name in cache]
+    cache.put("e", "E", size=250)
+    assert len(cache) == 1 and "e" in cache
+    cache.put("f", "F", size=301)
+    assert "f" not in cache and "e" in cache
+    assert cache.counters() == {
+        "hits": 1, "misses": 0, "stores": 5, "evictions": 4, "entries": 1, "bytes": 250,
+    }
+    cache.put("e", "E", size=50)
+    assert cache.counters()["bytes"] == 50
+
+
+def test_scenario_cache_estimates_sizes_from_the_arrays():
+    graph = CSRGraph.from_networkx(nx.karate_club_graph())
+    matrix = zeros((500, 500))
+    cache = ScenarioCache(max_bytes=4 * matrix.nbytes)
+    cache.put("matrix", {"sp": matrix, "rows": matrix[:10], "same": matrix})
+    matrix_bytes = cache.counters()["bytes"]
+    assert matrix.nbytes < matrix_bytes < 1.1 * matrix.nbytes
+    cache.put("graph", {"graph": graph, "figure": bytes(1000), "statistics": {"diameter": 5}})
+    assert cache.counters()["bytes"] - matrix_bytes > graph.indices.nbytes + 1000
+    cache.put("unpicklable", {"callback": lambda: None})
+    assert "unpicklable" in cache
+
+
+def test_scenario_cache_is_shared_by_threads():
+    cache = ScenarioCache(max_bytes=1000)
+
+    def work(offset):
+        for index in range(500):
+            cache.put((offset + index) % 40, index, size=30)
+            cache.get((offset + index + 1) % 40)
+            len(cache), index in cache
+
+    threads = [Thread(target=work, args=(offset,)) for offset in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    counters = cache.counters()
+    assert counters["bytes"] == 30 * counters["entries"] <= 1000
+    assert counters["hits"] + counters["misses"] == 2000
@@ -0,0 +1,24 @@
+from filecmp import cmp
+from os import path
+
+import pytest
+
+from tests.helpers import DATA_DIR
+from toolbox.cleaning import clean_data, main
+
+CLEAN_TABLES = ["emt-data-clean.csv", "emt-linea-data-clean.csv"]
+
+
+@pytest.mark.parametrize("chunk_size, max_rows", [(50_000, 2_000_000), (997, 400), (101, 3000)])
+def test_clean_data_writes_the_notebook_tables(tmp_path, chunk_size, max_rows):
+    paths = clean_data(DATA_DIR, output_dir=str(tmp_path), chunk_size=chunk_size, max_rows=max_rows)
+    assert paths == [str(tmp_path / name) for name in CLEAN_TABLES]
+    for name in CLEAN_TABLES:
+        assert cmp(tmp_path / name, path.join(DATA_DIR, name), shallow=False), name
+    assert sorted(file.name for file in tmp_path.iterdir()) == CLEAN_TABLES
+
+
+def test_main_cleans_into_the_output_dir(tmp_path):
+    main(["--data-dir", DATA_DIR, "-o", str(tmp_path / "clean"), "--chunk-size", "500", "--max-rows", "2000"])
+    for name in CLEAN_TABLES:
+        assert cmp(tmp_path / "clean" / name, path.join(DATA_DIR, name), shallow=False), name
@@ -0,0 +1,65 @@
+from json import dumps
+
+import networkx as nx
+import pytest
+from pandas import read_parquet
+
+from tests.helpers import DATA_DIR, read_network, reference_graph, without
+from toolbox.collapse import evaluate_scenarios, main, read_scenarios
+
+
+@pytest.fixture
+def scenarios_path(tmp_path):
+    scenarios = [
+        {"option": "cp", "lines": [1, "27"], "name": "two lines"},
+        {"option": "distrito", "nodes": ["01", 2]},
+        {"option": "distrito", "lines": ["00027"], "nodes": [1, 2]},
+        {"option": "cp", "nodes": [1]},
+    ]
+    scenarios_path = tmp_path / "scenarios.jsonl"
+    scenarios_path.write_text("\n".join(dumps(scenario) for scenario in scenarios) + "\n")
+    return str(scenarios_path)
+
+
+def test_read_scenarios_normalizes_lines_and_nodes(scenarios_path):
+    scenarios = read_scenarios(scenarios_path)
+    assert scenarios[0] == {"name": "two lines", "option": "cp", "lines": ["00001", "00027"], "nodes": []}
+    assert scenarios[1] == {"name": "1", "option": "distrito", "lines": [], "nodes": [1, 2]}
+
+
+@pytest.mark.parametrize("scenario, message", [
+    ({"option": "barrio"}, "option=barrio"),
+    ({"option": "cp", "nodes": ["28a01"]}, "node='28a01'"),
+])
+def test_read_scenarios_rejects_invalid_values(tmp_path, scenario, message):
+    scenarios_path = tmp_path / "scenarios.json"
+    scenarios_path.write_text(dumps([scenario]))
+    with pytest.raises(ValueError, match=message):
+        read_scenarios(str(scenarios_path))
+
+
+def test_evaluate_scenarios_matches_networkx(scenarios_path):
+    scenarios = read_scenarios(scenarios_path)
+    results = evaluate_scenarios(scenarios, data_dir=DATA_DIR, chunk_size=2)
+    assert results["name"].tolist() == [scenario["name"] for scenario in scenarios]
+    for scenario, row in zip(scenarios[:3], results.itertuples()):
+        dataframe = read_network(f"net_{scenario['option']}")
+        reference = reference_graph(without(dataframe, scenario["lines"], scenario["nodes"]))
+        components = list(nx.connected_components(reference))
+        giant = reference.subgraph(max(components, key=len))
+        assert row.error is None
+        assert row.num_components == len(components)
+        assert row.num_nodes == giant.number_of_nodes()
+        assert row.num_edges == giant.number_of_edges()
+        assert row.diameter == nx.diameter(giant)
+        assert row.mean_net_sp == pytest.approx(nx.average_shortest_path_length(giant))
+        assert row.efficiency == pytest.approx(nx.global_efficiency(reference))
+    assert "[1]" in results["error"].iloc[3]
+
+
+def test_main_writes_every_scenario(scenarios_path, tmp_path):
+    output_path = tmp_path / "collapse.parquet"
+    main([scenarios_path, "-o", str(output_path), "--data-dir", DATA_DIR, "-p", "2", "--chunk-size", "1"])
+    results = read_parquet(output_path)
+    assert len(results) == 4
+    assert results["error"].isna().tolist() == [True, True, True, False]
@@ -0,0 +1,73 @@
+import networkx as nx
+import pytest
+from pandas.testing import assert_frame_equal
+
+from tests.helpers import NETWORKS, read_network, reference_graph, without
+from toolbox.criticality import BlockCutIndex, line_impact
+from toolbox.graph import CSRGraph
+
+
+@pytest.mark.parametrize("name", NETWORKS)
+def test_line_impact_matches_networkx(name):
+    dataframe = read_network(name)
+    reference = reference_graph(dataframe)
+    giant = reference.subgraph(max(nx.connected_components(reference), key=len))
+    lines = sorted(set(dataframe["edge"].str.zfill(5)))[:4]
+    ranking = line_impact(dataframe, lines=lines, cache_dir=None).set_index("line")
+    assert sorted(ranking.index) == lines
+    baseline = nx.global_efficiency(reference)
+    for line in lines:
+        scenario = reference_graph(without(dataframe, [line]), nodes=reference.nodes)
+        largest = scenario.subgraph(max(nx.connected_components(scenario), key=len))
+        row = ranking.loc[line]
+        assert row["delta_efficiency"] == pytest.approx(nx.global_efficiency(scenario) - baseline)
+        assert row["disconnected"] == giant.number_of_nodes() - largest.number_of_nodes()
+        assert row["delta_diameter"] == nx.diameter(largest) - nx.diameter(giant)
+        assert row["delta_mean_sp"] == pytest.approx(
+            nx.average_shortest_path_length(largest) - nx.average_shortest_path_length(giant)
+        )
+
+
+def test_line_impact_is_independent_of_processes_and_cached(tmp_path):
+    dataframe = read_network("net_distrito")
+    serial = line_impact(dataframe, cache_dir=None)
+    assert serial["rank"].tolist() == list(range(1, len(serial) + 1))
+    assert serial["delta_efficiency"].is_monotonic_increasing
+    parallel = line_impact(dataframe, processes=2, chunk_size=5, cache_dir=str(tmp_path))
+    assert_frame_equal(parallel, serial)
+    assert len(list(tmp_path.iterdir())) == 1
+    assert_frame_equal(line_impact(dataframe, processes=2, chunk_size=5, cache_dir=str(tmp_path)), serial)
+
+
+@pytest.mark.parametrize("name", NETWORKS + ["net_busstop"])
+def test_block_cut_index_matches_networkx(name):
+    graph = CSRGraph.from_dataframe(read_network(name))
+    index = BlockCutIndex(graph)
+    reference = graph.to_networkx()
+    ids = graph.node_ids.tolist()
+    assert {ids[node] for node in index.articulation.nonzero()[0]} == set(nx.articulation_points(reference))
+    bridges = {
+        frozenset((ids[graph.edge_src[edge]], ids[graph.edge_dst[edge]])) for edge in index.bridge.nonzero()[0]
+    }
+    assert bridges == {frozenset(edge) for edge in nx.bridges(reference)}
+    blocks = {
+        frozenset(ids[node] for edge in (index.block == block).nonzero()[0]
+                  for node in (graph.edge_src[edge], graph.edge_dst[edge]))
+        for block in range(index.num_blocks)
+    }
+    assert blocks == {frozenset(block) for block in nx.biconnected_components(reference)}
+
+
+def test_node_disconnects_matches_removing_the_node():
+    graph = CSRGraph.from_dataframe(read_network("net_busstop"))
+    index = BlockCutIndex(graph)
+    reference = graph.to_networkx()
+    for node in sorted(nx.articulation_points(reference))[:25]:
+        component = nx.node_connected_component(reference, node) - {node}
+        pieces = nx.connected_components(reference.subgraph(component))
+        assert index.node_disconnects(node) == len(component) - max(map(len, pieces))
+    leaf = next(node for node, degree in reference.degree if degree == 1)
+    assert index.node_disconnects(leaf) == 0
+    assert index.is_bridge(leaf, next(iter(reference[leaf])))
+    with pytest.raises(KeyError):
+        index.is_bridge(leaf, leaf)
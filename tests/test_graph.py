@@ -0,0 +1,33 @@
+import pytest
+from pandas import concat
+
+from tests.helpers import NETWORKS, read_network, reference_graph
+from toolbox.graph import CSRGraph
+
+
+@pytest.mark.parametrize("name", NETWORKS)
+def test_from_dataframe_matches_networkx(name):
+    dataframe = read_network(name)
+    graph = CSRGraph.from_dataframe(dataframe)
+    reference = reference_graph(dataframe)
+    ids = graph.node_ids.tolist()
+    assert set(ids) == set(reference.nodes)
+    edges = {
+        frozenset((ids[src], ids[dst])): weight
+        for src, dst, weight in zip(graph.edge_src.tolist(), graph.edge_dst.tolist(), graph.weight.tolist())
+    }
+    assert edges == {frozenset((u, v)): weight for u, v, weight in reference.edges(data="weight")}
+
+
+def test_duplicated_rows_keep_their_direction():
+    dataframe = read_network("net_distrito").head(3).copy()
+    reverse = dataframe.iloc[[0]].rename(columns={
+        "from_node": "to_node", "to_node": "from_node", "from_lat": "to_lat", "to_lat": "from_lat",
+        "from_lon": "to_lon", "to_lon": "from_lon",
+    })
+    reverse["weight"] = 9.0
+    dataframe = concat([dataframe, reverse, dataframe.iloc[[0]]], ignore_index=True)
+    graph = CSRGraph.from_dataframe(dataframe)
+    reference = reference_graph(dataframe)
+    u, v = graph.node_ids[graph.edge_src[0]], graph.node_ids[graph.edge_dst[0]]
+    assert graph.weight[0] == reference.edges[u, v]["weight"] == 9.0
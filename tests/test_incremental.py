@@ -0,0 +1,55 @@
+import networkx as nx
+import pytest
+from numpy.testing import assert_allclose
+
+from tests.helpers import NETWORKS, read_network, reference_graph, without
+from toolbox.incremental import CollapseEngine
+
+
+@pytest.mark.parametrize("name", NETWORKS)
+@pytest.mark.parametrize("precompute", [True, False])
+def test_scenario_matches_the_rebuilt_graph(name, precompute):
+    dataframe = read_network(name)
+    engine = CollapseEngine(dataframe, precompute=precompute)
+    lines = engine.lines[::7]
+    scenario = engine.copy().remove_lines(lines)
+    node = sorted(scenario.components()[0], key=str)[0]
+    scenario.remove_nodes([node])
+    reference = reference_graph(without(dataframe, lines, [node]))
+
+    components = [set(component) for component in nx.connected_components(reference)]
+    assert sorted(map(sorted, scenario.components())) == sorted(map(sorted, components))
+    giant = reference.subgraph(max(components, key=len))
+    statistics = scenario.statistics(nodes=giant.nodes, betweenness=True)
+    assert statistics["num_nodes"] == giant.number_of_nodes()
+    assert statistics["num_edges"] == giant.number_of_edges()
+    assert statistics["diameter"] == nx.diameter(giant)
+    assert statistics["mean_net_sp"] == pytest.approx(nx.average_shortest_path_length(giant))
+    for metric, expected in [
+            ("closeness_centrality", nx.closeness_centrality(giant)),
+            ("betweeness_centrality", nx.betweenness_centrality(giant)),
+            ]:
+        assert_allclose([statistics[metric][node] for node in giant], [expected[node] for node in giant])
+
+
+def test_stacked_removals_match_the_rebuilt_graph():
+    dataframe = read_network("net_cp")
+    scenario = CollapseEngine(dataframe).copy()
+    lines = []
+    for start in range(0, 60, 20):
+        lines += scenario.lines[start:start + 20:3]
+        scenario.remove_lines(lines)
+        reference = reference_graph(without(dataframe, lines))
+        giant = reference.subgraph(max(nx.connected_components(reference), key=len))
+        statistics = scenario.statistics(nodes=giant.nodes)
+        assert statistics["diameter"] == nx.diameter(giant)
+        assert statistics["mean_net_sp"] == pytest.approx(nx.average_shortest_path_length(giant))
+
+
+def test_statistics_of_a_disconnected_scenario_raise():
+    engine = CollapseEngine(read_network("net_distrito"))
+    scenario = engine.copy().remove_lines(engine.lines[:200])
+    assert len(scenario.components()) > 1
+    with pytest.raises(nx.NetworkXError):
+        scenario.statistics()
+    assert engine.statistics()["diameter"] == 4
@@ -0,0 +1,69 @@
+import networkx as nx
+import pytest
+from numpy import isnan
+from numpy.testing import assert_allclose
+
+from tests.helpers import NETWORKS, read_network, reference_graph, without
+from toolbox.graph import CSRGraph
+from toolbox.metrics import bfs_sweep, efficiency_sweep
+
+
+@pytest.mark.parametrize("name", NETWORKS)
+def test_bfs_sweep_matches_networkx(name):
+    graph = CSRGraph.from_dataframe(read_network(name))
+    reference = graph.to_networkx()
+    ids = graph.node_ids.tolist()
+    sweep = bfs_sweep(graph)
+    lengths = dict(nx.all_pairs_shortest_path_length(reference))
+    assert sweep["eccentricity"].tolist() == [max(lengths[node].values()) for node in ids]
+    assert_allclose(sweep["mean_sp"], [sum(lengths[node].values()) / (len(lengths[node]) - 1) for node in ids])
+    closeness = nx.closeness_centrality(reference)
+    assert_allclose(sweep["closeness"], [closeness[node] for node in ids])
+    betweenness = nx.betweenness_centrality(reference)
+    assert_allclose(sweep["betweenness"], [betweenness[node] for node in ids], atol=1e-12)
+
+
+def assert_efficiency_matches_networkx(reference, sweep, ids):
+    """Compare an `efficiency_sweep` with the pair lengths of `reference`, connected or not."""
+    num_nodes = reference.number_of_nodes()
+    lengths = dict(nx.all_pairs_shortest_path_length(reference))
+    assert sweep["reachable"].tolist() == [len(lengths[node]) for node in ids]
+    efficiency = [sum(1 / length for length in lengths[node].values() if length) / (num_nodes - 1) for node in ids]
+    assert_allclose(sweep["efficiency"], efficiency)
+    reached = sum(len(lengths[node]) - 1 for node in ids)
+    assert sweep["reachability"] == pytest.approx(reached / (num_nodes * (num_nodes - 1)))
+    for node, mean_sp in zip(ids, sweep["mean_sp"].tolist()):
+        if len(lengths[node]) == 1:
+            assert isnan(mean_sp)
+        else:
+            assert mean_sp == pytest.approx(sum(lengths[node].values()) / (len(lengths[node]) - 1))
+
+
+@pytest.mark.parametrize("name", NETWORKS)
+def test_efficiency_sweep_matches_networkx(name):
+    graph = CSRGraph.from_dataframe(read_network(name))
+    reference = graph.to_networkx()
+    sweep = efficiency_sweep(graph)
+    assert sweep["global_efficiency"] == pytest.approx(nx.global_efficiency(reference))
+    assert_efficiency_matches_networkx(reference, sweep, graph.node_ids.tolist())
+
+
+def test_efficiency_sweep_on_a_split_network():
+    dataframe = read_network("net_cp")
+    lines = sorted(set(dataframe["edge"].str.zfill(5)))[::3]
+    reference = reference_graph(without(dataframe, lines), nodes=reference_graph(dataframe).nodes)
+    reference.add_node(-1)
+    assert nx.number_connected_components(reference) > 2
+    graph = CSRGraph.from_networkx(reference)
+    sweep = efficiency_sweep(graph, batch_size=64, processes=2)
+    assert sweep["global_efficiency"] == pytest.approx(nx.global_efficiency(reference))
+    assert sweep["reachability"] < 1
+    assert_efficiency_matches_networkx(reference, sweep, graph.node_ids.tolist())
+
+
+def test_efficiency_sweep_follows_the_arcs_of_directed_graphs():
+    reference = nx.DiGraph([(1, 2), (2, 3), (3, 1), (3, 4), (5, 4)])
+    sweep = efficiency_sweep(CSRGraph.from_networkx(reference))
+    assert sweep["reachable"].tolist() == [4, 4, 4, 1, 2]
+    assert sweep["global_efficiency"] == pytest.approx(sweep["efficiency"].mean())
+    assert_efficiency_matches_networkx(reference, sweep, [1, 2, 3, 4, 5])
@@ -0,0 +1,42 @@
+from filecmp import cmp
+from os import path
+
+import pytest
+from numpy import array_equal
+
+from tests.helpers import DATA_DIR, read_network
+from toolbox.graph import CSRGraph
+from toolbox.pipeline import build_networks, main
+from toolbox.snapshot import GraphSnapshot
+
+
+@pytest.fixture(scope="module")
+def built():
+    return build_networks(DATA_DIR)
+
+
+def test_report_covers_every_stage(built):
+    networks, report = built
+    assert report["stage"].tolist() == [
+        "read_stops", "area_centroids", "read_segments", "join_segments", "net_busstop", "net_cp", "net_distrito",
+    ]
+    assert report.set_index("stage").loc[[f"net_{name}" for name in networks], "rows"].tolist() == [
+        len(network) for network in networks.values()
+    ]
+
+
+def test_main_writes_the_shipped_networks(tmp_path):
+    main(["--data-dir", DATA_DIR, "-o", str(tmp_path)])
+    for name in ("busstop", "cp", "distrito"):
+        assert cmp(tmp_path / f"net_{name}.csv", path.join(DATA_DIR, f"net_{name}.csv"), shallow=False), name
+        snapshot = GraphSnapshot.load(str(tmp_path / f"net_{name}.graph"))
+        graph = CSRGraph.from_dataframe(read_network(f"net_{name}"))
+        for attribute in ("node_ids", "edge_src", "edge_dst", "weight"):
+            assert array_equal(getattr(snapshot.graph, attribute), getattr(graph, attribute)), (name, attribute)
+
+
+def test_main_can_skip_the_snapshots(tmp_path):
+    main(["--data-dir", DATA_DIR, "-o", str(tmp_path / "networks"), "--no-snapshots"])
+    assert sorted(file.name for file in (tmp_path / "networks").iterdir()) == [
+        "net_busstop.csv", "net_cp.csv", "net_distrito.csv",
+    ]
@@ -0,0 +1,78 @@
+import networkx as nx
+import pytest
+from pandas.testing import assert_frame_equal
+
+from tests.helpers import NETWORKS, read_network, reference_graph
+from toolbox.planner import propose_lines
+
+
+def with_line(network, stops):
+    """Copy of `network` with a segment between every pair of consecutive `stops`."""
+    network = network.copy()
+    network.add_edges_from(zip(stops, stops[1:]))
+    return network
+
+
+def source_scores(network, sources):
+    """Efficiency and mean hop distance of the pairs leaving `sources`, as `propose_lines` scores them."""
+    inverse, total, pairs = 0.0, 0, 0
+    for source in sources:
+        lengths = nx.single_source_shortest_path_length(network, source)
+        inverse += sum(1 / length for length in lengths.values() if length)
+        total += sum(lengths.values())
+        pairs += len(lengths) - 1
+    return inverse / (len(sources) * (network.number_of_nodes() - 1)), total / pairs
+
+
+@pytest.mark.parametrize("name", NETWORKS)
+@pytest.mark.parametrize("objective", ["efficiency", "mean_sp"])
+def test_proposals_match_networkx(name, objective):
+    dataframe = read_network(name)
+    reference = reference_graph(dataframe)
+    proposals = propose_lines(dataframe, num_stops=4, objective=objective, beam_width=6, top=3)
+    assert proposals["rank"].tolist() == [1, 2, 3]
+    scores = proposals[objective].tolist()
+    assert scores == sorted(scores, reverse=objective == "efficiency")
+    for row in proposals.itertuples():
+        assert len(row.stops) == len(set(row.stops)) == 4
+        assert not any(reference.has_edge(u, v) for u, v in zip(row.stops, row.stops[1:]))
+        network = with_line(reference, row.stops)
+        assert row.efficiency == pytest.approx(nx.global_efficiency(network))
+        assert row.delta_efficiency == pytest.approx(nx.global_efficiency(network) - nx.global_efficiency(reference))
+        assert row.mean_sp == pytest.approx(nx.average_shortest_path_length(network))
+        assert row.delta_mean_sp == pytest.approx(
+            nx.average_shortest_path_length(network) - nx.average_shortest_path_length(reference)
+        )
+
+
+def test_proposals_for_sources_match_networkx():
+    dataframe = read_network("net_cp")
+    reference = reference_graph(dataframe)
+    sources = sorted(reference.nodes)[:6]
+    proposals = propose_lines(dataframe, num_stops=3, sources=sources, beam_width=4, top=4)
+    efficiency, mean_sp = source_scores(reference, sources)
+    for row in proposals.itertuples():
+        expected = source_scores(with_line(reference, row.stops), sources)
+        assert (row.efficiency, row.mean_sp) == pytest.approx(expected)
+        assert (row.delta_efficiency, row.delta_mean_sp) == pytest.approx(
+            (expected[0] - efficiency, expected[1] - mean_sp)
+        )
+
+
+def test_proposals_are_independent_of_processes():
+    dataframe = read_network("net_cp")
+    serial = propose_lines(dataframe, num_stops=3, beam_width=4, top=4)
+    parallel = propose_lines(dataframe, num_stops=3, beam_width=4, top=4, processes=2, chunk_size=3)
+    assert_frame_equal(parallel, serial)
+
+
+def test_propose_lines_rejects_invalid_parameters():
+    dataframe = read_network("net_distrito")
+    with pytest.raises(ValueError, match="objective"):
+        propose_lines(dataframe, objective="diameter")
+    with pytest.raises(ValueError, match="num_stops"):
+        propose_lines(dataframe, num_stops=1)
+    with pytest.raises(ValueError, match="beam_width"):
+        propose_lines(dataframe, beam_width=2, top=3)
+    with pytest.raises(KeyError):
+        propose_lines(dataframe, sources=[-1])
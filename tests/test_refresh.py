@@ -0,0 +1,45 @@
+from filecmp import cmp
+from shutil import copy, copytree
+
+import pytest
+from pandas import read_csv
+
+from tests.helpers import DATA_DIR
+from toolbox.refresh import MANIFEST_NAME, REPORT_COLUMNS, refresh
+
+OUTPUTS = ["emt-data-clean.csv", "emt-linea-data-clean.csv", "net_busstop.csv", "net_cp.csv", "net_distrito.csv"]
+
+
+@pytest.fixture
+def exports(tmp_path):
+    """Copies of the data folder, refreshed once, with a stop and an itinerary changed in the exports."""
+    incremental, full = tmp_path / "incremental", tmp_path / "full"
+    copytree(DATA_DIR, incremental)
+    refresh(str(incremental))
+
+    stops = read_csv(incremental / "emt-data.csv", dtype=str, keep_default_na=False)
+    stops.loc[5, "NOMBREVIA"] = "Nueva"
+    stops.drop(index=10).to_csv(incremental / "emt-data.csv", index=False)
+    segments = read_csv(incremental / "emt-linea-data.csv", dtype=str, keep_default_na=False)
+    line = segments.index[(segments["NUMEROLINEAUSUARIO"] == "27") & (segments["SENTIDO"] == "1")]
+    segments.drop(index=line[3]).to_csv(incremental / "emt-linea-data.csv", index=False)
+    copytree(DATA_DIR, full)
+    for name in ("emt-data.csv", "emt-linea-data.csv"):
+        copy(incremental / name, full / name)
+    return incremental, full
+
+
+def test_refresh_matches_a_full_rebuild(exports):
+    incremental, full = exports
+    report = refresh(str(incremental), chunk_size=700)
+    assert report.columns.tolist() == REPORT_COLUMNS
+    changes = set(zip(report["kind"], report["change"]))
+    assert changes == {
+        ("stop", "modified"), ("stop", "removed"), ("itinerary", "modified"), ("table", "updated"),
+        ("network", "modified"),
+    }
+    refresh(str(full), force=True)
+    for name in OUTPUTS:
+        assert cmp(incremental / name, full / name, shallow=False), name
+    assert (incremental / MANIFEST_NAME).exists()
+    assert not len(refresh(str(incremental)))
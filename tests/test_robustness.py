@@ -0,0 +1,153 @@
+import networkx as nx
+import pytest
+from numpy import zeros
+from numpy.random import default_rng
+from numpy.testing import assert_allclose
+from pandas.testing import assert_frame_equal
+
+from tests.helpers import read_network, reference_graph
+from toolbox.graph import CSRGraph
+from toolbox.robustness import AttackEngine, CascadeEngine, percolation
+
+
+@pytest.fixture(scope="module")
+def graph():
+    return CSRGraph.from_dataframe(read_network("net_distrito"))
+
+
+def monte_carlo(network: nx.Graph, mode: str, trials: int, seed: int):
+    """Mean fraction of nodes in the largest component after every failure, one networkx graph per step."""
+    rng = default_rng(seed)
+    elements = list(network.nodes) if mode == "node" else list(network.edges)
+    giant = zeros(len(elements) + 1)
+    for _ in range(trials):
+        order = rng.permutation(len(elements))
+        remaining = network.copy()
+        for step in range(len(elements) + 1):
+            sizes = [len(component) for component in nx.connected_components(remaining)]
+            giant[step] += max(sizes, default=0) / network.number_of_nodes()
+            if step < len(elements):
+                element = elements[order[step]]
+                if mode == "node":
+                    remaining.remove_node(element)
+                else:
+                    remaining.remove_edge(*element)
+    return giant / trials
+
+
+@pytest.mark.parametrize("mode", ["node", "edge"])
+def test_percolation_matches_a_networkx_monte_carlo(graph, mode):
+    curve = percolation(graph, mode=mode, trials=2000, seed=1)
+    expected = monte_carlo(graph.to_networkx(), mode, trials=400, seed=2)
+    assert len(curve["giant"]) == len(expected)
+    assert_allclose(curve["giant"], expected, atol=0.04)
+    assert curve["giant"][0] == 1.0
+    assert curve["giant"][-1] == pytest.approx(0.0 if mode == "node" else 1 / graph.number_of_nodes())
+    assert (curve["giant_lower"] <= curve["giant"]).all() and (curve["giant"] <= curve["giant_upper"]).all()
+    assert (curve["band_lower"] <= curve["band_upper"]).all()
+
+
+def test_percolation_does_not_depend_on_processes(graph):
+    serial = percolation(graph, trials=300, batch_size=64)
+    parallel = percolation(graph, trials=300, batch_size=64, processes=2)
+    for key, values in serial.items():
+        assert_allclose(parallel[key], values)
+
+
+def test_percolation_rejects_invalid_parameters(graph):
+    with pytest.raises(ValueError, match="mode=stop"):
+        percolation(graph, mode="stop")
+    with pytest.raises(ValueError, match="trials=0"):
+        percolation(graph, trials=0)
+
+
+@pytest.mark.parametrize("strategy", ["betweenness", "degree"])
+def test_resumed_attack_matches_an_uninterrupted_run(tmp_path, strategy):
+    dataframe = read_network("net_cp")
+    options = {"strategy": strategy, "recompute_every": 2, "measure_every": 3}
+    expected = AttackEngine(dataframe, **options).run(steps=15)
+    checkpoint_path = str(tmp_path / "attack.json")
+    AttackEngine(dataframe, **options).run(steps=7, checkpoint_path=checkpoint_path, checkpoint_every=3)
+    resumed = AttackEngine.resume(checkpoint_path, dataframe).run(steps=15)
+    columns = [column for column in expected.columns if column != "seconds"]
+    assert_frame_equal(resumed[columns], expected[columns])
+
+
+def test_attack_removes_the_most_central_node_first():
+    dataframe = read_network("net_cp")
+    curve = AttackEngine(dataframe, efficiency=False).run(steps=1)
+    betweenness = nx.betweenness_centrality(reference_graph(dataframe))
+    assert curve["node"].iloc[1] == max(betweenness, key=betweenness.get)
+    assert curve["score"].iloc[1] == pytest.approx(max(betweenness.values()))
+
+
+def test_resume_rejects_another_graph(tmp_path):
+    checkpoint_path = str(tmp_path / "attack.json")
+    AttackEngine(read_network("net_distrito"), strategy="degree").run(steps=2, checkpoint_path=checkpoint_path)
+    with pytest.raises(ValueError, match="another graph"):
+        AttackEngine.resume(checkpoint_path, read_network("net_cp"))
+
+
+def reference_cascade(network, initial, alpha):
+    """Motter-Lai cascade recomputing every load with networkx, one set of failures per round."""
+    capacity = {
+        node: (1 + alpha) * load for node, load in nx.betweenness_centrality(network, normalized=False).items()
+    }
+    network = network.copy()
+    network.remove_nodes_from(initial)
+    rounds = []
+    while True:
+        load = nx.betweenness_centrality(network, normalized=False)
+        overloaded = {node for node in network if load[node] > capacity[node] * (1 + 1e-9) + 1e-9}
+        if not overloaded:
+            break
+        rounds.append(overloaded)
+        network.remove_nodes_from(overloaded)
+    sizes = [len(component) for component in nx.connected_components(network)]
+    return rounds, max(sizes, default=0)
+
+
+@pytest.fixture(scope="module")
+def cascade_network():
+    return reference_graph(read_network("net_distrito"))
+
+
+@pytest.fixture(scope="module")
+def cascade_engine(cascade_network):
+    return CascadeEngine(CSRGraph.from_networkx(cascade_network))
+
+
+@pytest.mark.parametrize("alpha", [0.0, 0.1, 0.3, 1.0])
+@pytest.mark.parametrize("initial", [[1], [2, 3], [21]])
+def test_cascade_matches_networkx(cascade_network, cascade_engine, initial, alpha):
+    cascade = cascade_engine.run(initial, alpha)
+    rounds, giant = reference_cascade(cascade_network, initial, alpha)
+    ends = [sum(cascade["round_failures"][:position]) for position in range(len(rounds) + 1)]
+    assert [set(cascade["failed"][start:end]) for start, end in zip(ends, ends[1:])] == rounds
+    assert cascade["rounds"] == len(rounds) and len(cascade["failed"]) == ends[-1]
+    assert cascade["initial"] == len(initial)
+    assert cascade["giant_fraction"] == pytest.approx(giant / cascade_network.number_of_nodes())
+
+
+def test_cascade_sweep_reuses_and_clears_states(cascade_engine):
+    initial_sets = {"hub": [1], "pair": [2, 3]}
+    alphas = [1.0, 0.0, 0.5]
+    expected = cascade_engine.sweep(initial_sets, alphas)
+    assert expected[["name", "alpha"]].values.tolist() == [
+        [name, alpha] for name in initial_sets for alpha in sorted(alphas)
+    ]
+    cascade_engine.clear()
+    assert list(cascade_engine._states) == [frozenset()]
+    assert_frame_equal(cascade_engine.sweep(initial_sets, alphas), expected)
+    for row in expected.itertuples():
+        cascade = cascade_engine.run(initial_sets[row.name], row.alpha)
+        assert (row.failed, row.rounds, row.giant_fraction) == (
+            len(cascade["failed"]), cascade["rounds"], cascade["giant_fraction"]
+        )
+
+
+def test_cascade_rejects_invalid_parameters(cascade_engine):
+    with pytest.raises(ValueError, match="alpha"):
+        cascade_engine.run([1], alpha=-0.1)
+    with pytest.raises(KeyError):
+        cascade_engine.run([-1], alpha=0.1)
@@ -0,0 +1,71 @@
+from os import path, utime
+from shutil import copy
+
+import pytest
+from numpy import array_equal
+
+from tests.helpers import DATA_DIR, NETWORKS, read_network
+from toolbox.snapshot import GraphSnapshot, load_network
+
+GRAPH_ARRAYS = ("node_ids", "edge_src", "edge_dst", "weight", "pos", "indptr", "indices", "arc_edge")
+
+
+@pytest.mark.parametrize("name", NETWORKS)
+def test_snapshot_round_trip(tmp_path, name):
+    snapshot = GraphSnapshot.from_dataframe(read_network(name))
+    snapshot_path = str(tmp_path / f"{name}.graph")
+    checksum = snapshot.save(snapshot_path)
+    loaded = GraphSnapshot.load(snapshot_path)
+    assert (loaded.checksum, loaded.path) == (checksum, snapshot_path)
+    for attribute in GRAPH_ARRAYS:
+        assert array_equal(getattr(loaded.graph, attribute), getattr(snapshot.graph, attribute)), attribute
+    for attribute in ("n_buses", "lines", "line_ptr", "line_ids"):
+        assert array_equal(getattr(loaded, attribute), getattr(snapshot, attribute)), attribute
+    assert not loaded.graph.indices.flags.writeable
+
+
+def test_snapshot_lines_match_the_table():
+    dataframe = read_network("net_cp")
+    snapshot = GraphSnapshot.from_dataframe(dataframe)
+    graph = snapshot.graph
+    ids = graph.node_ids.tolist()
+    served = {}
+    for line, edges in snapshot.line_edges().items():
+        for edge in edges.tolist():
+            served.setdefault(frozenset((ids[graph.edge_src[edge]], ids[graph.edge_dst[edge]])), set()).add(line)
+    expected = {}
+    for row in dataframe.itertuples():
+        expected.setdefault(frozenset((row.from_node, row.to_node)), set()).add(row.edge.zfill(5))
+    assert served == expected
+    assert snapshot.line_count().tolist() == [
+        len(expected[frozenset((ids[src], ids[dst]))])
+        for src, dst in zip(graph.edge_src.tolist(), graph.edge_dst.tolist())
+    ]
+
+
+def test_corrupted_snapshots_raise(tmp_path):
+    snapshot_path = str(tmp_path / "net_cp.graph")
+    GraphSnapshot.from_dataframe(read_network("net_cp")).save(snapshot_path)
+    with open(snapshot_path, "r+b") as file:
+        file.seek(-1, 2)
+        last = file.read(1)
+        file.seek(-1, 2)
+        file.write(bytes([last[0] ^ 0xFF]))
+    with pytest.raises(ValueError, match="checksum"):
+        GraphSnapshot.load(snapshot_path)
+    assert GraphSnapshot.load(snapshot_path, verify=False).graph.number_of_nodes() > 0
+    not_a_snapshot = str(tmp_path / "net_cp.csv")
+    copy(path.join(DATA_DIR, "net_cp.csv"), not_a_snapshot)
+    with pytest.raises(ValueError, match="not a graph snapshot"):
+        GraphSnapshot.load(not_a_snapshot)
+
+
+def test_load_network_ignores_stale_snapshots(tmp_path):
+    copy(path.join(DATA_DIR, "net_distrito.csv"), tmp_path)
+    assert load_network("net_distrito", data_dir=str(tmp_path)).path is None
+    snapshot_path = str(tmp_path / "net_distrito.graph")
+    GraphSnapshot.from_dataframe(read_network("net_distrito")).save(snapshot_path)
+    assert load_network("net_distrito", data_dir=str(tmp_path)).path == snapshot_path
+    csv_time = path.getmtime(snapshot_path) + 10
+    utime(tmp_path / "net_distrito.csv", (csv_time, csv_time))
+    assert load_network("net_distrito", data_dir=str(tmp_path)).path is None
@@ -0,0 +1,42 @@
+from unittest import mock
+
+import networkx as nx
+import pytest
+
+import toolbox.stats
+from tests.helpers import read_network
+from toolbox.graph import CSRGraph
+from toolbox.stats import GraphStats
+
+
+@pytest.fixture
+def sweeps():
+    with mock.patch.object(toolbox.stats, "bfs_sweep", wraps=toolbox.stats.bfs_sweep) as bfs_sweep:
+        yield bfs_sweep
+
+
+@pytest.fixture(scope="module")
+def graph():
+    return CSRGraph.from_dataframe(read_network("net_distrito"))
+
+
+def test_path_metrics_share_one_sweep(graph, sweeps):
+    statistics = GraphStats(graph).compute(["mean_net_sp", "diameter", "betweeness_centrality", "sp"])
+    statistics["closeness_centrality"]
+    assert sweeps.call_count == 1
+    assert sweeps.call_args.kwargs["betweenness"] and sweeps.call_args.kwargs["keep_distances"]
+    reference = graph.to_networkx()
+    assert statistics["diameter"] == nx.diameter(reference)
+    assert statistics["mean_net_sp"] == pytest.approx(nx.average_shortest_path_length(reference))
+
+
+def test_reading_betweenness_later_costs_a_second_sweep(graph, sweeps):
+    statistics = GraphStats(graph)
+    statistics["diameter"]
+    assert sweeps.call_count == 1 and not sweeps.call_args.kwargs["betweenness"]
+    betweenness = statistics["betweeness_centrality"]
+    assert sweeps.call_count == 2 and sweeps.call_args.kwargs["betweenness"]
+    statistics["sp"]
+    assert sweeps.call_count == 3
+    expected = nx.betweenness_centrality(graph.to_networkx())
+    assert betweenness == pytest.approx(expected)
@@ -0,0 +1,48 @@
+from os import path, utime
+from shutil import copy
+
+import pytest
+from pandas.testing import assert_frame_equal
+
+from tests.helpers import DATA_DIR
+from toolbox.storage import TABLE_DTYPES, convert_tables, load_table
+
+NAMES = ["net_cp", "emt-linea-data-clean", "stops_toA"]
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    for name in NAMES:
+        copy(path.join(DATA_DIR, f"{name}.csv"), tmp_path)
+    return tmp_path
+
+
+@pytest.mark.parametrize("extension", [".parquet", ".feather"])
+def test_columnar_copies_load_the_same_frame(data_dir, extension):
+    expected = {name: load_table(name, data_dir=str(data_dir)) for name in NAMES}
+    paths = convert_tables(data_dir=str(data_dir), extension=extension)
+    assert sorted(paths) == sorted(str(data_dir / f"{name}{extension}") for name in NAMES)
+    for name in NAMES:
+        loaded = load_table(name, data_dir=str(data_dir))
+        assert_frame_equal(loaded, expected[name])
+        for column, dtype in TABLE_DTYPES[name].items():
+            if column in loaded:
+                assert loaded[column].dtype == dtype, (name, column)
+    columns = ["from_node", "weight"]
+    assert_frame_equal(load_table("net_cp", data_dir=str(data_dir), columns=columns), expected["net_cp"][columns])
+
+
+def test_stale_columnar_copies_are_ignored(data_dir):
+    convert_tables(data_dir=str(data_dir), names=["net_cp"])
+    table = load_table("net_cp", data_dir=str(data_dir))
+    table.iloc[:5].to_csv(data_dir / "net_cp.csv", index=False)
+    parquet_time = path.getmtime(data_dir / "net_cp.parquet")
+    utime(data_dir / "net_cp.csv", (parquet_time + 10, parquet_time + 10))
+    assert len(load_table("net_cp", data_dir=str(data_dir))) == 5
+
+
+def test_invalid_tables_raise(data_dir):
+    with pytest.raises(ValueError, match="extension"):
+        convert_tables(data_dir=str(data_dir), extension=".csv")
+    with pytest.raises(FileNotFoundError):
+        load_table("net_busstop", data_dir=str(data_dir))
@@ -0,0 +1,393 @@
+from collections import OrderedDict
+from hashlib import sha256
+from json import dumps, loads
+from os import getpid, listdir, makedirs, path, replace, utime
+from shutil import rmtree
+from sys import getsizeof
+from threading import Lock
+from typing import Any, Dict, FrozenSet, Hashable, Iterable, List, Optional, Tuple
+
+from loguru import logger
+from numpy import asarray, load, ndarray, save, savez
+
+from toolbox.graph import CSRGraph
+from toolbox.metrics import DistanceMatrix
+
+TOOLBOX_VERSION = "0.1.0"
+VERSIONED_MODULES = ("graph.py", "metrics.py", "stats.py")
+
+
+def toolbox_version() -> str:
+    """
+    Version tag of the code producing the statistics.
+
+    It combines `TOOLBOX_VERSION` with a digest of the modules computing the
+    metrics, so cached results are invalidated whenever that code changes.
+    """
+    digest = sha256(TOOLBOX_VERSION.encode())
+    for module in VERSIONED_MODULES:
+        with open(path.join(path.dirname(__file__), module), "rb") as file:
+            digest.update(file.read())
+    return f"{TOOLBOX_VERSION}+{digest.hexdigest()[:12]}"
+
+
+class StatsCache:
+    """
+    Content-addressed on-disk cache of graph statistics.
+
+    Every entry is a directory named after the key of the statistics: a hash of
+    the graph fingerprint, the computation parameters and the toolbox version.
+    It holds `values.npz` with the arrays, `meta.json` with the scalars and how to
+    rebuild every metric, and `sp.npy` with the distance matrix when it was
+    computed, which is memory-mapped on load.
+
+    Parameters
+    ----------
+    directory : str, optional
+        Root folder of the cache. Default is '.cache/stats'.
+    max_bytes : int, optional
+        Size budget of the cache. Least recently used entries are evicted when
+        it is exceeded. Default is 1 GB.
+
+    Examples
+    --------
+    >>> import networkx as nx
+    >>> from tempfile import mkdtemp
+    >>> from toolbox.stats import GraphStats
+    >>> cache = StatsCache(directory=mkdtemp())
+    >>> GraphStats(nx.path_graph(5), cache=cache)["diameter"]
+    4
+    >>> GraphStats(nx.path_graph(5), cache=cache)["diameter"]
+    4
+    >>> cache.counters()
+    {'hits': 1, 'misses': 1, 'stores': 1, 'evictions': 0}
+
+    Notes
+    -----
+    - A hit refreshes the modification time of the entry, which is what the LRU
+      eviction looks at. Entries are written file by file with atomic renames,
+      so several processes can share the same directory.
+    """
+
+    def __init__(self, directory: str=".cache/stats", max_bytes: int=1 << 30) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self._version = toolbox_version()
+
+    def key(self, graph: CSRGraph, params: Dict[str, Any]) -> str:
+        """Cache key of the statistics of `graph` computed with `params`."""
+        digest = sha256(graph.fingerprint().encode())
+        digest.update(self._version.encode())
+        digest.update(dumps(params, sort_keys=True).encode())
+        return digest.hexdigest()
+
+    def counters(self) -> Dict[str, int]:
+        """Hits, misses, stores and evictions since the cache was created."""
+        return {"hits": self.hits, "misses": self.misses, "stores": self.stores, "evictions": self.evictions}
+
+    def load(self, key: str, nodes: List[Any]) -> Dict[str, Any]:
+        """
+        Read the metrics stored under `key`.
+
+        Parameters
+        ----------
+        key : str
+            Cache key, as returned by `key`.
+        nodes : List
+            Node ids of the graph, in position order.
+
+        Returns
+        -------
+        Dict[str, Any]
+            Metrics of the entry, empty when there is none.
+        """
+        entry = path.join(self.directory, key)
+        try:
+            with open(path.join(entry, "meta.json"), "r") as file:
+                meta = loads(file.read())
+            with load(path.join(entry, "values.npz")) as arrays:
+                arrays = dict(arrays)
+            matrices = {
+                metric: DistanceMatrix.load(path.join(entry, "sp.npy"))
+                for metric, kind in meta["kinds"].items() if kind == "matrix"
+            }
+        except (OSError, ValueError) as err:
+            if path.isdir(entry):
+                logger.warning(f"Discarding unreadable cache entry {key}: {err}")
+            self.misses += 1
+            return {}
+        values = {}
+        for metric, kind in meta["kinds"].items():
+            if kind == "scalar":
+                values[metric] = meta["scalars"][metric]
+            elif kind == "mapping":
+                values[metric] = dict(meta["scalars"][metric])
+            elif kind == "tuple":
+                values[metric] = tuple(meta["scalars"][metric])
+            elif kind == "list":
+                values[metric] = arrays[metric].tolist()
+            elif kind == "nodes":
+                values[metric] = dict(zip(nodes, arrays[metric].tolist()))
+            elif kind == "positions":
+                values[metric] = [nodes[position] for position in arrays[metric].tolist()]
+            elif kind == "matrix":
+                values[metric] = matrices[metric]
+        utime(entry)
+        self.hits += 1
+        return values
+
+    def store(self, key: str, values: Dict[str, Any], nodes: List[Any]) -> None:
+        """
+        Write the metrics under `key`, replacing the previous entry files.
+
+        Parameters
+        ----------
+        key : str
+            Cache key, as returned by `key`.
+        values : Dict[str, Any]
+            Computed metrics, as held by `GraphStats`.
+        nodes : List
+            Node ids of the graph, in position order.
+        """
+        entry = path.join(self.directory, key)
+        kinds, scalars, arrays = {}, {}, {}
+        position = {node: index for index, node in enumerate(nodes)}
+        for metric, value in values.items():
+            if isinstance(value, DistanceMatrix):
+                kinds[metric] = "matrix"
+            elif isinstance(value, dict) and list(value) == nodes:
+                kinds[metric], arrays[metric] = "nodes", asarray(list(value.values()))
+            elif isinstance(value, dict) and len(value) == len(nodes) and all(node in value for node in nodes):
+                kinds[metric], arrays[metric] = "nodes", asarray([value[node] for node in nodes])
+            elif isinstance(value, dict):
+                if not all(isinstance(name, str) for name in value):
+                    logger.warning(
+                        f"Metric {metric} of cache entry {key} is not stored: its keys are neither "
+                        f"the node ids nor strings, so it will be computed again on every hit."
+                    )
+                    continue
+                kinds[metric], scalars[metric] = "mapping", value
+            elif metric == "pivots":
+                kinds[metric], arrays[metric] = "positions", asarray([position[node] for node in value])
+            elif isinstance(value, list):
+                kinds[metric], arrays[metric] = "list", asarray(value)
+            elif isinstance(value, tuple):
+                kinds[metric], scalars[metric] = "tuple", list(value)
+            else:
+                kinds[metric], scalars[metric] = "scalar", value.item() if hasattr(value, "item") else value
+        makedirs(entry, exist_ok=True)
+        suffix = f".{getpid()}.tmp"
+        if "matrix" in kinds.values() and not path.exists(path.join(entry, "sp.npy")):
+            matrix = values[next(metric for metric, kind in kinds.items() if kind == "matrix")]
+            with open(path.join(entry, f"sp.npy{suffix}"), "wb") as file:
+                save(file, asarray(matrix.data))
+            replace(path.join(entry, f"sp.npy{suffix}"), path.join(entry, "sp.npy"))
+        with open(path.join(entry, f"values.npz{suffix}"), "wb") as file:
+            savez(file, **arrays)
+        with open(path.join(entry, f"meta.json{suffix}"), "w") as file:
+            file.write(dumps({"version": self._version, "kinds": kinds, "scalars": scalars}))
+        replace(path.join(entry, f"values.npz{suffix}"), path.join(entry, "values.npz"))
+        replace(path.join(entry, f"meta.json{suffix}"), path.join(entry, "meta.json"))
+        self.stores += 1
+        self.evict()
+
+    def size(self) -> int:
+        """Bytes used by every entry of the cache."""
+        return sum(size for _, _, size in self._entries())
+
+    def evict(self) -> List[str]:
+        """
+        Remove least recently used entries until the cache fits in `max_bytes`.
+
+        Returns
+        -------
+        List[str]
+            Keys of the removed entries.
+        """
+        entries = sorted(self._entries(), key=lambda entry: entry[1])
+        total = sum(size for _, _, size in entries)
+        evicted = []
+        for key, _, size in entries:
+            if total <= self.max_bytes:
+                break
+            rmtree(path.join(self.directory, key), ignore_errors=True)
+            total -= size
+            evicted.append(key)
+        self.evictions += len(evicted)
+        return evicted
+
+    def clear(self) -> None:
+        """Remove every entry of the cache."""
+        for key, _, _ in self._entries():
+            rmtree(path.join(self.directory, key), ignore_errors=True)
+
+    def _entries(self) -> List[tuple]:
+        """`(key, last use, bytes)` of every entry."""
+        if not path.isdir(self.directory):
+            return []
+        entries = []
+        for key in listdir(self.directory):
+            entry = path.join(self.directory, key)
+            if not path.isdir(entry):
+                continue
+            try:
+                size = sum(path.getsize(path.join(entry, name)) for name in listdir(entry))
+                entries.append((key, path.getmtime(entry), size))
+            except OSError:
+                continue
+        return entries
+
+
+class ScenarioCache:
+    """
+    In-memory LRU cache of collapse scenario results.
+
+    Entries are keyed by the node type, the version of its network and the sets
+    of removed lines and nodes, so toggling a line off and on again, or picking
+    the same lines in another order, finds the result already computed by any
+    session of the process.
+
+    Parameters
+    ----------
+    max_bytes : int, optional
+        Memory budget. Least recently used entries are evicted when it is
+        exceeded. Default is 256 MB.
+
+    Examples
+    --------
+    >>> cache = ScenarioCache()
+    >>> key = ScenarioCache.key("cp", ["27", "00001"], [])
+    >>> cache.get(key) is None
+    True
+    >>> cache.put(key, {"diameter": 7}, size=100)
+    >>> cache.get(ScenarioCache.key("cp", ["1", "27"], []))
+    {'diameter': 7}
+    >>> cache.counters()
+    {'hits': 1, 'misses': 1, 'stores': 1, 'evictions': 0, 'entries': 1, 'bytes': 100}
+
+    Notes
+    -----
+    - The size of an entry is estimated without serializing it, unless it is
+      given: the bytes of its arrays and buffers, `sys.getsizeof` of everything
+      else, walking dictionaries, sequences and object attributes such as the
+      arrays of a `CSRGraph`. Arrays shared by several parts of a value are
+      counted once. Entries bigger than the whole budget are not kept.
+    - Values are returned as stored, not copied, so callers must not modify them.
+    - Every operation holds a lock, so the Streamlit sessions of a process can
+      share one instance, for instance through `st.cache_resource`.
+    """
+
+    def __init__(self, max_bytes: int=256 << 20) -> None:
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[Hashable, Tuple[Any, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = Lock()
+
+    @staticmethod
+    def key(
+            option: str, lines: Iterable[str], nodes: Iterable[Hashable], version: Hashable=None
+            ) -> Tuple[str, Hashable, FrozenSet[str], FrozenSet[Hashable]]:
+        """
+        Cache key of the scenario removing `lines` and `nodes` from the `option`
+        graph, at the `version` of its network so refreshed networks miss.
+        """
+        return option, version, frozenset(str(line).zfill(5) for line in lines), frozenset(nodes)
+
+    def get(self, key: Hashable, default: Any=None) -> Any:
+        """Value stored under `key`, marking it as the most recently used, or `default`."""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key][0]
+
+    def put(self, key: Hashable, value: Any, size: Optional[int]=None) -> None:
+        """
+        Store `value` under `key` and evict what no longer fits.
+
+        Parameters
+        ----------
+        key : Hashable
+            Cache key, as returned by `key`.
+        value : Any
+            Result of the scenario.
+        size : int, optional
+            Bytes held by `value`. Default is None, which estimates them from
+            its arrays and buffers.
+        """
+        size = _estimate_size(value) if size is None else size
+        if size > self.max_bytes:
+            logger.warning(f"Scenario of {size} bytes not cached, the budget is {self.max_bytes} bytes")
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            self.stores += 1
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def counters(self) -> Dict[str, int]:
+        """Hits, misses, stores and evictions since the cache was created, and its current size."""
+        with self._lock:
+            return {
+                "hits": self.hits, "misses": self.misses, "stores": self.stores,
+                "evictions": self.evictions, "entries": len(self._entries), "bytes": self._bytes,
+            }
+
+    def hit_rate(self) -> float:
+        """Share of the lookups answered from the cache, 0 before the first lookup."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def clear(self) -> None:
+        """Remove every entry, keeping the counters."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._entries
+
+
+def _estimate_size(value: Any, seen: Optional[set]=None) -> int:
+    """Bytes held by `value`, counting the arrays and buffers it references once."""
+    seen = set() if seen is None else seen
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    if isinstance(value, ndarray):
+        # `getsizeof` already includes the data of arrays owning it.
+        if value.base is None or id(value.base) in seen:
+            return getsizeof(value)
+        seen.add(id(value.base))
+        return getsizeof(value) + value.nbytes
+    if isinstance(value, (str, bytes, bytearray, int, float, complex, bool)) or value is None:
+        return getsizeof(value)
+    if isinstance(value, dict):
+        return getsizeof(value) + sum(
+            _estimate_size(key, seen) + _estimate_size(item, seen) for key, item in value.items()
+        )
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return getsizeof(value) + sum(_estimate_size(item, seen) for item in value)
+    if hasattr(value, "__dict__"):
+        return getsizeof(value) + _estimate_size(vars(value), seen)
+    return getsizeof(value)
@@ -0,0 +1,312 @@
+from argparse import ArgumentParser
+from collections import Counter
+from contextlib import contextmanager
+from os import getpid, makedirs, path, replace
+from time import perf_counter
+from typing import IO, Iterator, List, Optional, Union
+
+from loguru import logger
+from pandas import DataFrame, concat, read_csv
+
+STOP_COLUMNS = [
+    "CODIGOESTACION", "CODIGOEMPRESA", "DENOMINACION", "LINEAS", "TIPOVIA", "PARTICULA",
+    "NOMBREVIA", "NUMEROPORTAL", "CODIGOPOSTAL", "DISTRITO",
+]
+ITINERARY_COLUMNS = ["NUMEROLINEAUSUARIO", "SENTIDO", "NUMEROORDEN", "CODIGOESTACION"]
+
+_CODE_COLUMNS = ["CODIGOESTACION", "CODIGOEMPRESA", "CODIGOPOSTAL", "DISTRITO"]
+_ITINERARY_DTYPES = {"NUMEROLINEAUSUARIO": str, "SENTIDO": "int32", "NUMEROORDEN": "int32", "CODIGOESTACION": str}
+_SEGMENT_COLUMNS = ["from_codigo_estacion", "to_codigo_estacion", "edge"]
+_CLEAN_STOP_COLUMNS = {
+    "CODIGOESTACION": "codigo_estacion",
+    "CODIGOEMPRESA": "codigo_parada",
+    "DENOMINACION": "nombre_parada",
+    "LINEAS": "linea",
+    "DIRECCION": "direccion_parada",
+    "CODIGOPOSTAL": "cp_parada",
+    "DISTRITO": "distrito_parada",
+}
+
+
+def read_raw_stops(
+        raw_path: str="data/emt-data.csv", chunk_size: Optional[int]=None
+        ) -> Union[DataFrame, Iterator[DataFrame]]:
+    """
+    Read the columns of a stops export the clean stops are made of.
+
+    Parameters
+    ----------
+    raw_path : str, optional
+        Stops export of the EMT or the CRTM. Default is 'data/emt-data.csv'.
+    chunk_size : int, optional
+        Rows per chunk. Default is None, which reads the whole file.
+
+    Returns
+    -------
+    DataFrame or Iterator[DataFrame]
+        The columns of `STOP_COLUMNS` as strings, or an iterator over chunks of
+        them when `chunk_size` is given. The codes lose their leading zeros, as
+        they did when `clean-data.ipynb` parsed them as numbers.
+    """
+    reader = read_csv(raw_path, usecols=STOP_COLUMNS, dtype=str, chunksize=chunk_size)
+    if chunk_size is None:
+        return _strip_codes(reader)
+    return map(_strip_codes, reader)
+
+
+def read_raw_itineraries(
+        raw_path: str="data/emt-linea-data.csv", chunk_size: Optional[int]=None
+        ) -> Union[DataFrame, Iterator[DataFrame]]:
+    """
+    Read the columns of an itineraries export the clean segments are made of.
+
+    Parameters
+    ----------
+    raw_path : str, optional
+        Itineraries export of the EMT or the CRTM. Default is 'data/emt-linea-data.csv'.
+    chunk_size : int, optional
+        Rows per chunk. Default is None, which reads the whole file.
+
+    Returns
+    -------
+    DataFrame or Iterator[DataFrame]
+        The columns of `ITINERARY_COLUMNS`, with the line and the station as
+        strings and the direction and the order as `int32`, or an iterator over
+        chunks of them when `chunk_size` is given.
+    """
+    reader = read_csv(raw_path, usecols=ITINERARY_COLUMNS, dtype=_ITINERARY_DTYPES, chunksize=chunk_size)
+    if chunk_size is None:
+        return _strip_codes(reader)
+    return map(_strip_codes, reader)
+
+
+def clean_stops(raw: DataFrame) -> DataFrame:
+    """
+    Build the rows of `emt-data-clean.csv` of some stops of `emt-data.csv`.
+
+    Parameters
+    ----------
+    raw : DataFrame
+        Rows returned by `read_raw_stops`.
+
+    Returns
+    -------
+    DataFrame
+        One row per stop and line, in the order of `raw`, with every column as
+        a stripped string, as the notebook `clean-data.ipynb` wrote them. Stops
+        without lines or without a complete address are dropped.
+    """
+    stops = raw[raw["LINEAS"].notna()]
+    address = (
+        stops["TIPOVIA"].str.strip() + " " + stops["PARTICULA"].fillna("").str.strip() + " "
+        + stops["NOMBREVIA"].str.strip() + " " + stops["NUMEROPORTAL"].str.strip()
+    )
+    stops = stops.assign(DIRECCION=address)[address.notna()][list(_CLEAN_STOP_COLUMNS)]
+    stops = DataFrame({column: values.astype(str).str.strip() for column, values in stops.items()})
+    stops["LINEAS"] = stops["LINEAS"].str.split(r"\s*,\s*", regex=True)
+    return stops.explode(column="LINEAS").rename(columns=_CLEAN_STOP_COLUMNS).reset_index(drop=True)
+
+
+def clean_itineraries(raw: DataFrame) -> DataFrame:
+    """
+    Build the rows of `emt-linea-data-clean.csv` of some itineraries of `emt-linea-data.csv`.
+
+    Parameters
+    ----------
+    raw : DataFrame
+        Rows returned by `read_raw_itineraries`, with every row of the
+        itineraries they belong to.
+
+    Returns
+    -------
+    DataFrame
+        The columns `from_codigo_estacion`, `to_codigo_estacion` and `edge`
+        with the consecutive stations of every itinerary, sorted by line,
+        direction and order, without repeated segments of a line.
+    """
+    frame = raw[ITINERARY_COLUMNS].sort_values(ITINERARY_COLUMNS[:-1], kind="stable")
+    line, direction, station = frame["NUMEROLINEAUSUARIO"], frame["SENTIDO"], frame["CODIGOESTACION"]
+    same = ((line == line.shift(-1)) & (direction == direction.shift(-1))).to_numpy()
+    segments = DataFrame(dict(zip(_SEGMENT_COLUMNS, (
+        station.to_numpy()[same], station.shift(-1).to_numpy()[same], line.to_numpy()[same]
+    ))))
+    return segments.drop_duplicates(keep="first").reset_index(drop=True)
+
+
+def write_clean_stops(raw_path: str, clean_path: str, chunk_size: int=50_000) -> int:
+    """
+    Clean a stops export chunk by chunk, appending every chunk to the clean table.
+
+    Parameters
+    ----------
+    raw_path : str
+        Stops export, such as `emt-data.csv`.
+    clean_path : str
+        Destination, such as `emt-data-clean.csv`, replaced once it is complete.
+    chunk_size : int, optional
+        Rows of the export held at once. Default is 50000.
+
+    Returns
+    -------
+    int
+        Rows written.
+    """
+    rows = 0
+    with _replacing(clean_path) as file:
+        DataFrame(columns=list(_CLEAN_STOP_COLUMNS.values())).to_csv(file, index=False)
+        for chunk in read_raw_stops(raw_path, chunk_size=chunk_size):
+            stops = clean_stops(chunk)
+            stops.to_csv(file, header=False, index=False)
+            rows += len(stops)
+    return rows
+
+
+def write_clean_itineraries(
+        raw_path: str, clean_path: str, chunk_size: int=50_000, max_rows: int=2_000_000
+        ) -> int:
+    """
+    Clean an itineraries export in batches of lines, appending every batch to the clean table.
+
+    Parameters
+    ----------
+    raw_path : str
+        Itineraries export, such as `emt-linea-data.csv`.
+    clean_path : str
+        Destination, such as `emt-linea-data-clean.csv`, replaced once it is complete.
+    chunk_size : int, optional
+        Rows of the export read at once. Default is 50000.
+    max_rows : int, optional
+        Rows of itineraries held at once. A batch gathers consecutive lines up
+        to this number of rows, or a single line when it is bigger. Default is
+        2000000.
+
+    Returns
+    -------
+    int
+        Rows written.
+
+    Notes
+    -----
+    The rows of an itinerary are spread over the export, so a first pass
+    counts the rows of every line and every batch then reads the export again,
+    keeping only the rows of its lines. Batches go in line order, which is the
+    order of the clean table, and the export is read once plus once per batch.
+    """
+    counts = Counter()
+    for chunk in read_csv(raw_path, usecols=["NUMEROLINEAUSUARIO"], dtype=str, chunksize=chunk_size):
+        counts.update(chunk["NUMEROLINEAUSUARIO"].value_counts().to_dict())
+    rows = 0
+    with _replacing(clean_path) as file:
+        DataFrame(columns=_SEGMENT_COLUMNS).to_csv(file, index=False)
+        for batch in _batches(counts, max_rows):
+            lines = set(batch)
+            raw = concat([
+                chunk[chunk["NUMEROLINEAUSUARIO"].isin(lines)]
+                for chunk in read_raw_itineraries(raw_path, chunk_size=chunk_size)
+            ], ignore_index=True)
+            segments = clean_itineraries(raw)
+            segments.to_csv(file, header=False, index=False)
+            rows += len(segments)
+    return rows
+
+
+def clean_data(
+        data_dir: str="data", output_dir: Optional[str]=None, chunk_size: int=50_000,
+        max_rows: int=2_000_000
+        ) -> List[str]:
+    """
+    Write `emt-data-clean.csv` and `emt-linea-data-clean.csv` from the raw exports.
+
+    Parameters
+    ----------
+    data_dir : str, optional
+        Folder with `emt-data.csv` and `emt-linea-data.csv`. Default is 'data'.
+    output_dir : str, optional
+        Destination folder, created if missing. Default is None, which is `data_dir`.
+    chunk_size : int, optional
+        Rows of an export read at once. Default is 50000.
+    max_rows : int, optional
+        Rows of itineraries held at once, see `write_clean_itineraries`.
+        Default is 2000000.
+
+    Returns
+    -------
+    List[str]
+        Paths of the written files.
+
+    Examples
+    --------
+    >>> clean_data("data", output_dir="/tmp/clean")
+    ['/tmp/clean/emt-data-clean.csv', '/tmp/clean/emt-linea-data-clean.csv']
+
+    Notes
+    -----
+    - The tables are the same as the ones `clean-data.ipynb` writes, but only
+      the used columns are parsed and memory is bounded by `chunk_size` and
+      `max_rows` instead of the size of the exports, so the much bigger CRTM
+      exports of the whole region can be cleaned too.
+    - Every column is read as text, so the type of a column can not change from
+      one chunk to another. The numeric codes lose their leading zeros as when
+      the notebook parsed them.
+    """
+    output_dir = data_dir if output_dir is None else output_dir
+    makedirs(output_dir, exist_ok=True)
+    start = perf_counter()
+    stops_path = path.join(output_dir, "emt-data-clean.csv")
+    rows = write_clean_stops(path.join(data_dir, "emt-data.csv"), stops_path, chunk_size=chunk_size)
+    logger.info(f"{stops_path}: {rows} rows in {perf_counter() - start:.2f} s")
+    start = perf_counter()
+    segments_path = path.join(output_dir, "emt-linea-data-clean.csv")
+    rows = write_clean_itineraries(
+        path.join(data_dir, "emt-linea-data.csv"), segments_path, chunk_size=chunk_size, max_rows=max_rows
+    )
+    logger.info(f"{segments_path}: {rows} rows in {perf_counter() - start:.2f} s")
+    return [stops_path, segments_path]
+
+
+def _strip_codes(frame: DataFrame) -> DataFrame:
+    """Drop the leading zeros of the numeric codes of a raw chunk."""
+    for column in _CODE_COLUMNS:
+        if column in frame:
+            frame[column] = frame[column].str.strip().str.replace(r"^0+(?=\d)", "", regex=True)
+    return frame
+
+
+def _batches(counts: Counter, max_rows: int) -> Iterator[List[str]]:
+    """Consecutive sorted lines whose rows add up to at most `max_rows`, or single lines."""
+    batch, rows = [], 0
+    for line in sorted(counts):
+        if batch and rows + counts[line] > max_rows:
+            yield batch
+            batch, rows = [], 0
+        batch.append(line)
+        rows += counts[line]
+    if batch:
+        yield batch
+
+
+@contextmanager
+def _replacing(output_path: str) -> Iterator[IO[str]]:
+    """Text file written under a temporary name and moved to `output_path` once complete."""
+    temporary_path = f"{output_path}.{getpid()}.tmp"
+    with open(temporary_path, "w", newline="") as file:
+        yield file
+    replace(temporary_path, output_path)
+
+
+def main(argv: Optional[List[str]]=None) -> None:
+    """Command line entry point, see `python -m toolbox.cleaning --help`."""
+    parser = ArgumentParser(
+        prog="python -m toolbox.cleaning",
+        description="Clean emt-data.csv and emt-linea-data.csv in chunks, with bounded memory.",
+    )
+    parser.add_argument("--data-dir", default="data", help="Folder with the raw exports.")
+    parser.add_argument("-o", "--output-dir", help="Folder where the clean tables are written, the data folder by default.")
+    parser.add_argument("--chunk-size", type=int, default=50_000, help="Rows of an export read at once.")
+    parser.add_argument("--max-rows", type=int, default=2_000_000, help="Rows of itineraries held at once.")
+    args = parser.parse_args(argv)
+    clean_data(args.data_dir, args.output_dir, chunk_size=args.chunk_size, max_rows=args.max_rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from json import loads
+from os import path
+from time import perf_counter
+from typing import Any, Dict, Iterator, List, Optional
+
+from loguru import logger
+from pandas import DataFrame
+
+from toolbox.incremental import CollapseEngine
+from toolbox.metrics import efficiency_sweep
+from toolbox.snapshot import load_network
+from toolbox.storage import COLUMNAR_FORMATS, columnar_engine
+
+OPTIONS = ("cp", "distrito", "busstop")
+OUTPUT_FORMATS = (".parquet", ".feather", ".csv")
+
+_WORKER_ENGINES = {}
+
+
+def read_scenarios(scenarios_path: str) -> List[Dict[str, Any]]:
+    """
+    Read the scenarios to evaluate.
+
+    Parameters
+    ----------
+    scenarios_path : str
+        `.json` file with a list of scenarios or `.jsonl` file with one scenario
+        per line. Every scenario is an object with the keys `option` ('cp',
+        'distrito' or 'busstop'), `lines` and `nodes` (the removed line codes and
+        node ids, both optional) and an optional `name`.
+
+    Returns
+    -------
+    List[Dict[str, Any]]
+        The scenarios, with every key filled in. Line codes are padded with
+        zeros to 5 characters and node ids are integers, as in the graphs, so
+        `"0012"` and `12` are the same node.
+
+    Raises
+    ------
+    ValueError
+        If a scenario has an invalid `option` or a node id that is not an integer.
+    """
+    with open(scenarios_path, "r") as file:
+        content = file.read()
+    if scenarios_path.endswith(".jsonl"):
+        raw_scenarios = [loads(line) for line in content.splitlines() if line.strip()]
+    else:
+        raw_scenarios = loads(content)
+    scenarios = []
+    for position, scenario in enumerate(raw_scenarios):
+        option = scenario.get("option")
+        if option not in OPTIONS:
+            raise ValueError((
+                f"You have passed option={option} in scenario {position} and the possible values are {OPTIONS}."
+            ))
+        scenarios.append({
+            "name": str(scenario.get("name", position)),
+            "option": option,
+            "lines": [str(line).zfill(5) for line in scenario.get("lines", [])],
+            "nodes": [_node_id(node, position) for node in scenario.get("nodes", [])],
+        })
+    return scenarios
+
+
+def _node_id(node: Any, position: int) -> int:
+    """Integer id of a node given in a scenario file as a number or a string."""
+    if isinstance(node, int) and not isinstance(node, bool):
+        return node
+    if isinstance(node, str) and node.strip().isdigit():
+        return int(node)
+    raise ValueError((
+        f"You have passed node={node!r} in scenario {position} and node ids have to be integer codes."
+    ))
+
+
+def evaluate_scenarios(
+        scenarios: List[Dict[str, Any]], data_dir: str="data", processes: int=1, chunk_size: int=8
+        ) -> DataFrame:
+    """
+    Evaluate many collapse scenarios, one row of metrics per scenario.
+
+    Parameters
+    ----------
+    scenarios : List[Dict[str, Any]]
+        Scenarios as returned by `read_scenarios`.
+    data_dir : str, optional
+        Folder with the `net_*.csv` files. Default is 'data'.
+    processes : int, optional
+        Number of worker processes. Default is 1.
+    chunk_size : int, optional
+        Scenarios handed to a worker at once. Default is 8.
+
+    Returns
+    -------
+    DataFrame
+        One row per scenario, in input order, with the columns `name`, `option`,
+        `removed_lines`, `removed_nodes`, `num_components`, `num_nodes`,
+        `num_edges`, `density`, `diameter`, `mean_ncn`, `mean_net_sp`,
+        `giant_fraction`, `efficiency`, `reachability`, `seconds` and `error`,
+        which holds why a scenario could not be evaluated (for instance an
+        unknown node) and leaves its metrics empty.
+
+    Notes
+    -----
+    - Every worker builds the baseline `CollapseEngine` of each node type once,
+      from the memory-mapped `net_<option>.graph` snapshot when it is up to date.
+      Scenarios are sorted so that the ones extending the previous scenario of a
+      chunk are applied on top of it instead of on a fresh copy of the baseline.
+    - The metrics are computed on the largest connected component, as the
+      collapse page shows them. `giant_fraction` is its share of the baseline nodes.
+    - `efficiency` and `reachability` are the global efficiency and the share of
+      connected ordered pairs over every component of the scenario, so they
+      drop when the network splits even if the largest component looks fine.
+    """
+    order = sorted(
+        range(len(scenarios)),
+        key=lambda index: (
+            OPTIONS.index(scenarios[index]["option"]),
+            len(scenarios[index]["lines"]) + len(scenarios[index]["nodes"]),
+        ),
+    )
+    chunks = [
+        [(index, scenarios[index]) for index in order[start:start + chunk_size]]
+        for start in range(0, len(order), chunk_size)
+    ]
+    rows = [None] * len(scenarios)
+    for chunk_rows in _map_chunks(chunks, data_dir, processes):
+        for index, row in chunk_rows:
+            rows[index] = row
+    return DataFrame(rows)
+
+
+def write_results(results: DataFrame, output_path: str) -> None:
+    """
+    Write the scenario metrics to a columnar file.
+
+    Parameters
+    ----------
+    results : DataFrame
+        Metrics returned by `evaluate_scenarios`.
+    output_path : str
+        Destination file. The format follows the extension: `.parquet` and
+        `.feather` need `pyarrow`, `.csv` has no extra requirement.
+
+    Raises
+    ------
+    ValueError
+        If the extension of `output_path` is not supported.
+    """
+    extension = path.splitext(output_path)[1]
+    if extension not in OUTPUT_FORMATS:
+        raise ValueError((
+            f"You have passed output_path={output_path} and the possible extensions are {OUTPUT_FORMATS}."
+        ))
+    if extension == ".parquet":
+        results.to_parquet(output_path, index=False)
+    elif extension == ".feather":
+        results.to_feather(output_path)
+    else:
+        results.to_csv(output_path, index=False)
+
+
+def _init_worker(data_dir: str) -> None:
+    """Remember where the tables are, the engines are built on first use."""
+    _WORKER_ENGINES.clear()
+    _WORKER_ENGINES["data_dir"] = data_dir
+
+
+def _engine(option: str) -> CollapseEngine:
+    """Baseline engine of `option` held by the worker."""
+    if option not in _WORKER_ENGINES:
+        snapshot = load_network(f"net_{option}", data_dir=_WORKER_ENGINES["data_dir"])
+        _WORKER_ENGINES[option] = CollapseEngine.from_snapshot(snapshot)
+    return _WORKER_ENGINES[option]
+
+
+def _map_chunks(chunks: List[list], data_dir: str, processes: int) -> Iterator[list]:
+    """Yield the rows of every chunk, serially or on a process pool."""
+    if processes <= 1 or len(chunks) <= 1:
+        _init_worker(data_dir)
+        try:
+            yield from map(_evaluate_chunk, chunks)
+        finally:
+            _WORKER_ENGINES.clear()
+        return
+    with ProcessPoolExecutor(
+            max_workers=min(processes, len(chunks)), initializer=_init_worker, initargs=(data_dir,)
+            ) as executor:
+        yield from executor.map(_evaluate_chunk, chunks)
+
+
+def _evaluate_chunk(chunk: list) -> list:
+    """Evaluate the scenarios of a chunk, stacking removals when possible."""
+    rows = []
+    scenario = None
+    for index, spec in chunk:
+        start = perf_counter()
+        baseline = _engine(spec["option"])
+        reusable = scenario is not None and scenario.graph is baseline.graph
+        if not reusable or not scenario.extends(spec["lines"], spec["nodes"]):
+            scenario = baseline.copy()
+        try:
+            scenario.remove_lines(spec["lines"]).remove_nodes(spec["nodes"])
+        except KeyError as err:
+            logger.error(f"Scenario {spec['name']}: {err}")
+            rows.append((index, {"name": spec["name"], "option": spec["option"], "error": str(err)}))
+            scenario = None
+            continue
+        rows.append((index, _scenario_row(spec, scenario, baseline, perf_counter() - start)))
+    return rows
+
+
+def _scenario_row(
+        spec: Dict[str, Any], scenario: CollapseEngine, baseline: CollapseEngine, elapsed: float
+        ) -> Dict[str, Any]:
+    """Metrics of the largest component of an evaluated scenario."""
+    start = perf_counter()
+    components = scenario.components()
+    giant = components[0] if components else set()
+    statistics = scenario.statistics(nodes=giant)
+    efficiency = efficiency_sweep(scenario.subgraph())
+    return {
+        "name": spec["name"],
+        "option": spec["option"],
+        "removed_lines": len(spec["lines"]),
+        "removed_nodes": len(spec["nodes"]),
+        "num_components": len(components),
+        "num_nodes": statistics["num_nodes"],
+        "num_edges": statistics["num_edges"],
+        "density": statistics["density"],
+        "diameter": statistics["diameter"],
+        "mean_ncn": 2 * statistics["num_edges"] / statistics["num_nodes"] if giant else 0.0,
+        "mean_net_sp": statistics["mean_net_sp"],
+        "giant_fraction": statistics["num_nodes"] / baseline.graph.number_of_nodes(),
+        "efficiency": efficiency["global_efficiency"],
+        "reachability": efficiency["reachability"],
+        "seconds": elapsed + perf_counter() - start,
+        "error": None,
+    }
+
+
+def main(argv: Optional[List[str]]=None) -> None:
+    """Command line entry point, see `python -m toolbox.collapse --help`."""
+    parser = ArgumentParser(
+        prog="python -m toolbox.collapse",
+        description="Evaluate collapse scenarios of the EMT network without the Streamlit app.",
+    )
+    parser.add_argument("scenarios", help="`.json` or `.jsonl` file with the scenarios.")
+    parser.add_argument("-o", "--output", default="collapse.parquet", help="Output `.parquet`, `.feather` or `.csv` file.")
+    parser.add_argument("-p", "--processes", type=int, default=1, help="Number of worker processes.")
+    parser.add_argument("--data-dir", default="data", help="Folder with the `net_*.csv` files.")
+    parser.add_argument("--chunk-size", type=int, default=8, help="Scenarios handed to a worker at once.")
+    args = parser.parse_args(argv)
+    extension = path.splitext(args.output)[1]
+    if extension not in OUTPUT_FORMATS:
+        parser.error(f"the output extension has to be one of {OUTPUT_FORMATS}")
+    if extension in COLUMNAR_FORMATS:
+        try:
+            columnar_engine(extension)
+        except ImportError as err:
+            parser.error(str(err))
+
+    scenarios = read_scenarios(args.scenarios)
+    logger.info(f"Evaluating {len(scenarios)} scenarios with {args.processes} processes")
+    start = perf_counter()
+    results = evaluate_scenarios(
+        scenarios, data_dir=args.data_dir, processes=args.processes, chunk_size=args.chunk_size
+    )
+    write_results(results, args.output)
+    logger.info(f"Wrote {len(results)} rows to {args.output} in {perf_counter() - start:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
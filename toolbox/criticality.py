@@ -0,0 +1,338 @@
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import sha256
+from os import getpid, makedirs, path, replace
+from tempfile import TemporaryDirectory
+from typing import Any, Dict, Hashable, Iterator, List, Optional, Tuple
+
+from loguru import logger
+from numpy import (
+    arange, argsort, array, bincount, concatenate, cumsum, int32, int64, maximum, ndarray, save, zeros,
+)
+from pandas import DataFrame, read_csv
+
+from toolbox.cache import toolbox_version
+from toolbox.graph import CSRGraph
+from toolbox.incremental import CollapseEngine
+from toolbox.metrics import DistanceMatrix
+
+_WORKER_ENGINE = {}
+
+
+def line_impact(
+        dataframe: DataFrame, lines: Optional[List[str]]=None, processes: int=1, chunk_size: int=16,
+        cache_dir: Optional[str]=".cache/line_impact"
+        ) -> DataFrame:
+    """
+    Rank the lines by how much the network suffers when each one is removed alone.
+
+    Parameters
+    ----------
+    dataframe : DataFrame
+        Table with the `net_*.csv` layout, including the `edge` column with the
+        line of every row.
+    lines : List[str], optional
+        Line codes, padded to 5 characters, to evaluate. Default is None, which
+        evaluates every line of `dataframe`.
+    processes : int, optional
+        Number of worker processes. Default is 1.
+    chunk_size : int, optional
+        Lines handed to a worker at once. Default is 16.
+    cache_dir : str, optional
+        Folder where rankings are kept per dataset version. Default is
+        '.cache/line_impact'. None disables the cache.
+
+    Returns
+    -------
+    DataFrame
+        One row per line, from the most to the least harmful removal, with the
+        columns `rank`, `line`, `removed_edges` (segments served by no other
+        line), `disconnected` (stops leaving the largest component),
+        `delta_efficiency`, `delta_mean_sp` and `delta_diameter`. The mean
+        shortest path and the diameter are measured on the largest component,
+        as the collapse page shows them, and the global efficiency over every
+        pair of stops of the baseline, so splitting the network is penalized.
+
+    Notes
+    -----
+    - The baseline `CollapseEngine` is computed once and its hop matrix is saved
+      to a temporary `.npy` file that every worker memory-maps read-only, so the
+      workers share the same physical pages instead of receiving a copy.
+    - A removal only traverses again the sources whose shortest paths change.
+      A line whose segments are all served by other lines costs almost nothing,
+      but cutting a segment of a mostly tree-like network like
+      `net_busstop.csv` changes some distance from nearly every stop, so those
+      lines cost about one all-pairs BFS each and the sweep scales with `processes`.
+    - The ranking is sorted by `delta_efficiency`, then `disconnected` and then
+      `delta_mean_sp`.
+    - The cache key combines the graph fingerprint, the line of every row and
+      the toolbox version, so a new dataset or new metric code is never served
+      a stale ranking.
+    """
+    engine = CollapseEngine(dataframe, precompute=False)
+    lines = engine.lines if lines is None else [str(line).zfill(5) for line in lines]
+    cache_path = None
+    if cache_dir is not None:
+        digest = sha256(engine.graph.fingerprint().encode())
+        digest.update(toolbox_version().encode())
+        digest.update("\x1f".join(dataframe["edge"].astype(str).str.zfill(5)).encode())
+        digest.update("\x1f".join(lines).encode())
+        cache_path = path.join(cache_dir, f"{digest.hexdigest()[:32]}.csv")
+        if path.exists(cache_path):
+            logger.info(f"Line impact ranking read from {cache_path}")
+            return read_csv(cache_path, dtype={"line": str})
+
+    engine.refresh()
+    chunks = [lines[start:start + chunk_size] for start in range(0, len(lines), chunk_size)]
+    rows = []
+    with TemporaryDirectory() as directory:
+        distances_path = path.join(directory, "sp.npy")
+        save(distances_path, engine.distances.data)
+        for chunk_rows in _map_chunks(chunks, engine, dataframe, distances_path, processes):
+            rows.extend(chunk_rows)
+    ranking = DataFrame(rows).sort_values(
+        ["delta_efficiency", "disconnected", "delta_mean_sp"], ascending=[True, False, False], kind="stable"
+    )
+    ranking.insert(0, "rank", range(1, len(ranking) + 1))
+    ranking = ranking.reset_index(drop=True)
+
+    if cache_path is not None:
+        makedirs(cache_dir, exist_ok=True)
+        ranking.to_csv(f"{cache_path}.{getpid()}.tmp", index=False)
+        replace(f"{cache_path}.{getpid()}.tmp", cache_path)
+    return ranking
+
+
+def _init_worker(dataframe: DataFrame, distances_path: str) -> None:
+    """Build the baseline engine of the worker around the shared hop matrix."""
+    engine = CollapseEngine(dataframe, precompute=False)
+    engine.distances = DistanceMatrix.load(distances_path)
+    engine.stale[:] = False
+    _WORKER_ENGINE["engine"] = engine
+    _WORKER_ENGINE["baseline"] = _giant_metrics(engine)
+
+
+def _map_chunks(
+        chunks: List[List[str]], engine: CollapseEngine, dataframe: DataFrame, distances_path: str,
+        processes: int
+        ) -> Iterator[List[Dict[str, Any]]]:
+    """Yield the rows of every chunk, serially or on a process pool."""
+    if processes <= 1 or len(chunks) <= 1:
+        _WORKER_ENGINE["engine"] = engine
+        _WORKER_ENGINE["baseline"] = _giant_metrics(engine)
+        try:
+            yield from map(_evaluate_lines, chunks)
+        finally:
+            _WORKER_ENGINE.clear()
+        return
+    with ProcessPoolExecutor(
+            max_workers=min(processes, len(chunks)), initializer=_init_worker,
+            initargs=(dataframe, distances_path)
+            ) as executor:
+        yield from executor.map(_evaluate_lines, chunks)
+
+
+def _evaluate_lines(lines: List[str]) -> List[Dict[str, Any]]:
+    """Impact of removing each of `lines` alone from the baseline."""
+    baseline = _WORKER_ENGINE["baseline"]
+    rows = []
+    for line in lines:
+        scenario = _WORKER_ENGINE["engine"].copy().remove_lines([line])
+        metrics = _giant_metrics(scenario)
+        rows.append({
+            "line": line,
+            "removed_edges": int(scenario.last_update.get("removed_edges", 0)),
+            "disconnected": len(baseline["giant"] - metrics["giant"]),
+            "delta_efficiency": metrics["efficiency"] - baseline["efficiency"],
+            "delta_mean_sp": metrics["mean_net_sp"] - baseline["mean_net_sp"],
+            "delta_diameter": metrics["diameter"] - baseline["diameter"],
+        })
+    return rows
+
+
+def _giant_metrics(engine: CollapseEngine) -> Dict[str, Any]:
+    """Largest component, its mean shortest path and diameter, and the global efficiency."""
+    components = engine.components()
+    giant = components[0] if components else set()
+    statistics = engine.statistics(nodes=giant)
+    return {
+        "giant": giant,
+        "efficiency": float(engine.efficiency().mean()),
+        "mean_net_sp": statistics["mean_net_sp"],
+        "diameter": statistics["diameter"],
+    }
+
+
+class BlockCutIndex:
+    """
+    Articulation points, bridges and biconnected blocks of a graph.
+
+    Built once with a single depth-first search, it answers in constant time
+    what removing one node or one segment of the graph does to its connectivity.
+
+    Parameters
+    ----------
+    graph : CSRGraph
+        The input graph. Directed graphs are treated as undirected.
+
+    Attributes
+    ----------
+    articulation : ndarray
+        Whether removing each node splits its connected component.
+    disconnected : ndarray
+        Nodes cut off from the largest remaining piece of its component when
+        each node is removed, 0 for the nodes that are not articulation points.
+    bridge : ndarray
+        Whether removing each edge splits its connected component.
+    block : ndarray
+        Biconnected block of each edge, -1 for self loops. Two edges share a
+        block when they lie on a common cycle; the blocks and the articulation
+        points joining them form the block-cut tree of the graph.
+
+    Examples
+    --------
+    >>> import networkx as nx
+    >>> index = BlockCutIndex(CSRGraph.from_networkx(nx.barbell_graph(3, 2)))
+    >>> index.node_disconnects(3), index.is_bridge(3, 4)
+    (3, True)
+
+    Notes
+    -----
+    - Tarjan and Hopcroft lowpoints: a DFS child `c` of `v` whose subtree has no
+      back edge above `v` (`low[c] >= disc[v]`) is cut off when `v` is removed,
+      and the tree edge to it is a bridge when `low[c] > disc[v]`. The sizes of
+      those subtrees give the pieces left by every removal, so the whole index
+      costs `O(n + m)`.
+    - The answers refer to the graph the index was built from, the baseline of
+      a collapse scenario, and to a single removal.
+    """
+
+    def __init__(self, graph: CSRGraph) -> None:
+        self.graph = graph
+        indptr, indices, arc_edge = _undirected_arcs(graph)
+        num_nodes, num_edges = graph.number_of_nodes(), graph.number_of_edges()
+        indptr, indices, arc_edge = indptr.tolist(), indices.tolist(), arc_edge.tolist()
+        disc, low, size = [-1] * num_nodes, [0] * num_nodes, [1] * num_nodes
+        separated, largest, pieces = [0] * num_nodes, [0] * num_nodes, [0] * num_nodes
+        component_size = [1] * num_nodes
+        block, bridge = [-1] * num_edges, [False] * num_edges
+        edge_stack, num_blocks, clock = [], 0, 0
+        for root in range(num_nodes):
+            if disc[root] >= 0:
+                continue
+            disc[root] = low[root] = clock
+            clock += 1
+            members = [root]
+            # Every frame holds the node, the edge it was reached by and its next arc.
+            stack = [[root, -1, indptr[root]]]
+            while stack:
+                frame = stack[-1]
+                node, parent_edge, arc = frame
+                if arc < indptr[node + 1]:
+                    frame[2] += 1
+                    other, edge = indices[arc], arc_edge[arc]
+                    if edge == parent_edge:
+                        continue
+                    if disc[other] < 0:
+                        disc[other] = low[other] = clock
+                        clock += 1
+                        members.append(other)
+                        edge_stack.append(edge)
+                        stack.append([other, edge, indptr[other]])
+                    elif disc[other] < disc[node]:
+                        low[node] = min(low[node], disc[other])
+                        edge_stack.append(edge)
+                    continue
+                stack.pop()
+                if not stack:
+                    continue
+                parent = stack[-1][0]
+                low[parent] = min(low[parent], low[node])
+                size[parent] += size[node]
+                if low[node] >= disc[parent]:
+                    separated[parent] += size[node]
+                    pieces[parent] += 1
+                    largest[parent] = max(largest[parent], size[node])
+                    bridge[parent_edge] = low[node] > disc[parent]
+                    while True:
+                        edge = edge_stack.pop()
+                        block[edge] = num_blocks
+                        if edge == parent_edge:
+                            break
+                    num_blocks += 1
+            for member in members:
+                component_size[member] = len(members)
+
+        separated, largest, component_size = array(separated), array(largest), array(component_size)
+        # The piece holding the DFS parent is whatever the cut off subtrees leave.
+        rest = component_size - 1 - separated
+        self.articulation = array(pieces) + (rest > 0) >= 2
+        self.disconnected = (component_size - 1 - maximum(largest, rest)).astype(int64)
+        self.bridge = array(bridge, dtype=bool)
+        self.block = array(block, dtype=int64)
+        self.num_blocks = num_blocks
+
+    def node_disconnects(self, node: Hashable) -> int:
+        """
+        Nodes cut off from the rest of the network when `node` alone is removed.
+
+        Raises
+        ------
+        KeyError
+            If `node` is not in the graph.
+        """
+        return int(self.disconnected[self.graph.index_of([node])[0]])
+
+    def is_bridge(self, u: Hashable, v: Hashable) -> bool:
+        """
+        Whether removing the segment between `u` and `v` splits the network.
+
+        Raises
+        ------
+        KeyError
+            If there is no segment between `u` and `v`.
+        """
+        return bool(self.bridge[self._edge(u, v)])
+
+    def _edge(self, u: Hashable, v: Hashable) -> int:
+        """Edge id of the segment between `u` and `v`, in any direction."""
+        graph = self.graph
+        first, second = graph.index_of([u, v]).tolist()
+        for src, dst in ((first, second), (second, first)):
+            arcs = arange(graph.indptr[src], graph.indptr[src + 1])
+            found = arcs[graph.indices[arcs] == dst]
+            if len(found):
+                return int(graph.arc_edge[found[0]])
+        raise KeyError(f"There is no segment between {u} and {v}.")
+
+    def table(self) -> DataFrame:
+        """
+        Criticality of every node.
+
+        Returns
+        -------
+        DataFrame
+            Columns `node`, `articulation`, `disconnected` and `bridges` (number
+            of bridges touching the node), sorted by `disconnected`, the most
+            critical nodes first.
+        """
+        graph = self.graph
+        ends = concatenate([graph.edge_src[self.bridge], graph.edge_dst[self.bridge]])
+        return DataFrame({
+            "node": graph.node_ids,
+            "articulation": self.articulation,
+            "disconnected": self.disconnected,
+            "bridges": bincount(ends, minlength=graph.number_of_nodes()),
+        }).sort_values("disconnected", ascending=False, kind="stable").reset_index(drop=True)
+
+
+def _undirected_arcs(graph: CSRGraph) -> Tuple[ndarray, ndarray, ndarray]:
+    """CSR arrays with both arcs of every edge and their edge ids, reusing the graph ones if undirected."""
+    if not graph.is_directed():
+        return graph.indptr, graph.indices, graph.arc_edge
+    edge_ids = arange(graph.number_of_edges(), dtype=int32)
+    arc_src = concatenate([graph.edge_src, graph.edge_dst])
+    order = argsort(arc_src, kind="stable")
+    indptr = zeros(graph.number_of_nodes() + 1, dtype=int64)
+    indptr[1:] = cumsum(bincount(arc_src, minlength=graph.number_of_nodes()))
+    indices = concatenate([graph.edge_dst, graph.edge_src])[order]
+    return indptr, indices, concatenate([edge_ids, edge_ids])[order]
@@ -0,0 +1,309 @@
+from hashlib import sha256
+from typing import Hashable, Iterable, Optional, Tuple, Union
+
+from networkx import Graph, DiGraph
+from numpy import (
+    arange, argsort, array, ascontiguousarray, bincount, column_stack, concatenate, cumsum,
+    empty, float64, int32, int64, maximum, minimum, ndarray, ones, unique, zeros,
+)
+from pandas import DataFrame, Index, factorize
+from scipy.sparse import csr_matrix
+
+
+class CSRGraph:
+    """
+    Compact, array-backed graph built straight from the `net_*.csv` columns.
+
+    Node ids are interned to contiguous int32 positions, edges are stored once
+    as `(edge_src, edge_dst, weight)` columns and the adjacency is kept as CSR
+    index arrays (`indptr`, `indices`) where every arc remembers the edge it
+    comes from (`arc_edge`). Undirected graphs store both arcs of each edge.
+
+    Parameters
+    ----------
+    node_ids : ndarray
+        Original node ids. The position of an id is its interned int32 index.
+    edge_src : ndarray
+        Interned source node of every unique edge.
+    edge_dst : ndarray
+        Interned target node of every unique edge.
+    weight : ndarray, optional
+        Weight of every unique edge. Default is 1.0 for every edge.
+    pos : ndarray, optional
+        `(n, 2)` array with the `(lat, lon)` of every node. Default is None.
+    directed : bool, optional
+        Whether the edges are directed. Default is False.
+    row_edge : ndarray, optional
+        Edge of every row of the table the graph was built from. Default is None.
+    csr : Tuple[ndarray, ndarray, ndarray], optional
+        `(indptr, indices, arc_edge)` already built for these edges, for instance
+        read from a `toolbox.snapshot.GraphSnapshot`. Default is None, which
+        builds them.
+
+    Notes
+    -----
+    - The instances are treated as read-only. Every array can be shared between
+      processes or memory-mapped without copying.
+    - Use `to_networkx` to get a NetworkX graph for code that still expects one.
+    """
+
+    def __init__(
+            self, node_ids: ndarray, edge_src: ndarray, edge_dst: ndarray,
+            weight: Optional[ndarray]=None, pos: Optional[ndarray]=None, directed: bool=False,
+            row_edge: Optional[ndarray]=None, csr: Optional[Tuple[ndarray, ndarray, ndarray]]=None
+            ) -> None:
+        self.node_ids = node_ids
+        self.edge_src = edge_src.astype(int32, copy=False)
+        self.edge_dst = edge_dst.astype(int32, copy=False)
+        self.weight = ones(len(edge_src), dtype=float64) if weight is None else weight.astype(float64, copy=False)
+        self.pos = pos
+        self.directed = directed
+        self.row_edge = row_edge
+        self._index = None
+        self._adjacency = {}
+        self.indptr, self.indices, self.arc_edge = self._build_csr() if csr is None else csr
+
+    def _build_csr(self):
+        """Sort the arcs by source node and compress them into CSR arrays."""
+        num_edges = len(self.edge_src)
+        edge_ids = arange(num_edges, dtype=int32)
+        if self.directed:
+            arc_src, arc_dst, arc_edge = self.edge_src, self.edge_dst, edge_ids
+        else:
+            arc_src = concatenate([self.edge_src, self.edge_dst])
+            arc_dst = concatenate([self.edge_dst, self.edge_src])
+            arc_edge = concatenate([edge_ids, edge_ids])
+        order = argsort(arc_src, kind="stable")
+        indptr = zeros(self.number_of_nodes() + 1, dtype=int64)
+        indptr[1:] = cumsum(bincount(arc_src, minlength=self.number_of_nodes()))
+        return indptr, arc_dst[order].astype(int32, copy=False), arc_edge[order].astype(int32, copy=False)
+
+    @classmethod
+    def from_dataframe(cls, dataframe: DataFrame, directed: bool=False, weight: str="weight") -> "CSRGraph":
+        """
+        Build the graph from a DataFrame with the `net_*.csv` layout.
+
+        Parameters
+        ----------
+        dataframe : DataFrame
+            Table with the columns `from_node`, `to_node`, `weight`, `from_lat`,
+            `from_lon`, `to_lat` and `to_lon`.
+        directed : bool, optional
+            Whether the edges are directed. Default is False.
+        weight : str, optional
+            Column holding the edge weights, for instance `metres` or `seconds`
+            after `toolbox.net_utils.add_segment_costs`. Default is 'weight'.
+
+        Returns
+        -------
+        CSRGraph
+            The array-backed graph.
+
+        Notes
+        -----
+        - Nodes are numbered in order of first appearance in `from_node` and then
+          `to_node`, which is the order `generate_graph` always used.
+        - A node appearing with several coordinates keeps the last one and an edge
+          appearing several times keeps its first orientation and the weight of
+          its last distinct `(from_node, to_node, weight)` row, the same outcome as
+          calling `add_node`/`add_edge` over the de-duplicated rows.
+        """
+        num_rows = dataframe.shape[0]
+        ids = concatenate([dataframe["from_node"].to_numpy(), dataframe["to_node"].to_numpy()])
+        codes, node_ids = factorize(ids)
+        codes = codes.astype(int32)
+        coords = column_stack([
+            concatenate([dataframe["from_lat"].to_numpy(), dataframe["to_lat"].to_numpy()]),
+            concatenate([dataframe["from_lon"].to_numpy(), dataframe["to_lon"].to_numpy()]),
+        ]).astype(float64)
+        num_nodes = len(node_ids)
+        pos = coords[_last_distinct(codes, coords, num_nodes)]
+
+        src, dst = codes[:num_rows], codes[num_rows:]
+        if directed:
+            keys = src.astype(int64) * num_nodes + dst
+        else:
+            keys = minimum(src, dst).astype(int64) * num_nodes + maximum(src, dst)
+        edge_codes, _ = factorize(keys)
+        num_edges = edge_codes.max() + 1 if num_rows else 0
+        first = _first_occurrence(edge_codes, num_edges)
+        weights = dataframe[weight].to_numpy(dtype=float64)
+        weight = weights[_last_distinct(edge_codes, column_stack([src, dst, weights]), num_edges)]
+        return cls(
+            node_ids=node_ids, edge_src=src[first], edge_dst=dst[first],
+            weight=weight, pos=pos, directed=directed, row_edge=edge_codes.astype(int32)
+        )
+
+    @classmethod
+    def from_networkx(cls, network: Union[Graph, DiGraph], weight: str="weight") -> "CSRGraph":
+        """
+        Build the graph from a NetworkX graph, keeping its node order.
+
+        Parameters
+        ----------
+        network : Graph or DiGraph
+            The input graph. Node attribute `pos` is kept when present.
+        weight : str, optional
+            Edge attribute holding the weight. Missing weights default to 1.0.
+
+        Returns
+        -------
+        CSRGraph
+            The array-backed graph.
+        """
+        node_ids = list(network.nodes)
+        index = {node: position for position, node in enumerate(node_ids)}
+        edges = list(network.edges(data=weight, default=1.0))
+        src = empty(len(edges), dtype=int32)
+        dst = empty(len(edges), dtype=int32)
+        weights = empty(len(edges), dtype=float64)
+        for position, (u, v, w) in enumerate(edges):
+            src[position], dst[position], weights[position] = index[u], index[v], w
+        pos = None
+        positions = [network.nodes[node].get("pos") for node in node_ids]
+        if node_ids and all(p is not None for p in positions):
+            pos = array(positions, dtype=float64)
+        ids = empty(len(node_ids), dtype=object)
+        ids[:] = node_ids
+        return cls(
+            node_ids=ids, edge_src=src, edge_dst=dst,
+            weight=weights, pos=pos, directed=network.is_directed()
+        )
+
+    def number_of_nodes(self) -> int:
+        """Number of nodes of the graph."""
+        return len(self.node_ids)
+
+    def number_of_edges(self) -> int:
+        """Number of unique edges of the graph."""
+        return len(self.edge_src)
+
+    def is_directed(self) -> bool:
+        """Whether the graph is directed."""
+        return self.directed
+
+    def degree(self) -> ndarray:
+        """Degree of every node, counting in and out arcs for directed graphs."""
+        out_degree = self.out_degree()
+        if not self.directed:
+            return out_degree
+        return out_degree + self.in_degree()
+
+    def out_degree(self) -> ndarray:
+        """Number of arcs leaving every node."""
+        return (self.indptr[1:] - self.indptr[:-1]).astype(int64)
+
+    def in_degree(self) -> ndarray:
+        """Number of arcs entering every node."""
+        return bincount(self.indices, minlength=self.number_of_nodes()).astype(int64)
+
+    def neighbors(self, node: int) -> ndarray:
+        """Interned successors of the interned `node`."""
+        return self.indices[self.indptr[node]:self.indptr[node + 1]]
+
+    def index_of(self, nodes: Iterable[Hashable]) -> ndarray:
+        """
+        Interned positions of the given original node ids.
+
+        Raises
+        ------
+        KeyError
+            If any of the nodes is not in the graph.
+        """
+        if self._index is None:
+            self._index = Index(self.node_ids)
+        nodes = list(nodes)
+        positions = self._index.get_indexer(nodes)
+        if (positions < 0).any():
+            missing = [node for node, position in zip(nodes, positions.tolist()) if position < 0]
+            raise KeyError(f"The nodes {missing} are not in the graph.")
+        return positions.astype(int32)
+
+    def adjacency(self, weighted: bool=False) -> csr_matrix:
+        """
+        Scipy CSR adjacency matrix sharing the graph index arrays.
+
+        Parameters
+        ----------
+        weighted : bool, optional
+            Use the edge weights as matrix values instead of ones. Default is False.
+
+        Returns
+        -------
+        csr_matrix
+            `(n, n)` matrix where row `u` holds the arcs leaving `u`.
+        """
+        if weighted not in self._adjacency:
+            values = self.weight[self.arc_edge] if weighted else ones(len(self.indices), dtype=float64)
+            num_nodes = self.number_of_nodes()
+            self._adjacency[weighted] = csr_matrix(
+                (values, self.indices, self.indptr), shape=(num_nodes, num_nodes)
+            )
+        return self._adjacency[weighted]
+
+    def fingerprint(self) -> str:
+        """
+        Stable content hash of the graph.
+
+        Returns
+        -------
+        str
+            SHA-256 hex digest of the node ids, edges, weights, positions and
+            direction. Two graphs with the same digest have the same nodes in the
+            same order and the same edges.
+        """
+        digest = sha256(b"direct" if self.directed else b"undirect")
+        digest.update("\x1f".join(map(str, self.node_ids.tolist())).encode())
+        for values in (self.edge_src, self.edge_dst, self.weight):
+            digest.update(ascontiguousarray(values).tobytes())
+        if self.pos is not None:
+            digest.update(ascontiguousarray(self.pos).tobytes())
+        return digest.hexdigest()
+
+    def to_networkx(self, weight: str="weight") -> Union[Graph, DiGraph]:
+        """
+        Build the equivalent NetworkX graph.
+
+        Parameters
+        ----------
+        weight : str, optional
+            Name of the edge attribute holding the weights. Default is 'weight'.
+
+        Returns
+        -------
+        Graph or DiGraph
+            Graph with the same nodes and edges, the `pos` node attribute and
+            the `weight` edge attribute.
+        """
+        graph = DiGraph() if self.directed else Graph()
+        node_ids = self.node_ids.tolist()
+        if self.pos is None:
+            graph.add_nodes_from(node_ids)
+        else:
+            graph.add_nodes_from(
+                (node, {"pos": (lat, lon)}) for node, (lat, lon) in zip(node_ids, self.pos.tolist())
+            )
+        graph.add_edges_from(
+            (node_ids[u], node_ids[v], {weight: w})
+            for u, v, w in zip(self.edge_src.tolist(), self.edge_dst.tolist(), self.weight.tolist())
+        )
+        return graph
+
+
+def _first_occurrence(codes: ndarray, size: int) -> ndarray:
+    """Index of the first occurrence of every code in `range(size)`."""
+    _, first = unique(codes, return_index=True)
+    return first[:size]
+
+
+def _last_distinct(codes: ndarray, values: ndarray, size: int) -> ndarray:
+    """
+    Index, for every code in `range(size)`, of the row whose `(code, *values)`
+    combination appears first the latest. This is the row that wins when the
+    rows are de-duplicated keeping the first one and then applied in order.
+    """
+    frame = DataFrame(values)
+    frame.insert(0, "code", codes)
+    rows = (~frame.duplicated(keep="first")).to_numpy().nonzero()[0]
+    _, last_reversed = unique(codes[rows][::-1], return_index=True)
+    return rows[len(rows) - 1 - last_reversed][:size]
@@ -0,0 +1,470 @@
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Set
+
+from networkx import Graph, NetworkXError
+from numpy import (
+    arange, bincount, concatenate, cumsum, divide, errstate, float64, iinfo, int8, int16, int32, int64,
+    isfinite, ndarray, ones, repeat, stack, unique, where, zeros,
+)
+from pandas import DataFrame
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components, shortest_path
+
+from toolbox.graph import CSRGraph
+from toolbox.metrics import DistanceMatrix, _brandes_dependency, _closeness, _rescale_betweenness, bfs_sweep
+from toolbox.snapshot import GraphSnapshot
+
+
+class CollapseEngine:
+    """
+    Incremental what-if analysis of line and node removals.
+
+    The baseline graph and its all-pairs hop matrix are computed once. Every
+    removal is then applied as a delta: the connected components are split,
+    the pairs left apart are marked unreachable and only the sources whose BFS
+    tree loses a node are flagged to be traversed again. Flagged sources are
+    traversed when the metrics are read, so stacking removals costs time
+    proportional to what they change.
+
+    Parameters
+    ----------
+    dataframe : DataFrame
+        Table with the `net_*.csv` layout, including the `edge` column with the
+        line of every row. The graph is undirected.
+    batch_size : int, optional
+        Number of sources traversed together. Default is 128.
+    processes : int, optional
+        Number of worker processes used for the baseline sweep. Default is 1.
+    precompute : bool, optional
+        Whether to compute the baseline hop matrix right away. When False every
+        row is computed the first time `statistics` needs it, which keeps the
+        engine cheap when only the components and the graph are used.
+        Default is True.
+
+    Examples
+    --------
+    >>> from pandas import read_csv
+    >>> engine = CollapseEngine(read_csv("data/net_distrito.csv"))
+    >>> scenario = engine.copy().remove_lines(["00027"])
+    >>> scenario.statistics(scenario.components()[0])["diameter"]
+    4
+
+    Notes
+    -----
+    - Lines are identified by their code left-padded with zeros to 5 characters,
+      as shown in the collapse page. A pair of nodes stays connected while any
+      of the lines serving it is left.
+    - A node left without connections disappears from the graph, the same as
+      when the graph is rebuilt from the filtered rows.
+    - Removing an edge only changes the distances from a source when some node
+      loses every parent it had in the shortest-path DAG of that source. Those
+      sources are found from the hop matrix columns of the removed edge ends
+      and, for a real network, are often most of them: a removal typically
+      changes a few distances from every source. The saving then comes from
+      skipping the rows left apart and from stacking removals before `refresh`.
+    - `copy` shares the baseline graph and hop matrix and copies the rest of
+      the mutable state, so one engine can serve many scenarios. Once copied,
+      the hop matrix is never written: every scenario keeps the rows it
+      traverses again apart and reads the others from the shared matrix.
+    - Pairs in different components, or with a removed node, are never written
+      as unreachable either; they are masked from the component labels when
+      the hops are read.
+    """
+
+    def __init__(
+            self, dataframe: DataFrame, batch_size: int=128, processes: int=1, precompute: bool=True
+            ) -> None:
+        self._setup(GraphSnapshot.from_dataframe(dataframe), batch_size, processes, precompute)
+
+    @classmethod
+    def from_snapshot(
+            cls, snapshot: GraphSnapshot, batch_size: int=128, processes: int=1, precompute: bool=True
+            ) -> "CollapseEngine":
+        """
+        Engine over the graph of a snapshot, without going through the table.
+
+        Parameters
+        ----------
+        snapshot : GraphSnapshot
+            Snapshot of the network, for instance from `toolbox.snapshot.load_network`.
+            Its memory-mapped arrays are shared, never copied.
+        batch_size, processes, precompute
+            As in `CollapseEngine`.
+
+        Returns
+        -------
+        CollapseEngine
+            The baseline engine.
+        """
+        engine = cls.__new__(cls)
+        engine._setup(snapshot, batch_size, processes, precompute)
+        return engine
+
+    def _setup(self, snapshot: GraphSnapshot, batch_size: int, processes: int, precompute: bool) -> None:
+        """Baseline state of the engine over the graph and lines of `snapshot`."""
+        self.graph = snapshot.graph
+        self.batch_size = batch_size
+        num_nodes = self.graph.number_of_nodes()
+        self.lines: List[str] = snapshot.lines.tolist()
+        self._line_edges = snapshot.line_edges()
+        self._arc_src = repeat(arange(num_nodes, dtype=int32), self.graph.out_degree())
+        self.edge_count = snapshot.line_count()
+        self.edge_alive = ones(self.graph.number_of_edges(), dtype=bool)
+        self.node_alive = ones(num_nodes, dtype=bool)
+        self.degree = self.graph.degree()
+        if precompute:
+            self.distances = bfs_sweep(
+                graph=self.graph, batch_size=batch_size, keep_distances=True,
+                processes=processes, betweenness=False
+            )["distances"]
+        else:
+            self.distances = DistanceMatrix(num_nodes)
+        self.stale = zeros(num_nodes, dtype=bool) if precompute else ones(num_nodes, dtype=bool)
+        _, labels = connected_components(self.graph.adjacency(), directed=False)
+        self.labels = labels.astype(int32)
+        self.removed_lines: Set[str] = set()
+        self.removed_nodes: Set[Hashable] = set()
+        self.last_update: Dict[str, int] = {}
+        self._rows: Dict[int, ndarray] = {}
+        self._overlaid = zeros(num_nodes, dtype=bool)
+        self._shared = False
+
+    def copy(self) -> "CollapseEngine":
+        """Independent scenario sharing the baseline graph."""
+        scenario = self.__class__.__new__(self.__class__)
+        scenario.__dict__.update(self.__dict__)
+        self._shared = scenario._shared = True
+        scenario._rows = dict(self._rows)
+        for attribute in ("edge_count", "edge_alive", "node_alive", "degree", "labels", "stale", "_overlaid"):
+            setattr(scenario, attribute, getattr(self, attribute).copy())
+        scenario.removed_lines = set(self.removed_lines)
+        scenario.removed_nodes = set(self.removed_nodes)
+        scenario.last_update = dict(self.last_update)
+        return scenario
+
+    def extends(self, lines: Iterable[str], nodes: Iterable[Hashable]) -> bool:
+        """Whether the removals of `lines` and `nodes` can be stacked on this scenario."""
+        return self.removed_lines <= set(lines) and self.removed_nodes <= set(nodes)
+
+    def remove_lines(self, lines: Iterable[str]) -> "CollapseEngine":
+        """
+        Remove every connection of the given lines.
+
+        Parameters
+        ----------
+        lines : Iterable[str]
+            Line codes, padded to 5 characters. Unknown or already removed lines
+            are ignored.
+
+        Returns
+        -------
+        CollapseEngine
+            The same scenario, for chaining.
+        """
+        new_lines = [line for line in lines if line in self._line_edges and line not in self.removed_lines]
+        self.removed_lines.update(new_lines)
+        if not new_lines:
+            return self
+        edges = concatenate([self._line_edges[line] for line in new_lines])
+        self.edge_count -= bincount(edges, minlength=len(self.edge_count))
+        return self._remove_edges(((self.edge_count <= 0) & self.edge_alive).nonzero()[0])
+
+    def remove_nodes(self, nodes: Iterable[Hashable]) -> "CollapseEngine":
+        """
+        Remove the given nodes and every connection they take part in.
+
+        Parameters
+        ----------
+        nodes : Iterable[Hashable]
+            Original node ids. Already removed nodes are ignored.
+
+        Returns
+        -------
+        CollapseEngine
+            The same scenario, for chaining.
+
+        Raises
+        ------
+        KeyError
+            If any of the nodes is not in the baseline graph.
+        """
+        new_nodes = [node for node in nodes if node not in self.removed_nodes]
+        positions = self.graph.index_of(new_nodes)
+        self.removed_nodes.update(new_nodes)
+        if not len(positions):
+            return self
+        arcs = concatenate([arange(self.graph.indptr[p], self.graph.indptr[p + 1]) for p in positions])
+        edges = unique(self.graph.arc_edge[arcs])
+        return self._remove_edges(edges[self.edge_alive[edges]], dead_nodes=positions)
+
+    def _remove_edges(self, edges: ndarray, dead_nodes: Optional[ndarray]=None) -> "CollapseEngine":
+        """Apply the removal of alive `edges` to the components and the distances."""
+        graph = self.graph
+        previously_alive = self.edge_alive.copy()
+        self.edge_alive[edges] = False
+        ends = concatenate([graph.edge_src[edges], graph.edge_dst[edges]])
+        self.degree -= bincount(ends, minlength=len(self.degree))
+        dead = unique(concatenate([
+            ends[(self.degree[ends] == 0) & self.node_alive[ends]],
+            dead_nodes[self.node_alive[dead_nodes]] if dead_nodes is not None else zeros(0, dtype=int32),
+        ]))
+        self.node_alive[dead] = False
+        previous_labels = self.labels.copy()
+        adjacency = self._alive_adjacency()
+        _, labels = connected_components(adjacency, directed=False)
+        self.labels = where(self.node_alive, labels, -1).astype(int32)
+        ends = unique(ends[self.node_alive[ends]])
+        affected = self._affected_sources(ends, previously_alive, previous_labels)
+        self.stale |= affected
+        self.stale[dead] = False
+        self.last_update = {
+            "removed_edges": len(edges), "removed_nodes": len(dead), "affected_sources": int(affected.sum()),
+        }
+        return self
+
+    def refresh(self) -> "CollapseEngine":
+        """
+        Traverse again the sources flagged by the removals so far.
+
+        Returns
+        -------
+        CollapseEngine
+            The same scenario, with an exact hop matrix.
+        """
+        sources = self.stale.nonzero()[0].astype(int32)
+        adjacency = self._alive_adjacency()
+        for start in range(0, len(sources), self.batch_size):
+            batch = sources[start:start + self.batch_size]
+            dist = shortest_path(adjacency, directed=True, unweighted=True, indices=batch)
+            dist = where(isfinite(dist), dist, -1)
+            max_hops = dist.max() if dist.size else 0
+            for hop_dtype in (int8, int16, int32):
+                if iinfo(hop_dtype).max > max_hops:
+                    break
+            dist = dist.astype(hop_dtype)
+            if self._shared:
+                self._rows.update((source, row.copy()) for source, row in zip(batch.tolist(), dist))
+                self._overlaid[batch] = True
+            else:
+                self.distances.write(batch, dist)
+        self.stale[:] = False
+        self.last_update["recomputed_sources"] = len(sources)
+        return self
+
+    def _affected_sources(self, ends: ndarray, previously_alive: ndarray, previous_labels: ndarray) -> ndarray:
+        """
+        Sources for which some edge end of their own component loses all its
+        parents in the shortest-path DAG, which are the only ones whose distances
+        inside the component change. The hops are read as they were before the
+        removal. Stale rows are not read, they are already flagged.
+        """
+        graph = self.graph
+        affected = zeros(graph.number_of_nodes(), dtype=bool)
+        for head in ends.tolist():
+            arcs = arange(graph.indptr[head], graph.indptr[head + 1])
+            arcs = arcs[previously_alive[graph.arc_edge[arcs]]]
+            removed = ~self.edge_alive[graph.arc_edge[arcs]]
+            hops = self._hops(None, concatenate([[head], graph.indices[arcs]]), previous_labels)
+            hops[hops < 0] = -2
+            is_parent = hops[:, 1:] == hops[:, :1] - 1
+            parents = is_parent.sum(axis=1)
+            lost = is_parent[:, removed].sum(axis=1)
+            affected |= (
+                (hops[:, 0] > 0) & (lost > 0) & (lost == parents) & (self.labels == self.labels[head])
+            )
+        return affected & ~self.stale
+
+    def _hops(
+            self, rows: Optional[ndarray], columns: Optional[ndarray], labels: Optional[ndarray]=None
+            ) -> ndarray:
+        """
+        Hops from `rows` to `columns` (every node when None) with -1 for the
+        unreachable pairs, taking the rows traversed again by the scenario over
+        the shared matrix. Pairs apart in `labels`, by default the current
+        components, are unreachable.
+        """
+        labels = self.labels if labels is None else labels
+        hops = self.distances.data if rows is None else self.distances.data[rows]
+        hops = (hops if columns is None else hops[:, columns]).astype(int64)
+        hops[hops == self.distances.unreachable] = -1
+        sources = arange(len(labels)) if rows is None else rows
+        overlaid = self._overlaid[sources].nonzero()[0]
+        if len(overlaid):
+            block = stack([self._rows[source] for source in sources[overlaid].tolist()])
+            hops[overlaid] = block if columns is None else block[:, columns]
+        apart = labels[sources][:, None] != (labels if columns is None else labels[columns])
+        apart[labels[sources] < 0] = True
+        hops[apart] = -1
+        return hops
+
+    def _alive_adjacency(self) -> csr_matrix:
+        """Adjacency matrix of the alive edges."""
+        num_nodes = self.graph.number_of_nodes()
+        keep = self.edge_alive[self.graph.arc_edge]
+        indptr = zeros(num_nodes + 1, dtype=int64)
+        indptr[1:] = cumsum(bincount(self._arc_src[keep], minlength=num_nodes))
+        indices = self.graph.indices[keep]
+        return csr_matrix((ones(len(indices), dtype=float64), indices, indptr), shape=(num_nodes, num_nodes))
+
+    def components(self) -> List[Set[Hashable]]:
+        """Connected components of the scenario, from largest to smallest."""
+        alive = self.labels >= 0
+        labels = self.labels[alive]
+        nodes = self.graph.node_ids[alive]
+        order = labels.argsort(kind="stable")
+        labels, nodes = labels[order], nodes[order]
+        _, bounds = unique(labels, return_index=True)
+        groups = [set(group.tolist()) for group in _split(nodes, bounds)]
+        return sorted(groups, key=len, reverse=True)
+
+    def _positions(self, nodes: Optional[Iterable[Hashable]]) -> ndarray:
+        """Sorted positions of `nodes`, or of every alive node."""
+        if nodes is None:
+            return self.node_alive.nonzero()[0].astype(int32)
+        positions = self.graph.index_of(nodes)
+        positions.sort()
+        return positions
+
+    def statistics(self, nodes: Optional[Iterable[Hashable]]=None, betweenness: bool=False) -> Dict[str, Any]:
+        """
+        Hop based metrics of the subgraph induced by `nodes`.
+
+        Parameters
+        ----------
+        nodes : Iterable[Hashable], optional
+            Nodes of one connected component. Default is None, which uses every
+            alive node and requires the scenario to be connected.
+        betweenness : bool, optional
+            Whether to also return `betweeness_centrality`, accumulated over the
+            hop rows already kept instead of traversing the graph again.
+            Default is False.
+
+        Returns
+        -------
+        Dict[str, Any]
+            `num_nodes`, `num_edges`, `density`, `mean_sp`, `mean_net_sp`,
+            `diameter`, `closeness_centrality` and, when asked for,
+            `betweeness_centrality`, as `get_basic_statistics` returns them for
+            the graph given by `to_networkx(nodes)`.
+
+        Raises
+        ------
+        NetworkXError
+            If `nodes` is None and the scenario is not connected.
+        """
+        if nodes is None and len(unique(self.labels[self.node_alive])) > 1:
+            raise NetworkXError("Found infinite path length because the graph is not connected")
+        self.refresh()
+        positions = self._positions(nodes)
+        num_nodes = len(positions)
+        total_sp = zeros(num_nodes, dtype=int64)
+        eccentricity = zeros(num_nodes, dtype=int64)
+        chunk_rows = self.distances.chunk_rows()
+        for start in range(0, num_nodes, chunk_rows):
+            hops = self._hops(positions[start:start + chunk_rows], positions)
+            total_sp[start:start + chunk_rows] = hops.sum(axis=1)
+            eccentricity[start:start + chunk_rows] = hops.max(axis=1) if num_nodes else 0
+        with errstate(invalid="ignore", divide="ignore"):
+            mean_sp = total_sp / (num_nodes - 1)
+        ids = self.graph.node_ids[positions].tolist()
+        num_edges = len(self._edges(positions))
+        reachable = zeros(num_nodes, dtype=int64) + num_nodes
+        statistics = {
+            "num_nodes": num_nodes,
+            "num_edges": num_edges,
+            "density": 2 * num_edges / (num_nodes * (num_nodes - 1)) if num_nodes > 1 else 0,
+            "mean_sp": mean_sp.tolist(),
+            "mean_net_sp": float(mean_sp.mean()) if num_nodes else float("nan"),
+            "diameter": int(eccentricity.max()) if num_nodes else 0,
+            "closeness_centrality": dict(zip(ids, _closeness(reachable, total_sp, num_nodes).tolist())),
+        }
+        if betweenness:
+            statistics["betweeness_centrality"] = dict(zip(ids, self._betweenness(positions).tolist()))
+        return statistics
+
+    def _betweenness(self, positions: ndarray) -> ndarray:
+        """
+        Betweenness of the subgraph induced by `positions`, from the Brandes
+        accumulation over its alive arcs and the stored hop rows of its nodes.
+        """
+        graph = self.graph
+        num_nodes = len(positions)
+        inside = zeros(graph.number_of_nodes(), dtype=bool)
+        inside[positions] = True
+        index = zeros(graph.number_of_nodes(), dtype=int32)
+        index[positions] = arange(num_nodes, dtype=int32)
+        keep = self.edge_alive[graph.arc_edge] & inside[self._arc_src] & inside[graph.indices]
+        arc_src, arc_dst = index[self._arc_src[keep]], index[graph.indices[keep]]
+        dependency = zeros(num_nodes, dtype=float64)
+        for start in range(0, num_nodes, self.batch_size):
+            hops = self._hops(positions[start:start + self.batch_size], positions).astype(int32)
+            batch = arange(start, start + len(hops), dtype=int32)
+            dependency += _brandes_dependency(hops, batch, arc_src, arc_dst).sum(axis=0)
+        return _rescale_betweenness(dependency, num_nodes)
+
+    def efficiency(self) -> ndarray:
+        """Mean of `1/d` from every node to the other nodes, counting 0 for the unreachable ones."""
+        self.refresh()
+        num_nodes = self.graph.number_of_nodes()
+        nodes = arange(num_nodes)
+        efficiency = zeros(num_nodes, dtype=float64)
+        chunk_rows = self.distances.chunk_rows()
+        for start in range(0, num_nodes, chunk_rows):
+            hops = self._hops(nodes[start:start + chunk_rows], None)
+            inverse = divide(1.0, hops, out=zeros(hops.shape, dtype=float64), where=hops > 0)
+            efficiency[start:start + chunk_rows] = inverse.sum(axis=1) / max(num_nodes - 1, 1)
+        return efficiency
+
+    def _edges(self, positions: ndarray) -> ndarray:
+        """Alive edges with both ends among `positions`."""
+        inside = zeros(self.graph.number_of_nodes(), dtype=bool)
+        inside[positions] = True
+        keep = self.edge_alive & inside[self.graph.edge_src] & inside[self.graph.edge_dst]
+        return keep.nonzero()[0]
+
+    def subgraph(self, nodes: Optional[Iterable[Hashable]]=None) -> CSRGraph:
+        """
+        Array-backed graph of the scenario restricted to `nodes`.
+
+        Parameters
+        ----------
+        nodes : Iterable[Hashable], optional
+            Nodes to keep. Default is None, which keeps every alive node.
+
+        Returns
+        -------
+        CSRGraph
+            Graph with the alive edges among `nodes`, with its nodes in baseline order.
+        """
+        graph = self.graph
+        positions = self._positions(nodes)
+        edges = self._edges(positions)
+        index = zeros(graph.number_of_nodes(), dtype=int32)
+        index[positions] = arange(len(positions), dtype=int32)
+        return CSRGraph(
+            node_ids=graph.node_ids[positions], edge_src=index[graph.edge_src[edges]],
+            edge_dst=index[graph.edge_dst[edges]], weight=graph.weight[edges],
+            pos=graph.pos[positions] if graph.pos is not None else None
+        )
+
+    def to_networkx(self, nodes: Optional[Iterable[Hashable]]=None) -> Graph:
+        """
+        Build the NetworkX graph of the scenario restricted to `nodes`.
+
+        Parameters
+        ----------
+        nodes : Iterable[Hashable], optional
+            Nodes to keep. Default is None, which keeps every alive node.
+
+        Returns
+        -------
+        Graph
+            Graph with the `pos` node attribute and the `weight` edge attribute,
+            with its nodes in baseline order.
+        """
+        return self.subgraph(nodes).to_networkx()
+
+
+def _split(values: ndarray, bounds: ndarray) -> List[ndarray]:
+    """Slices of `values` starting at every index of `bounds`."""
+    ends = concatenate([bounds[1:], [len(values)]])
+    return [values[lower:upper] for lower, upper in zip(bounds, ends)]
@@ -0,0 +1,831 @@
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from os import cpu_count, replace
+from typing import Dict, Hashable, Iterator, List, Optional, Union
+
+from networkx import Graph, DiGraph
+
+from numpy import (
+    add, arange, argsort, asarray, bitwise_or, concatenate, dtype, errstate, float64, iinfo, int16,
+    int32, int64, isfinite, left_shift, maximum, nan, ndarray, ones, repeat, searchsorted, sort, sqrt,
+    uint8, uint16, uint32, uint64, unpackbits, where, zeros,
+)
+from numpy.linalg import eig
+from numpy.linalg import norm as npnorm
+from numpy.lib.format import open_memmap
+from numpy.random import default_rng
+from scipy.sparse.csgraph import shortest_path
+from scipy.sparse.linalg import ArpackNoConvergence, LinearOperator, eigs, eigsh, lobpcg
+from scipy.stats import norm
+
+from toolbox.graph import CSRGraph
+
+
+class DistanceMatrix:
+    """
+    Compact all-pairs hop matrix indexed by node position.
+
+    Hops are stored with the smallest unsigned type able to hold them, starting
+    at uint8 and promoting to uint16 (or uint32) only when a longer path shows up.
+    The largest value of the type marks unreachable pairs.
+
+    Parameters
+    ----------
+    num_nodes : int
+        Number of nodes of the graph.
+    path : str, optional
+        `.npy` file backing the matrix as a memory map. When None the matrix is
+        kept in memory. Default is None.
+
+    Examples
+    --------
+    >>> import networkx as nx
+    >>> G = nx.path_graph(5)
+    >>> distances = bfs_sweep(CSRGraph.from_networkx(G), keep_distances=True)["distances"]
+    >>> distances.data.dtype, distances[0, 4]
+    (dtype('uint8'), 4)
+    >>> distances.mean_sp()
+    array([2.5 , 1.75, 1.5 , 1.75, 2.5 ])
+
+    Notes
+    -----
+    - A matrix saved to `path` can be reopened read-only, without copying, with
+      `numpy.load(path, mmap_mode="r")`.
+    """
+
+    dtypes = (uint8, uint16, uint32)
+
+    def __init__(self, num_nodes: int, path: Optional[str]=None) -> None:
+        self.num_nodes = num_nodes
+        self.path = path
+        self.data = self._allocate(dtype(uint8))
+
+    @property
+    def unreachable(self) -> int:
+        """Value marking the pairs without a path."""
+        return int(iinfo(self.data.dtype).max)
+
+    def _allocate(self, hop_dtype: dtype, suffix: str=".tmp") -> ndarray:
+        """Create an empty matrix of the given type, in memory or memory-mapped."""
+        shape = (self.num_nodes, self.num_nodes)
+        if self.path is None:
+            return zeros(shape, dtype=hop_dtype)
+        return open_memmap(f"{self.path}{suffix}", mode="w+", dtype=hop_dtype, shape=shape)
+
+    def _promote(self, max_hops: int) -> None:
+        """Move the matrix to the smallest type that can hold `max_hops`."""
+        for hop_dtype in self.dtypes:
+            if iinfo(hop_dtype).max > max_hops:
+                break
+        data = self._allocate(dtype(hop_dtype), suffix=".promote")
+        old_unreachable = self.unreachable
+        for start in range(0, self.num_nodes, self.chunk_rows()):
+            chunk = self.data[start:start + self.chunk_rows()]
+            data[start:start + len(chunk)] = where(chunk == old_unreachable, iinfo(hop_dtype).max, chunk)
+        if self.path is not None:
+            data.flush()
+            replace(f"{self.path}.promote", f"{self.path}.tmp")
+            data = open_memmap(f"{self.path}.tmp", mode="r+")
+        self.data = data
+
+    def chunk_rows(self) -> int:
+        """Rows reduced at once, keeping temporaries around 64 MB."""
+        return max(1, (64 << 20) // (8 * max(self.num_nodes, 1)))
+
+    def write(self, rows: ndarray, dist: ndarray) -> None:
+        """
+        Store the hop rows of some sources.
+
+        Parameters
+        ----------
+        rows : ndarray
+            Node positions of the sources.
+        dist : ndarray
+            Hop rows of the sources with -1 for unreachable nodes.
+        """
+        max_hops = int(dist.max()) if dist.size else 0
+        if max_hops >= self.unreachable:
+            self._promote(max_hops)
+        self.data[rows] = where(dist < 0, self.unreachable, dist)
+
+    def close(self) -> None:
+        """Flush a memory-mapped matrix and move it to its final `path`."""
+        if self.path is not None:
+            self.data.flush()
+            replace(f"{self.path}.tmp", self.path)
+            self.data = open_memmap(self.path, mode="r")
+
+    def copy(self) -> "DistanceMatrix":
+        """In-memory copy of the matrix that can be written independently."""
+        distances = self.__class__.__new__(self.__class__)
+        distances.num_nodes = self.num_nodes
+        distances.path = None
+        distances.data = self.data.copy()
+        return distances
+
+    @classmethod
+    def load(cls, path: str) -> "DistanceMatrix":
+        """Open a matrix saved at `path` as a read-only memory map."""
+        data = open_memmap(path, mode="r")
+        distances = cls.__new__(cls)
+        distances.num_nodes = data.shape[0]
+        distances.path = path
+        distances.data = data
+        return distances
+
+    def __getitem__(self, key: Union[int, tuple, slice]) -> Union[int, ndarray]:
+        return self.data[key]
+
+    def _reduce(self, reducer) -> ndarray:
+        """Apply `reducer(hops, reached)` to row chunks and stack the results."""
+        result = []
+        for start in range(0, self.num_nodes, self.chunk_rows()):
+            chunk = self.data[start:start + self.chunk_rows()]
+            reached = chunk != self.unreachable
+            result.append(reducer(where(reached, chunk, 0).astype(int64), reached))
+        if not result:
+            return zeros(0, dtype=float64)
+        return concatenate(result)
+
+    def reachable(self) -> ndarray:
+        """Nodes reached from every node, including itself."""
+        return self._reduce(lambda hops, reached: reached.sum(axis=1))
+
+    def eccentricity(self) -> ndarray:
+        """Largest hop count from every node to the nodes it reaches."""
+        return self._reduce(lambda hops, reached: hops.max(axis=1))
+
+    def mean_sp(self) -> ndarray:
+        """Mean hop count from every node to the other nodes it reaches."""
+        def reducer(hops, reached):
+            others = reached.sum(axis=1) - 1
+            with errstate(invalid="ignore", divide="ignore"):
+                return where(others > 0, hops.sum(axis=1) / others, nan)
+        return self._reduce(reducer)
+
+    def efficiency(self) -> ndarray:
+        """Mean of `1/d` from every node to the other nodes, counting 0 for the unreachable ones."""
+        def reducer(hops, reached):
+            with errstate(divide="ignore"):
+                inverse = where(hops > 0, 1 / hops, 0.0)
+            return inverse.sum(axis=1) / max(self.num_nodes - 1, 1)
+        return self._reduce(reducer)
+
+
+def bfs_sweep(
+        graph: CSRGraph, batch_size: int=128, keep_distances: bool=False,
+        distances_path: Optional[str]=None, processes: int=1, betweenness: bool=True,
+        weighted: bool=False
+        ) -> Dict[str, Union[ndarray, DistanceMatrix]]:
+    """
+    Run one BFS per source node and collect every path based metric at once.
+
+    Parameters
+    ----------
+    graph : CSRGraph
+        The input graph. Edge weights are ignored unless `weighted` is True.
+    batch_size : int, optional
+        Number of sources traversed together. Bigger batches use more memory
+        (about `batch_size * 2 * num_edges` integers) and fewer Python steps.
+        Default is 128.
+    keep_distances : bool, optional
+        Whether to return the full `(n, n)` hop matrix. Default is False.
+    distances_path : str, optional
+        `.npy` file where the hop matrix is memory-mapped when `keep_distances`
+        is True. Default is None, which keeps it in memory.
+    processes : int, optional
+        Number of worker processes sharing the batches of sources. Default is 1,
+        which runs everything in the current process.
+    betweenness : bool, optional
+        Whether to accumulate the Brandes dependencies. Skipping them leaves only
+        the BFS itself, which is the cheaper half of the sweep. Default is True.
+    weighted : bool, optional
+        Whether to use the edge weights as lengths, running Dijkstra instead of
+        BFS. Distances, `mean_sp`, `eccentricity` and `closeness` are then
+        floats. It can not be combined with `betweenness` nor `keep_distances`.
+        Default is False.
+
+    Returns
+    -------
+    Dict[str, ndarray]
+        Arrays indexed by node position:
+
+        - `reachable`: nodes reached from each node, including itself.
+        - `mean_sp`: mean distance from each node to the nodes it reaches.
+        - `eccentricity`: largest distance from each node to the nodes it reaches.
+        - `closeness`: closeness centrality, as `networkx.closeness_centrality`.
+        - `betweenness`: normalized betweenness centrality, as
+          `networkx.betweenness_centrality`. Only present when `betweenness` is True.
+        - `distances`: `DistanceMatrix` with every hop count. Only present
+          when `keep_distances` is True.
+
+    Examples
+    --------
+    >>> import networkx as nx
+    >>> G = nx.Graph()
+    >>> G.add_edges_from([(1, 2), (2, 3), (3, 4), (4, 5)])
+    >>> sweep = bfs_sweep(CSRGraph.from_networkx(G))
+    >>> sweep["eccentricity"]
+    array([4, 3, 2, 3, 4], dtype=int32)
+
+    Notes
+    -----
+    - Distances come from the compiled BFS of `scipy.sparse.csgraph`. The
+      shortest-path DAG of every source is read from those distances and the
+      Brandes path counts and dependencies are accumulated one BFS level at a
+      time for the whole batch, so each source is traversed exactly once.
+    - Closeness uses the distances arriving to every node, which for directed
+      graphs matches NetworkX reversing the graph.
+    - The weighted sweep uses the compiled Dijkstra of `scipy.sparse.csgraph`
+      with the same batches and process pool, and matches the NetworkX metrics
+      computed with `distance="weight"` or `weight="weight"`.
+
+    Raises
+    ------
+    ValueError
+        If `weighted` is combined with `betweenness` or `keep_distances`, or
+        some weight is negative or not finite.
+    """
+    num_nodes = graph.number_of_nodes()
+    if weighted and (betweenness or keep_distances):
+        raise ValueError("The weighted sweep does not compute betweenness nor keep the distances.")
+    if weighted and not (isfinite(graph.weight).all() and (graph.weight >= 0).all()):
+        raise ValueError("The weighted sweep needs finite, non negative edge weights.")
+    distances = DistanceMatrix(num_nodes, path=distances_path) if keep_distances else None
+    totals = _accumulate_sweep(
+        graph, arange(num_nodes, dtype=int32), batch_size, distances=distances,
+        processes=processes, betweenness=betweenness, weighted=weighted
+    )
+    reachable = totals["reachable"]
+    with errstate(invalid="ignore", divide="ignore"):
+        mean_sp = totals["total_sp"] / (reachable - 1)
+    sweep = {
+        "reachable": reachable,
+        "mean_sp": where(reachable > 1, mean_sp, nan),
+        "eccentricity": totals["eccentricity"],
+        "closeness": _closeness(totals["in_reachable"], totals["in_total_sp"], num_nodes),
+    }
+    if betweenness:
+        sweep["betweenness"] = _rescale_betweenness(totals["dependency"], num_nodes)
+    if keep_distances:
+        distances.close()
+        sweep["distances"] = distances
+    return sweep
+
+
+def approximate_sweep(
+        graph: CSRGraph, k: int, seed: int=42, confidence: float=0.95,
+        batch_size: int=128, processes: int=1
+        ) -> Dict[str, Union[ndarray, float, int, tuple]]:
+    """
+    Estimate the path based metrics of `bfs_sweep` from `k` sampled sources.
+
+    Parameters
+    ----------
+    graph : CSRGraph
+        The input graph. It must be undirected. Edge weights are ignored.
+    k : int
+        Number of pivot nodes used as BFS sources. With `k` equal to the number
+        of nodes the result is exact and every error is 0.
+    seed : int, optional
+        Seed of the pivot sampling, so that results are reproducible. Default is 42.
+    confidence : float, optional
+        Confidence level of the reported error bounds. Default is 0.95.
+    batch_size : int, optional
+        Number of sources traversed together. Default is 128.
+    processes : int, optional
+        Number of worker processes. Default is 1.
+
+    Returns
+    -------
+    Dict[str, Union[ndarray, float, int, tuple]]
+        - `sources`: positions of the sampled pivots.
+        - `mean_sp`, `closeness`, `betweenness`: estimates indexed by node position.
+        - `mean_sp_error`, `closeness_error`, `betweenness_error`: half width of
+          the confidence interval of every estimate.
+        - `mean_net_sp`, `mean_net_sp_error`: network mean shortest path and its
+          half width.
+        - `diameter`: largest eccentricity among the pivots.
+        - `diameter_bounds`: `(lower, upper)` bounds of the true diameter.
+        - `reachable`: nodes reached from every pivot, including itself.
+
+    Raises
+    ------
+    ValueError
+        If the graph is directed or `k` is not between 1 and the number of nodes.
+
+    Examples
+    --------
+    >>> import networkx as nx
+    >>> sweep = approximate_sweep(CSRGraph.from_networkx(nx.path_graph(200)), k=50)
+    >>> sweep["diameter_bounds"]
+    (199, 199)
+
+    Notes
+    -----
+    - The pivots are sampled without replacement. Betweenness is the Brandes
+      dependency of the pivots scaled by `n / k`, as in Brandes and Pich (2007).
+      Closeness and `mean_sp` of a node come from its distances to the pivots,
+      except for the pivots themselves, whose rows are exact.
+    - Error bounds are normal approximation intervals with finite population
+      correction, so they shrink to 0 as `k` gets close to `n`. They are
+      optimistic for the betweenness of nodes whose load comes from a handful of
+      sources (for instance the neighbour of a terminal stop), because the
+      dependency distribution of those nodes is heavy tailed.
+    - The diameter lies between the largest pivot eccentricity and twice the
+      smallest one. When some pivot does not reach every node the graph is
+      disconnected, the eccentricities refer to different components and the
+      upper bound falls back to `n - 1`.
+    """
+    num_nodes = graph.number_of_nodes()
+    if graph.is_directed():
+        raise ValueError("The approximate sweep only supports undirected graphs.")
+    if not 1 <= k <= num_nodes:
+        raise ValueError((
+            f"You have passed k={k} and it has to be between 1 and the number of nodes ({num_nodes})."
+        ))
+    sources = sort(default_rng(seed).choice(num_nodes, size=k, replace=False)).astype(int32)
+    totals = _accumulate_sweep(graph, sources, batch_size, processes=processes, moments=True)
+    z_score = norm.ppf(0.5 + confidence / 2)
+    correction = sqrt(1 - k / num_nodes)
+    is_pivot = zeros(num_nodes, dtype=bool)
+    is_pivot[sources] = True
+
+    # Distances from the pivots to every node (the graph is undirected).
+    samples = totals["in_reachable"] - is_pivot
+    with errstate(invalid="ignore", divide="ignore"):
+        mean_sp = totals["in_total_sp"] / samples
+        spread = sqrt(maximum(totals["in_total_sq"] / samples - mean_sp ** 2, 0) * samples / (samples - 1))
+        mean_sp_error = z_score * spread / sqrt(samples) * correction
+        reach_ratio = samples / (k - is_pivot)
+        closeness = reach_ratio / mean_sp
+        closeness_error = closeness * mean_sp_error / mean_sp
+    mean_sp = where(samples > 0, mean_sp, nan)
+    mean_sp_error = where(samples > 1, mean_sp_error, nan)
+    closeness = where(samples > 0, closeness, 0.0)
+    closeness_error = where(samples > 1, closeness_error, nan)
+    pivot_mean_sp = totals["total_sp"][sources] / maximum(totals["reachable"][sources] - 1, 1)
+    mean_sp[sources] = where(totals["reachable"][sources] > 1, pivot_mean_sp, nan)
+    mean_sp_error[sources] = 0.0
+    closeness[sources] = _closeness(
+        totals["reachable"][sources], totals["total_sp"][sources], num_nodes
+    )
+    closeness_error[sources] = 0.0
+
+    dependency_mean = totals["dependency"] / k
+    dependency_var = maximum(totals["dependency_sq"] / k - dependency_mean ** 2, 0) * k / max(k - 1, 1)
+    scale = num_nodes * _rescale_betweenness(1.0, num_nodes)
+    eccentricity = totals["eccentricity"][sources]
+    upper_bound = num_nodes - 1
+    if (totals["reachable"][sources] == num_nodes).all():
+        upper_bound = int(min(2 * eccentricity.min(), upper_bound))
+    pivot_mean_sp = mean_sp[sources]
+    return {
+        "sources": sources,
+        "reachable": totals["reachable"][sources],
+        "mean_sp": mean_sp,
+        "mean_sp_error": mean_sp_error,
+        "closeness": closeness,
+        "closeness_error": closeness_error,
+        "betweenness": dependency_mean * scale,
+        "betweenness_error": z_score * sqrt(dependency_var / k) * correction * scale,
+        "mean_net_sp": float(pivot_mean_sp.mean()),
+        "mean_net_sp_error": float(
+            z_score * pivot_mean_sp.std(ddof=1) / sqrt(k) * correction if k > 1 else nan
+        ),
+        "diameter": int(eccentricity.max()),
+        "diameter_bounds": (int(eccentricity.max()), upper_bound),
+    }
+
+
+def efficiency_sweep(
+        graph: CSRGraph, batch_size: int=4096, processes: int=1
+        ) -> Dict[str, Union[ndarray, float]]:
+    """
+    Efficiency and reachability over every pair of nodes, connected or not.
+
+    Parameters
+    ----------
+    graph : CSRGraph
+        The input graph, which may be disconnected. Edge weights are ignored.
+    batch_size : int, optional
+        Number of sources traversed together, rounded up to a multiple of 64.
+        Memory grows as `num_nodes * batch_size / 8` bytes. Default is 4096.
+    processes : int, optional
+        Number of worker processes sharing the batches of sources. Default is 1.
+
+    Returns
+    -------
+    Dict[str, Union[ndarray, float]]
+        - `reachable`: nodes reached from each node, including itself.
+        - `mean_sp`: mean distance from each node to the nodes it reaches, NaN
+          for nodes reaching no other node.
+        - `efficiency`: mean of `1/d` from each node to every other node,
+          counting 0 for the nodes it does not reach.
+        - `global_efficiency`: mean of `efficiency`, as
+          `networkx.global_efficiency` (Latora and Marchiori, 2001).
+        - `reachability`: share of the ordered pairs of distinct nodes joined
+          by a path.
+
+    Examples
+    --------
+    >>> import networkx as nx
+    >>> G = nx.Graph([(1, 2), (2, 3), (4, 5)])
+    >>> sweep = efficiency_sweep(CSRGraph.from_networkx(G))
+    >>> sweep["global_efficiency"], sweep["reachability"]
+    (0.35, 0.4)
+
+    Notes
+    -----
+    - Bit-parallel BFS: every node holds one bit per source of the batch,
+      packed in 64-bit words, telling whether the source already reached it.
+      One BFS level for the whole batch is a gather of the frontier words of
+      the neighbours and a bitwise OR per node, so 64 sources cost about one
+      word operation per arc and level.
+    - Bits move against the arcs, so the bits gathered by a node are the
+      sources it reaches and every count refers to paths leaving the node, also
+      for directed graphs.
+    - Unreachable pairs add 0 to the efficiency instead of breaking it, so
+      splitting a network lowers the efficiency as much as it lengthens paths.
+    """
+    num_nodes = graph.number_of_nodes()
+    words = max(1, -(-batch_size // 64))
+    batches = [
+        arange(start, min(start + 64 * words, num_nodes), dtype=int32)
+        for start in range(0, num_nodes, 64 * words)
+    ]
+    totals = {key: zeros(num_nodes, dtype=float64) for key in ("reached", "total_sp", "inverse_sp")}
+    for batch_totals in _map_tasks(graph, _efficiency_batch, batches, processes):
+        for key, values in batch_totals.items():
+            totals[key] += values
+    pairs = num_nodes * (num_nodes - 1)
+    with errstate(invalid="ignore", divide="ignore"):
+        mean_sp = where(totals["reached"] > 0, totals["total_sp"] / totals["reached"], nan)
+    efficiency = totals["inverse_sp"] / max(num_nodes - 1, 1)
+    return {
+        "reachable": totals["reached"].astype(int64) + 1,
+        "mean_sp": mean_sp,
+        "efficiency": efficiency,
+        "global_efficiency": float(totals["inverse_sp"].sum() / pairs) if pairs else 0.0,
+        "reachability": float(totals["reached"].sum() / pairs) if pairs else 0.0,
+    }
+
+
+def _accumulate_sweep(
+        graph: CSRGraph, sources: ndarray, batch_size: int, distances: Optional[DistanceMatrix]=None,
+        processes: int=1, moments: bool=False, betweenness: bool=True, weighted: bool=False
+        ) -> Dict[str, ndarray]:
+    """
+    Sum the partial sweeps of every batch of `sources`, in batch order.
+
+    Row totals (`reachable`, `total_sp`, `eccentricity`) are only filled for the
+    sources. Column totals (`in_*`) and `dependency` add up the contribution of
+    every source, and with `moments` their sums of squares are kept as well.
+    Without `betweenness` the dependencies are left at 0. With `weighted` the
+    path lengths are summed as floats.
+    """
+    num_nodes = graph.number_of_nodes()
+    length_dtype = float64 if weighted else int64
+    totals = {
+        "reachable": zeros(num_nodes, dtype=int64),
+        "total_sp": zeros(num_nodes, dtype=length_dtype),
+        "eccentricity": zeros(num_nodes, dtype=float64 if weighted else int32),
+        "in_reachable": zeros(num_nodes, dtype=int64),
+        "in_total_sp": zeros(num_nodes, dtype=length_dtype),
+        "dependency": zeros(num_nodes, dtype=float64),
+    }
+    if moments:
+        totals["in_total_sq"] = zeros(num_nodes, dtype=length_dtype)
+        totals["dependency_sq"] = zeros(num_nodes, dtype=float64)
+    batches = [sources[start:start + batch_size] for start in range(0, len(sources), batch_size)]
+    keep_distances = distances is not None
+    batch_sweeps = _map_batches(graph, batches, keep_distances, moments, betweenness, processes, weighted)
+    for batch, batch_sweep in zip(batches, batch_sweeps):
+        for key in ("reachable", "total_sp", "eccentricity"):
+            totals[key][batch] = batch_sweep[key]
+        for key in totals.keys() - {"reachable", "total_sp", "eccentricity"}:
+            totals[key] += batch_sweep[key]
+        if keep_distances:
+            distances.write(batch, batch_sweep["dist"])
+    return totals
+
+
+def betweenness_centrality(
+        network: Union[Graph, DiGraph, CSRGraph], processes: Optional[int]=None, batch_size: int=128
+        ) -> Dict[Hashable, float]:
+    """
+    Normalized betweenness centrality computed on a process pool.
+
+    Parameters
+    ----------
+    network : Graph, DiGraph or CSRGraph
+        The input graph. Edge weights are ignored.
+    processes : int, optional
+        Number of worker processes. Default is None, which uses every core.
+    batch_size : int, optional
+        Number of sources handled by a worker task. Default is 128.
+
+    Returns
+    -------
+    Dict[Hashable, float]
+        Betweenness centrality of every node, as `networkx.betweenness_centrality`.
+
+    Examples
+    --------
+    >>> import networkx as nx
+    >>> betweenness_centrality(nx.path_graph(4), processes=2)
+    {0: 0.0, 1: 0.6666666666666666, 2: 0.6666666666666666, 3: 0.0}
+
+    Notes
+    -----
+    - Every worker receives the graph once and accumulates the Brandes
+      dependencies of its batches of sources. The partial dependencies are
+      summed in batch order, so the result does not depend on `processes`.
+    """
+    graph = network if isinstance(network, CSRGraph) else CSRGraph.from_networkx(network)
+    sweep = bfs_sweep(graph=graph, batch_size=batch_size, processes=processes or cpu_count())
+    return dict(zip(graph.node_ids.tolist(), sweep["betweenness"].tolist()))
+
+
+def leading_eigenvector(
+        graph: CSRGraph, start: Optional[ndarray]=None, method: str="arpack", tol: float=1e-6,
+        max_iter: Optional[int]=None
+        ) -> Dict[str, Union[ndarray, float, int, bool, str]]:
+    """
+    Eigenvector centrality from a sparse eigensolver on the adjacency matrix.
+
+    Parameters
+    ----------
+    graph : CSRGraph
+        The input graph. Edge weights are ignored.
+    start : ndarray, optional
+        Warm start vector indexed by node position, for instance the solution of
+        a similar graph. Default is None, which starts from a constant vector.
+    method : str, optional
+        'arpack' for implicitly restarted Lanczos (Arnoldi for directed graphs)
+        or 'lobpcg', only for undirected graphs. Default is 'arpack'.
+    tol : float, optional
+        Relative tolerance of the eigenvalue. Default is 1e-6.
+    max_iter : int, optional
+        Largest number of solver iterations. Default is None, the solver default.
+
+    Returns
+    -------
+    Dict[str, Union[ndarray, float, int, bool, str]]
+        - `centrality`: positive eigenvector with unit Euclidean norm, indexed by
+          node position, as `networkx.eigenvector_centrality`.
+        - `eigenvalue`: leading eigenvalue of the adjacency matrix.
+        - `matvecs`: products with the adjacency matrix done by the solver.
+        - `iterations`: solver iterations (equal to `matvecs` for ARPACK).
+        - `residual`: relative residual `|Ax - lx| / l` of the result.
+        - `converged`: whether the solver reached `tol`.
+        - `method`: solver used, 'dense' for graphs too small for the iterative ones.
+
+    Raises
+    ------
+    ValueError
+        If `method` is not valid, 'lobpcg' is used with a directed graph or
+        the graph is empty.
+
+    Examples
+    --------
+    >>> import networkx as nx
+    >>> result = leading_eigenvector(CSRGraph.from_networkx(nx.path_graph(50)))
+    >>> round(result["eigenvalue"], 4), result["converged"]
+    (1.9962, True)
+
+    Notes
+    -----
+    - For directed graphs the in-edges are used, as NetworkX does, and the
+      leading eigenvector of the transposed adjacency is returned.
+    - A warm start close to the solution cuts the number of products: restarting
+      from the baseline network after removing a few nodes typically needs a
+      fraction of the products of a cold start.
+    """
+    if method not in ("arpack", "lobpcg"):
+        raise ValueError(f"You have passed method={method} and it has to be 'arpack' or 'lobpcg'.")
+    if method == "lobpcg" and graph.is_directed():
+        raise ValueError("The 'lobpcg' method only supports undirected graphs.")
+    num_nodes = graph.number_of_nodes()
+    if num_nodes == 0:
+        raise ValueError("Cannot compute the eigenvector centrality of an empty graph.")
+    matrix = graph.adjacency().T.tocsr() if graph.is_directed() else graph.adjacency()
+    start = ones(num_nodes, dtype=float64) if start is None else asarray(start, dtype=float64)
+    if not start.any():
+        start = ones(num_nodes, dtype=float64)
+    matvecs = [0]
+
+    def matvec(vector: ndarray) -> ndarray:
+        matvecs[0] += vector.shape[1] if vector.ndim > 1 else 1
+        return matrix @ vector
+
+    operator = LinearOperator(matrix.shape, matvec=matvec, matmat=matvec, dtype=float64)
+    converged, iterations = True, None
+    if num_nodes <= 8:
+        method = "dense"
+        values, vectors = eig(matrix.toarray())
+    elif method == "lobpcg":
+        values, vectors, history = lobpcg(
+            operator, start[:, None], largest=True, tol=tol, maxiter=max_iter or 500,
+            retResidualNormsHistory=True
+        )
+        iterations = len(history)
+    else:
+        solver = partial(eigs, which="LR") if graph.is_directed() else partial(eigsh, which="LA")
+        try:
+            values, vectors = solver(operator, k=1, v0=start, tol=tol, maxiter=max_iter)
+        except ArpackNoConvergence as err:
+            if not err.eigenvalues.size:
+                raise
+            values, vectors, converged = err.eigenvalues, err.eigenvectors, False
+    leading = values.real.argmax()
+    eigenvalue = float(values[leading].real)
+    vector = vectors[:, leading].real
+    vector = vector / npnorm(vector) * (1 if vector.sum() >= 0 else -1)
+    residual = float(npnorm(matrix @ vector - eigenvalue * vector) / max(abs(eigenvalue), 1e-300))
+    if method == "lobpcg":
+        converged = residual <= sqrt(tol)
+    return {
+        "centrality": vector,
+        "eigenvalue": eigenvalue,
+        "matvecs": matvecs[0],
+        "iterations": iterations if iterations is not None else matvecs[0],
+        "residual": residual,
+        "converged": bool(converged),
+        "method": method,
+    }
+
+
+_WORKER_GRAPH = {}
+_POPCOUNT = unpackbits(arange(256, dtype=uint8)[:, None], axis=1).sum(axis=1).astype(uint8)
+
+
+def _init_worker(graph: CSRGraph) -> None:
+    """Keep the read-only graph and its arc arrays in the worker process."""
+    _WORKER_GRAPH["graph"] = graph
+    _WORKER_GRAPH["adjacency"] = graph.adjacency()
+    _WORKER_GRAPH["weighted_adjacency"] = graph.adjacency(weighted=True)
+    _WORKER_GRAPH["arc_src"] = repeat(arange(graph.number_of_nodes(), dtype=int32), graph.out_degree())
+
+
+def _map_batches(
+        graph: CSRGraph, batches: List[ndarray], keep_distances: bool, moments: bool,
+        betweenness: bool, processes: int, weighted: bool=False
+        ) -> Iterator[dict]:
+    """Yield the partial sweep of every batch, in order, serially or on a process pool."""
+    task = partial(
+        _sweep_batch, keep_distances=keep_distances, moments=moments,
+        betweenness=betweenness, weighted=weighted
+    )
+    yield from _map_tasks(graph, task, batches, processes)
+
+
+def _map_tasks(graph: CSRGraph, task, batches: List[ndarray], processes: int) -> Iterator[dict]:
+    """Yield `task(batch)` for every batch, in order, with the graph held by the worker."""
+    if processes <= 1 or len(batches) <= 1:
+        _init_worker(graph)
+        try:
+            yield from map(task, batches)
+        finally:
+            _WORKER_GRAPH.clear()
+        return
+    with ProcessPoolExecutor(
+            max_workers=min(processes, len(batches)), initializer=_init_worker, initargs=(graph,)
+            ) as executor:
+        yield from executor.map(task, batches)
+
+
+def _sweep_batch(
+        batch: ndarray, keep_distances: bool=False, moments: bool=False, betweenness: bool=True,
+        weighted: bool=False
+        ) -> dict:
+    """BFS (or Dijkstra when `weighted`) from every source of `batch` over the graph held by the worker."""
+    graph = _WORKER_GRAPH["graph"]
+    if weighted:
+        return _weighted_batch(batch, moments)
+    dist = shortest_path(_WORKER_GRAPH["adjacency"], directed=True, unweighted=True, indices=batch)
+    reached = isfinite(dist)
+    hop_dtype = int16 if graph.number_of_nodes() <= iinfo(int16).max else int32
+    dist = where(reached, dist, -1).astype(hop_dtype)
+    hops = where(reached, dist, 0).astype(int64)
+    if betweenness:
+        dependency = _brandes_dependency(dist, batch, _WORKER_GRAPH["arc_src"], graph.indices)
+    else:
+        dependency = zeros((len(batch), graph.number_of_nodes()), dtype=float64)
+    batch_sweep = {
+        "reachable": reached.sum(axis=1),
+        "total_sp": hops.sum(axis=1),
+        "eccentricity": dist.max(axis=1),
+        "in_reachable": reached.sum(axis=0),
+        "in_total_sp": hops.sum(axis=0),
+        "dependency": dependency.sum(axis=0),
+    }
+    if moments:
+        batch_sweep["in_total_sq"] = (hops ** 2).sum(axis=0)
+        batch_sweep["dependency_sq"] = (dependency ** 2).sum(axis=0)
+    if keep_distances:
+        batch_sweep["dist"] = dist
+    return batch_sweep
+
+
+def _weighted_batch(batch: ndarray, moments: bool=False) -> dict:
+    """Dijkstra from every source of `batch` over the weighted graph held by the worker."""
+    graph = _WORKER_GRAPH["graph"]
+    dist = shortest_path(_WORKER_GRAPH["weighted_adjacency"], method="D", directed=True, indices=batch)
+    reached = isfinite(dist)
+    lengths = where(reached, dist, 0.0)
+    batch_sweep = {
+        "reachable": reached.sum(axis=1),
+        "total_sp": lengths.sum(axis=1),
+        "eccentricity": lengths.max(axis=1),
+        "in_reachable": reached.sum(axis=0),
+        "in_total_sp": lengths.sum(axis=0),
+        "dependency": zeros(graph.number_of_nodes(), dtype=float64),
+    }
+    if moments:
+        batch_sweep["in_total_sq"] = (lengths ** 2).sum(axis=0)
+        batch_sweep["dependency_sq"] = zeros(graph.number_of_nodes(), dtype=float64)
+    return batch_sweep
+
+
+def _efficiency_batch(batch: ndarray) -> dict:
+    """Pairs reached, summed distances and summed inverse distances of every node towards `batch`."""
+    graph = _WORKER_GRAPH["graph"]
+    num_nodes = graph.number_of_nodes()
+    indptr, indices = graph.indptr, graph.indices
+    words = -(-len(batch) // 64)
+    bits = arange(len(batch))
+    visited = zeros((num_nodes, words), dtype=uint64)
+    visited[batch, bits // 64] = left_shift(uint64(1), (bits % 64).astype(uint64))
+    frontier = visited.copy()
+    rows = (indptr[1:] > indptr[:-1]).nonzero()[0]
+    totals = {key: zeros(num_nodes, dtype=float64) for key in ("reached", "total_sp", "inverse_sp")}
+    level = 0
+    while True:
+        level += 1
+        gathered = zeros((num_nodes, words), dtype=uint64)
+        if len(rows):
+            gathered[rows] = bitwise_or.reduceat(frontier[indices], indptr[rows], axis=0)
+        frontier = gathered & ~visited
+        counts = _POPCOUNT[frontier.view(uint8)].sum(axis=1, dtype=int64)
+        if not counts.any():
+            return totals
+        visited |= frontier
+        totals["reached"] += counts
+        totals["total_sp"] += level * counts
+        totals["inverse_sp"] += counts / level
+
+
+def _brandes_dependency(dist: ndarray, batch: ndarray, arc_src: ndarray, arc_dst: ndarray) -> ndarray:
+    """
+    Brandes dependency of every node for every source of a batch, as a
+    `(num_sources, num_nodes)` matrix.
+
+    `dist` holds one hop row per source with -1 for unreachable nodes. An arc
+    `u -> v` belongs to the shortest-path DAG of a source when `v` is one hop
+    further than `u`, so the DAG arcs of the whole batch are gathered at once and
+    processed level by level: forward to count shortest paths and backward to
+    accumulate dependencies.
+    """
+    num_sources, num_nodes = dist.shape
+    dist_src = dist[:, arc_src]
+    on_dag = (dist_src >= 0) & (dist[:, arc_dst] == dist_src + 1)
+    rows, arcs = on_dag.nonzero()
+    if len(rows) == 0:
+        return zeros((num_sources, num_nodes), dtype=float64)
+    level = dist_src[rows, arcs]
+    order = argsort(level, kind="stable")
+    rows, arcs, level = rows[order], arcs[order], level[order]
+    offset = rows.astype(int64) * num_nodes
+    tail = offset + arc_src[arcs]
+    head = offset + arc_dst[arcs]
+    bounds = searchsorted(level, arange(level[-1] + 2))
+    roots = arange(num_sources, dtype=int64) * num_nodes + batch
+
+    sigma = zeros(num_sources * num_nodes, dtype=float64)
+    sigma[roots] = 1.0
+    for lower, upper in zip(bounds[:-1], bounds[1:]):
+        add.at(sigma, head[lower:upper], sigma[tail[lower:upper]])
+    delta = zeros(num_sources * num_nodes, dtype=float64)
+    for lower, upper in zip(bounds[-2::-1], bounds[:0:-1]):
+        coeff = (1 + delta[head[lower:upper]]) / sigma[head[lower:upper]]
+        add.at(delta, tail[lower:upper], sigma[tail[lower:upper]] * coeff)
+    delta[roots] = 0.0
+    return delta.reshape(num_sources, num_nodes)
+
+
+def _closeness(in_reachable: ndarray, in_total_sp: ndarray, num_nodes: int) -> ndarray:
+    """Wasserman and Faust closeness from the distances arriving to every node."""
+    closeness = zeros(len(in_reachable), dtype=float64)
+    valid = in_total_sp > 0
+    if num_nodes > 1:
+        reached = in_reachable[valid] - 1.0
+        closeness[valid] = reached / in_total_sp[valid] * (reached / (num_nodes - 1))
+    return closeness
+
+
+def _rescale_betweenness(dependency: ndarray, num_nodes: int) -> ndarray:
+    """Normalize the summed dependencies the way NetworkX does by default."""
+    if num_nodes <= 2:
+        return dependency
+    return dependency * (1 / ((num_nodes - 1) * (num_nodes - 2)))
@@ -3,18 +3,22 @@ from typing import List, Optional, Union
 
 from networkx import (
     Graph, DiGraph, connected_components, 
-    strongly_connected_components, weakly_connected_components, 
-    all_pairs_shortest_path_length, eccentricity, density, 
-    degree_centrality, in_degree_centrality, out_degree_centrality, 
-    betweenness_centrality, closeness_centrality, eigenvector_centrality,
+    strongly_connected_components, weakly_connected_components,
 )
-from numpy import mean as npmean
-from numpy import median as npmedian
-from numpy import std as npstd
-from pandas import concat, DataFrame
+from pandas import DataFrame, concat
 
+from toolbox.graph import CSRGraph
+from toolbox.stats import GraphStats
 
-def get_basic_statistics(network: Union[Graph, DiGraph]) -> dict:
+
+NODE_COLUMNS = {"busstop": "codigo_parada", "cp": "cp_parada", "distrito": "distrito_parada"}
+
+
+def get_basic_statistics(
+        network: Union[Graph, DiGraph], distances_path: Optional[str]=None, processes: int=1,
+        approximate: Optional[int]=None, seed: int=42, confidence: float=0.95,
+        weight: Optional[str]=None
+        ) -> dict:
     """
     Compute basic statistics for the input graph.
 
@@ -22,6 +26,22 @@ def get_basic_statistics(network: Union[Graph, DiGraph]) -> dict:
     ----------
     network : nx.Graph or nx.DiGraph
         The input graph.
+    distances_path : str, optional
+        `.npy` file where the all-pairs distance matrix is memory-mapped.
+        Default is None, which keeps it in memory.
+    processes : int, optional
+        Number of worker processes used for the shortest path sweep. Default is 1.
+    approximate : int, optional
+        Number of sampled pivot nodes used to estimate mean shortest paths, diameter,
+        closeness and betweenness. Default is None, which computes them exactly.
+        Only undirected graphs are supported.
+    seed : int, optional
+        Seed of the pivot sampling when `approximate` is set. Default is 42.
+    confidence : float, optional
+        Confidence level of the error bounds when `approximate` is set. Default is 0.95.
+    weight : str, optional
+        Edge attribute used as length of the shortest paths, for instance `metres`
+        or `seconds`. Default is None, which counts hops.
 
     Returns
     -------
@@ -67,69 +87,164 @@ def get_basic_statistics(network: Union[Graph, DiGraph]) -> dict:
       density, centrality measures, node closeness, shortest path statistics, diameter, and betweenness centrality.
     - The `network` parameter can be an undirected graph (Graph) or a directed graph (DiGraph).
     - The function returns a dictionary containing the computed statistics.
+    - Shortest paths, diameter, closeness and betweenness come from a single BFS per
+      node (see `toolbox.metrics.bfs_sweep`) instead of one traversal per metric.
+    - `sp` is a `toolbox.metrics.DistanceMatrix`, a uint8/uint16 matrix indexed by the
+      position of the nodes in `network.nodes`, instead of a dict of dicts.
+    - With `approximate` the metrics are estimated from that many pivots (see
+      `toolbox.metrics.approximate_sweep`). There is no `sp` and the keys `pivots`,
+      `mean_sp_error`, `mean_net_sp_error`, `diameter_bounds`, `closeness_centrality_error`
+      and `betweeness_centrality_error` hold the pivots and the half width of the
+      confidence interval of every estimate.
+    - `eig_centrality` comes from a sparse eigensolver and `eig_diagnostics` holds its
+      eigenvalue, iterations, residual and convergence flag.
+    - With `weight`, mean shortest paths, diameter and closeness are weighted
+      (Dijkstra, see `toolbox.metrics.bfs_sweep`) and there is no `sp` nor
+      `betweeness_centrality`.
+    - Use `toolbox.stats.GraphStats` directly to compute only the metrics that are read.
     """
-    graph_type = "direct" if network.is_directed() else "undirect"
-    summary_dict = {
-        "graph_type": graph_type,
-        "num_nodes": network.number_of_nodes(),
-        "num_edges": network.number_of_edges(),
-        "density": density(network),
-    }
-    degrees = [("", network.degree())] if graph_type == "undirect" else [
-        ("", network.degree()), ("_in", network.in_degree()), ("_out", network.out_degree())
-    ]
-    degrees_centrality = [("", degree_centrality(network))] if graph_type == "undirect" else [
-        ("", degree_centrality(network)), 
-        ("_in", in_degree_centrality(network)), 
-        ("_out", out_degree_centrality(network))
-    ]
-    for centrality_suffix, d_centrality in degrees_centrality:
-        summary_dict[f"centrality{centrality_suffix}"] = d_centrality
-    for degree_suffix, degree in degrees:
-        number_close_nodes = [ncn for _, ncn in degree]
-        summary_dict[f"ncn{degree_suffix}"] = number_close_nodes
-        summary_dict[f"mean_ncn{degree_suffix}"] = npmean(number_close_nodes)
-        summary_dict[f"median_ncn{degree_suffix}"] = npmedian(number_close_nodes)
-        summary_dict[f"max_ncn{degree_suffix}"] = max(number_close_nodes)
-        summary_dict[f"min_ncn{degree_suffix}"] = min(number_close_nodes)
-        summary_dict[f"std_ncn{degree_suffix}"] = npstd(number_close_nodes)
-        summary_dict[f"mean_ncn{degree_suffix}"] = npmean(number_close_nodes)
-    shorter_paths = dict(all_pairs_shortest_path_length(network))
-    mean_shorter_paths = [
-        npmean(list(filter(lambda e: e!=0, sp_values.values()))) for sp_values in shorter_paths.values()
-    ]
-    summary_dict["sp"] = shorter_paths
-    summary_dict["mean_sp"] = mean_shorter_paths
-    summary_dict["mean_net_sp"] = npmean(mean_shorter_paths)
-    summary_dict["diameter"] = max(eccentricity(network, sp=shorter_paths).values())
-    summary_dict["betweeness_centrality"] = betweenness_centrality(network)
-    summary_dict["closeness_centrality"] = closeness_centrality(network)
-    summary_dict["eig_centrality"] = eigenvector_centrality(network, tol=1e-4, max_iter=500)
-    return summary_dict
-
-
-def generate_graph(dataframe: DataFrame, gtype: str="undirect"):
-    """TBD"""
-    nodes_a = dataframe[["from_node", "from_lat", "from_lon"]]
-    nodes_b = dataframe.drop(columns=["from_node", "from_lat", "from_lon"]).rename(columns={
-        "to_node": "from_node",
-        "to_lat": "from_lat",
-        "to_lon": "from_lon"
-
-    })[["from_node", "from_lat", "from_lon"]]
-    nodes = concat([nodes_a, nodes_b]).drop_duplicates(keep="first")
-    edges = dataframe[["from_node", "to_node", "weight"]].drop_duplicates(keep="first")
+    return GraphStats(
+        network=network, distances_path=distances_path, processes=processes,
+        approximate=approximate, seed=seed, confidence=confidence, weight=weight
+    ).to_dict()
+
+
+def generate_graph(
+        dataframe: DataFrame, gtype: str="undirect", output: str="networkx", weight: str="weight"
+        ) -> Union[Graph, DiGraph, CSRGraph]:
+    """
+    Generate the network of a `net_*.csv` table.
+
+    Parameters
+    ----------
+    dataframe : DataFrame
+        Table with the columns `from_node`, `to_node`, `weight`, `from_lat`,
+        `from_lon`, `to_lat` and `to_lon`.
+    gtype : str, optional
+        The type of graph to build. Possible values are 'undirect' or 'direct'.
+        Default is 'undirect'.
+    output : str, optional
+        The type of object to return. Possible values are 'networkx' or 'csr'.
+        Default is 'networkx'.
+    weight : str, optional
+        Column used as edge weight. It is also the name of the edge attribute.
+        Default is 'weight'.
+
+    Returns
+    -------
+    Graph, DiGraph or CSRGraph
+        The network with the node attribute `pos` and the edge attribute `weight`.
+
+    Raises
+    ------
+    ValueError
+        If an invalid value is provided for the `gtype` or `output` parameters.
+
+    Notes
+    -----
+    - The graph is always built as a `CSRGraph` straight from the columns. The
+      NetworkX graph is produced from it in bulk for the code that still expects one.
+    """
+    if gtype not in ("undirect", "direct"):
+        raise ValueError((
+            f"You have passed gtype={gtype} and the possible values are 'undirect' or 'direct'."
+        ))
+    if output not in ("networkx", "csr"):
+        raise ValueError((
+            f"You have passed output={output} and the possible values are 'networkx' or 'csr'."
+        ))
+    graph = CSRGraph.from_dataframe(dataframe=dataframe, directed=gtype == "direct", weight=weight)
+    if output == "csr":
+        return graph
+
+    return graph.to_networkx(weight=weight)
+
+
+def add_segment_costs(
+        dataframe: DataFrame, linea_data: DataFrame, stops_data: DataFrame,
+        node: str="busstop", gtype: str="undirect"
+        ) -> DataFrame:
+    """
+    Add the physical length and travel time of every edge of a `net_*.csv` table.
+
+    Parameters
+    ----------
+    dataframe : DataFrame
+        Table with the `net_*.csv` layout.
+    linea_data : DataFrame
+        Itineraries as in `emt-linea-data.csv`, with the columns `NUMEROLINEAUSUARIO`,
+        `SENTIDO`, `NUMEROORDEN`, `CODIGOESTACION`, `LONGITUDTRAMOANTERIOR` and
+        `VELOCIDADTRAMOANTERIOR`.
+    stops_data : DataFrame
+        Stops as in `emt-data-clean.csv`, mapping `codigo_estacion` to the node columns.
+    node : str, optional
+        The type of node of `dataframe`. Possible values are 'busstop', 'cp' or 'distrito'.
+        Default is 'busstop'.
+    gtype : str, optional
+        The type of graph the costs are for. Possible values are 'undirect' or 'direct'.
+        Default is 'undirect'.
+
+    Returns
+    -------
+    DataFrame
+        Copy of `dataframe` with the columns `metres` and `seconds`.
+
+    Raises
+    ------
+    ValueError
+        If an invalid value is provided for the `node` or `gtype` parameters.
+
+    Examples
+    --------
+    >>> from pandas import read_csv
+    >>> data = add_segment_costs(
+    ...     read_csv("data/net_busstop.csv"),
+    ...     read_csv("data/emt-linea-data.csv", encoding="utf-8-sig"),
+    ...     read_csv("data/emt-data-clean.csv"),
+    ... )
+    >>> network = generate_graph(dataframe=data, weight="seconds")
+    >>> giant = network.subgraph(get_k_connected_components(network, k=1)[0])
+    >>> statistics = get_basic_statistics(giant, weight="seconds")
+
+    Notes
+    -----
+    - A segment joins two consecutive stations of an itinerary. Its length is the
+      `LONGITUDTRAMOANTERIOR` of the second one, in metres, and its time is that
+      length at the `VELOCIDADTRAMOANTERIOR` of the second one, in km/h. Missing
+      or non positive speeds take the median speed of the itinerary, or of the
+      whole network when the itinerary has none.
+    - An edge takes the shortest segment among every line and, for undirected
+      graphs, both directions joining its nodes. Edges without any segment take
+      the median cost of the table.
+    """
+    if node not in NODE_COLUMNS:
+        raise ValueError((
+            f"You have passed node={node} and the possible values are {list(NODE_COLUMNS)}."
+        ))
+    if gtype not in ("undirect", "direct"):
+        raise ValueError((
+            f"You have passed gtype={gtype} and the possible values are 'undirect' or 'direct'."
+        ))
+    route = ["NUMEROLINEAUSUARIO", "SENTIDO"]
+    itineraries = linea_data.sort_values(route + ["NUMEROORDEN"], kind="stable").reset_index(drop=True)
+    speed = itineraries["VELOCIDADTRAMOANTERIOR"].where(itineraries["VELOCIDADTRAMOANTERIOR"] > 0)
+    speed = speed.fillna(speed.groupby([itineraries[column] for column in route]).transform("median"))
+    speed = speed.fillna(speed.median())
+    same_route = (itineraries[route] == itineraries[route].shift()).all(axis=1)
+    station_node = stops_data.drop_duplicates(subset="codigo_estacion").set_index("codigo_estacion")[NODE_COLUMNS[node]]
+    segments = DataFrame({
+        "from_node": itineraries["CODIGOESTACION"].shift().map(station_node),
+        "to_node": itineraries["CODIGOESTACION"].map(station_node),
+        "metres": itineraries["LONGITUDTRAMOANTERIOR"],
+        "seconds": itineraries["LONGITUDTRAMOANTERIOR"] / (speed / 3.6),
+    })[same_route.to_numpy()].dropna()
+    segments = segments[segments["from_node"] != segments["to_node"]]
     if gtype == "undirect":
-        graph = Graph()
-    elif gtype == "direct":
-        graph = DiGraph()
-
-    for node in nodes.itertuples():
-        graph.add_node(node.from_node, pos=(node.from_lat, node.from_lon))
-    for edge in edges.itertuples():
-        graph.add_edge(edge.from_node, edge.to_node, weight=edge.weight)
-    
-    return graph
+        segments = concat([segments, segments.rename(columns={"from_node": "to_node", "to_node": "from_node"})])
+    segments = segments.astype({"from_node": dataframe["from_node"].dtype, "to_node": dataframe["to_node"].dtype})
+    costs = segments.groupby(["from_node", "to_node"])[["metres", "seconds"]].min()
+    data = dataframe.drop(columns=["metres", "seconds"], errors="ignore").join(costs, on=["from_node", "to_node"])
+    return data.fillna({"metres": data["metres"].median(), "seconds": data["seconds"].median()})
 
 
 def get_k_connected_components(
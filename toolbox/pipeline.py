@@ -0,0 +1,223 @@
+from argparse import ArgumentParser
+from os import makedirs, path
+from time import perf_counter
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+from pandas import DataFrame, merge, read_csv
+
+from toolbox.snapshot import GraphSnapshot
+from toolbox.storage import load_table
+
+NETWORKS = {
+    "busstop": ("codigo_parada", "lat", "lon"),
+    "cp": ("cp_parada", "lat_cp", "lon_cp"),
+    "distrito": ("distrito_parada", "lat_distrito", "lon_distrito"),
+}
+NETWORK_COLUMNS = ["from_node", "to_node", "edge", "from_lat", "from_lon", "to_lat", "to_lon", "n_buses", "weight"]
+
+
+def read_stops(data_dir: str="data") -> DataFrame:
+    """
+    Read the stops served by every line, with their coordinates.
+
+    Parameters
+    ----------
+    data_dir : str, optional
+        Folder with `emt-data-clean.csv` and `longitude_latitude.csv`. Default is 'data'.
+
+    Returns
+    -------
+    DataFrame
+        One row per stop and line with the columns `codigo_estacion` (4
+        characters), `codigo_parada` (5 characters), `linea`, `cp_parada`,
+        `distrito_parada`, `lat` and `lon`. Stops without coordinates are dropped.
+    """
+    stops = read_csv(
+        path.join(data_dir, "emt-data-clean.csv"),
+        usecols=["codigo_estacion", "codigo_parada", "linea", "cp_parada", "distrito_parada"],
+        dtype={"linea": str},
+    )
+    stops["codigo_estacion"] = stops["codigo_estacion"].astype(str).str.zfill(4)
+    stops["codigo_parada"] = stops["codigo_parada"].astype(str).str.zfill(5)
+    stops["cp_parada"] = stops["cp_parada"].astype(str)
+    stops["distrito_parada"] = stops["distrito_parada"].astype(str)
+    coordinates = read_csv(path.join(data_dir, "longitude_latitude.csv")).rename(
+        columns={"longitud": "lon", "latitud": "lat"}
+    )
+    coordinates["codigo_parada"] = coordinates["codigo_parada"].astype(str).str.zfill(5)
+    return merge(left=stops, right=coordinates, how="inner", on="codigo_parada")
+
+
+def read_segments(data_dir: str="data") -> DataFrame:
+    """
+    Read the consecutive stations of every line.
+
+    Parameters
+    ----------
+    data_dir : str, optional
+        Folder with `emt-linea-data-clean.csv`. Default is 'data'.
+
+    Returns
+    -------
+    DataFrame
+        One row per segment with the columns `from_codigo_estacion`,
+        `to_codigo_estacion` (4 characters) and `linea`.
+    """
+    segments = read_csv(path.join(data_dir, "emt-linea-data-clean.csv"), dtype={"edge": str})
+    segments["from_codigo_estacion"] = segments["from_codigo_estacion"].astype(str).str.zfill(4)
+    segments["to_codigo_estacion"] = segments["to_codigo_estacion"].astype(str).str.zfill(4)
+    return segments.rename(columns={"edge": "linea"})
+
+
+def build_networks(data_dir: str="data") -> Tuple[Dict[str, DataFrame], DataFrame]:
+    """
+    Build the bus stop, postal code and district networks from the clean tables.
+
+    Parameters
+    ----------
+    data_dir : str, optional
+        Folder with `emt-data-clean.csv`, `emt-linea-data-clean.csv` and
+        `longitude_latitude.csv`. Default is 'data'.
+
+    Returns
+    -------
+    Tuple[Dict[str, DataFrame], DataFrame]
+        The tables with the `net_*.csv` layout by node type ('busstop', 'cp' and
+        'distrito'), and the report with the `stage`, `rows` and `seconds` of
+        every stage.
+
+    Examples
+    --------
+    >>> networks, report = build_networks("data")
+    >>> sorted(networks)
+    ['busstop', 'cp', 'distrito']
+
+    Notes
+    -----
+    - The notebook `network-analysis.ipynb` merged the stops with themselves on
+      the line, every pair of stops of a line, and then kept the consecutive
+      ones. Here every segment of `emt-linea-data-clean.csv` is joined with
+      the stops of its two stations on that line, so the work is linear in the
+      number of segments. The resulting rows are the same and come in the same
+      order, the order of the stops in `emt-data-clean.csv`, so the node
+      numbering of the graphs does not change.
+    - The coordinates of a postal code or a district are the mean of its stops,
+      counting a stop once per line as the notebook did. Every network then
+      scales its coordinates to [0, 1].
+    - `n_buses` is the number of distinct rows joining the same pair of nodes,
+      that is the lines between them, and `weight` is `n_buses` over its maximum.
+    """
+    report = []
+    start = perf_counter()
+    stops = _record(report, "read_stops", start, read_stops(data_dir))
+    start = perf_counter()
+    for area in ("cp", "distrito"):
+        grouped = stops.groupby(f"{area}_parada")
+        stops[f"lat_{area}"] = grouped["lat"].transform("mean")
+        stops[f"lon_{area}"] = grouped["lon"].transform("mean")
+    _record(report, "area_centroids", start, stops)
+    start = perf_counter()
+    segments = _record(report, "read_segments", start, read_segments(data_dir))
+
+    start = perf_counter()
+    stops["row"] = range(len(stops))
+    from_stops = stops.add_prefix("from_").rename(columns={"from_linea": "linea"})
+    to_stops = stops.add_prefix("to_").rename(columns={"to_linea": "linea"})
+    pairs = merge(segments, from_stops, how="inner", on=["from_codigo_estacion", "linea"])
+    pairs = merge(pairs, to_stops, how="inner", on=["to_codigo_estacion", "linea"])
+    pairs = pairs[pairs["from_codigo_parada"] != pairs["to_codigo_parada"]].rename(columns={"linea": "edge"})
+    pairs = pairs.sort_values(["from_row", "to_row"], kind="stable")
+    _record(report, "join_segments", start, pairs)
+
+    networks = {}
+    for name, (node, lat, lon) in NETWORKS.items():
+        start = perf_counter()
+        networks[name] = _record(report, f"net_{name}", start, _network(pairs, node, lat, lon))
+    return networks, DataFrame(report, columns=["stage", "rows", "seconds"])
+
+
+def write_networks(
+        networks: Dict[str, DataFrame], output_dir: str="data", snapshots: bool=True
+        ) -> List[str]:
+    """
+    Write every network as `net_<name>.csv` and its snapshot as `net_<name>.graph`.
+
+    Parameters
+    ----------
+    networks : Dict[str, DataFrame]
+        Networks returned by `build_networks`.
+    output_dir : str, optional
+        Destination folder, created if missing. Default is 'data'.
+    snapshots : bool, optional
+        Whether to write the snapshots, see `toolbox.snapshot.GraphSnapshot`.
+        Default is True.
+
+    Returns
+    -------
+    List[str]
+        Paths of the written files.
+
+    Notes
+    -----
+    The snapshot is built from the written CSV file, read back with
+    `toolbox.storage.load_table`, so its node ids are the ones every page gets
+    from that file.
+    """
+    makedirs(output_dir, exist_ok=True)
+    paths = []
+    for name, network in networks.items():
+        network_path = path.join(output_dir, f"net_{name}.csv")
+        network.to_csv(network_path, index=False)
+        paths.append(network_path)
+        if snapshots:
+            snapshot_path = path.join(output_dir, f"net_{name}.graph")
+            checksum = GraphSnapshot.from_dataframe(load_table(f"net_{name}", data_dir=output_dir)).save(snapshot_path)
+            logger.info(f"{snapshot_path}: sha256 {checksum[:16]}")
+            paths.append(snapshot_path)
+    return paths
+
+
+def _network(pairs: DataFrame, node: str, lat: str, lon: str) -> DataFrame:
+    """Edges between different nodes of one type, with scaled coordinates and line counts."""
+    network = pairs[pairs[f"from_{node}"] != pairs[f"to_{node}"]][[
+        f"from_{node}", f"to_{node}", "edge", f"from_{lat}", f"from_{lon}", f"to_{lat}", f"to_{lon}"
+    ]].drop_duplicates(keep="first")
+    network.columns = ["from_node", "to_node", "edge", "from_lat", "from_lon", "to_lat", "to_lon"]
+    for axis in ("lat", "lon"):
+        columns = [f"from_{axis}", f"to_{axis}"]
+        lower, upper = network[columns].min().min(), network[columns].max().max()
+        network[columns] = (network[columns] - lower) / (upper - lower)
+    network["n_buses"] = network.groupby(["from_node", "to_node"])["edge"].transform("size")
+    network["weight"] = network["n_buses"] / network["n_buses"].max()
+    return network[NETWORK_COLUMNS].reset_index(drop=True)
+
+
+def _record(report: List[dict], stage: str, start: float, frame: DataFrame) -> DataFrame:
+    """Add the rows and time of a stage to the report and log them."""
+    seconds = perf_counter() - start
+    report.append({"stage": stage, "rows": len(frame), "seconds": seconds})
+    logger.info(f"{stage}: {len(frame)} rows in {seconds:.2f} s")
+    return frame
+
+
+def main(argv: Optional[List[str]]=None) -> None:
+    """Command line entry point, see `python -m toolbox.pipeline --help`."""
+    parser = ArgumentParser(
+        prog="python -m toolbox.pipeline",
+        description="Build net_busstop.csv, net_cp.csv and net_distrito.csv from the clean EMT tables.",
+    )
+    parser.add_argument("--data-dir", default="data", help="Folder with the clean EMT tables.")
+    parser.add_argument("-o", "--output-dir", default="data", help="Folder where the networks are written.")
+    parser.add_argument("--no-snapshots", action="store_true", help="Do not write the net_*.graph snapshots.")
+    args = parser.parse_args(argv)
+
+    start = perf_counter()
+    networks, report = build_networks(args.data_dir)
+    paths = write_networks(networks, args.output_dir, snapshots=not args.no_snapshots)
+    logger.info(f"Wrote {', '.join(paths)} in {perf_counter() - start:.1f} s")
+    logger.info(f"Stages:\n{report.to_string(index=False)}")
+
+
+if __name__ == "__main__":
+    main()
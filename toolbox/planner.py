@@ -0,0 +1,352 @@
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from os import path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Dict, Hashable, Iterable, Iterator, List, Optional, Tuple
+
+from loguru import logger
+from numpy import (
+    arange, asarray, empty_like, float64, int32, int64, isinf, lexsort, load, maximum, minimum, nan,
+    ndarray, ones, save, uint16, unique, where, zeros,
+)
+from pandas import DataFrame
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import shortest_path
+from scipy.spatial import cKDTree
+
+from toolbox.collapse import OPTIONS, write_results
+from toolbox.graph import CSRGraph
+from toolbox.metrics import bfs_sweep
+from toolbox.storage import load_table
+
+OBJECTIVES = ("efficiency", "mean_sp")
+
+_UNREACHABLE = int(2 ** 16 - 1)
+_CHUNK_ROWS = 256
+_WORKER_PLANNER = {}
+
+
+def propose_lines(
+        dataframe: DataFrame, num_stops: int=5, objective: str="efficiency",
+        sources: Optional[Iterable[Hashable]]=None, beam_width: int=20, top: int=10,
+        neighbours: int=8, seeds: Optional[int]=None, processes: int=1, chunk_size: int=16
+        ) -> DataFrame:
+    """
+    Search the new lines of `num_stops` stops that improve the network the most.
+
+    Parameters
+    ----------
+    dataframe : DataFrame
+        Table with the `net_*.csv` layout.
+    num_stops : int, optional
+        Number of stops of the proposed lines. Default is 5.
+    objective : str, optional
+        'efficiency' to maximize the mean of `1/d` or 'mean_sp' to minimize the
+        mean hop distance over the connected pairs. Default is 'efficiency'.
+    sources : Iterable[Hashable], optional
+        Nodes whose trips are scored, for instance the stops of a district. Every
+        pair from one of them to any node counts. Default is None, which scores
+        every pair of the network.
+    beam_width : int, optional
+        Partial lines kept after every added stop. 1 is a greedy search.
+        Default is 20.
+    top : int, optional
+        Number of proposals returned, at most `beam_width`. Default is 10.
+    neighbours : int, optional
+        Geographically closest nodes a line may continue to from each end.
+        Default is 8.
+    seeds : int, optional
+        Pairs of close nodes scored as first segment, chosen among the ones
+        farthest apart in hops. Default is None, which is `4 * beam_width`.
+    processes : int, optional
+        Number of worker processes. Default is 1.
+    chunk_size : int, optional
+        Candidates handed to a worker at once. Default is 16.
+
+    Returns
+    -------
+    DataFrame
+        The `top` proposals from best to worst, with the columns `rank`, `stops`
+        (node ids in line order), `efficiency`, `delta_efficiency`, `mean_sp`
+        and `delta_mean_sp`, the deltas against the current network.
+
+    Raises
+    ------
+    ValueError
+        If `objective` is not available, `num_stops` is lower than 2 or `top`
+        is larger than `beam_width`.
+    KeyError
+        If any of the `sources` is not in the graph.
+
+    Examples
+    --------
+    >>> from pandas import read_csv
+    >>> proposals = propose_lines(read_csv("data/net_distrito.csv"), num_stops=3, top=1)
+    >>> proposals.columns.tolist()
+    ['rank', 'stops', 'efficiency', 'delta_efficiency', 'mean_sp', 'delta_mean_sp']
+
+    Notes
+    -----
+    - The search is a beam search: every partial line of the beam is extended
+      at either end with one of the `neighbours` closest nodes to that end,
+      every extension is scored and the best `beam_width` ones are kept. Every
+      segment joins two nodes no line joins today.
+    - Adding a segment `(a, b)` can only shorten paths, and the new shortest
+      paths use it at most once, so the distances after adding it are
+      `min(d(x, y), d(x, a) + 1 + d(b, y), d(x, b) + 1 + d(a, y))`. A candidate
+      costs two BFS from its new segment and one pass over the hop rows of the
+      `sources`, instead of an all-pairs BFS.
+    - The hop rows of the `sources` are computed once, saved to a temporary
+      `.npy` file and memory-mapped by every worker. Each worker rebuilds the
+      rows of a partial line from them by adding its segments, then scores its
+      extensions. Scoring every pair of `net_busstop.csv` keeps about 46 MB of
+      rows per partial line, so passing the stops of a district as `sources`
+      makes the search much cheaper.
+    """
+    if objective not in OBJECTIVES:
+        raise ValueError((
+            f"You have passed objective={objective} and the possible values are {OBJECTIVES}."
+        ))
+    if num_stops < 2:
+        raise ValueError((f"You have passed num_stops={num_stops} and a line needs at least 2 stops."))
+    if top > beam_width:
+        raise ValueError((
+            f"You have passed top={top} and beam_width={beam_width}, top can not be larger than beam_width."
+        ))
+    graph = CSRGraph.from_dataframe(dataframe)
+    num_nodes = graph.number_of_nodes()
+    rows = arange(num_nodes) if sources is None else unique(graph.index_of(list(sources)))
+    distances = bfs_sweep(graph=graph, keep_distances=True, processes=processes, betweenness=False)["distances"]
+    unreachable = distances.unreachable
+    hops = zeros((len(rows), num_nodes), dtype=uint16)
+    for start in range(0, len(rows), _CHUNK_ROWS):
+        chunk = asarray(distances[rows[start:start + _CHUNK_ROWS]])
+        hops[start:start + len(chunk)] = where(chunk == unreachable, _UNREACHABLE, chunk)
+
+    near = cKDTree(graph.pos).query(graph.pos, k=min(neighbours + 1, num_nodes))[1][:, 1:]
+    adjacency = graph.adjacency()
+    first, second = arange(num_nodes).repeat(near.shape[1]), near.ravel()
+    pairs = unique(minimum(first, second).astype(int64) * num_nodes + maximum(first, second))
+    first, second = (pairs // num_nodes).astype(int32), (pairs % num_nodes).astype(int32)
+    new = asarray(adjacency[first, second]).ravel() == 0
+    first, second = first[new], second[new]
+    separation = asarray(distances[first, second], dtype=int64)
+    gap = ((graph.pos[first] - graph.pos[second]) ** 2).sum(axis=1)
+    order = lexsort((gap, -separation))[:seeds if seeds is not None else 4 * beam_width]
+    candidates = [((), [((int(first[i]), int(second[i])), int(first[i]), int(second[i])) for i in order])]
+
+    sign = -1 if objective == "efficiency" else 1
+    with TemporaryDirectory() as directory:
+        hops_path = path.join(directory, "hops.npy")
+        save(hops_path, hops)
+        baseline = _score(_chunks(hops), len(rows), num_nodes)
+        beam = []
+        while True:
+            tasks = [
+                (line, extensions[start:start + chunk_size])
+                for line, extensions in candidates
+                for start in range(0, len(extensions), chunk_size)
+            ]
+            scored = {}
+            for task_rows in _map_tasks(tasks, graph, rows, hops_path, processes):
+                for line, score in task_rows:
+                    scored.setdefault(min(line, line[::-1]), (line, score))
+            beam = sorted(scored.values(), key=lambda item: sign * item[1][objective])[:beam_width]
+            logger.info(f"Best line of {len(beam[0][0]) if beam else 0} stops: {beam[0][1] if beam else None}")
+            if not beam or len(beam[0][0]) >= num_stops:
+                break
+            candidates = [(line, _extensions(line, near, adjacency)) for line, _ in beam]
+
+    node_ids = graph.node_ids
+    proposals = DataFrame([
+        {
+            "stops": node_ids[list(line)].tolist(),
+            "efficiency": score["efficiency"],
+            "delta_efficiency": score["efficiency"] - baseline["efficiency"],
+            "mean_sp": score["mean_sp"],
+            "delta_mean_sp": score["mean_sp"] - baseline["mean_sp"],
+        }
+        for line, score in beam[:top]
+    ], columns=["stops", "efficiency", "delta_efficiency", "mean_sp", "delta_mean_sp"])
+    proposals.insert(0, "rank", range(1, len(proposals) + 1))
+    return proposals
+
+
+def district_nodes(dataframe: DataFrame, option: str, district: int, data_dir: str="data") -> List[Hashable]:
+    """
+    Nodes of a network inside a district of Madrid.
+
+    Parameters
+    ----------
+    dataframe : DataFrame
+        Table with the `net_*.csv` layout.
+    option : str
+        Node type of `dataframe`: 'cp', 'distrito' or 'busstop'.
+    district : int
+        District number, as in `df_distritos.csv`.
+    data_dir : str, optional
+        Folder with `emt-data-clean.csv`, which maps every stop and postal code
+        to its district. Default is 'data'.
+
+    Returns
+    -------
+    List[Hashable]
+        The nodes of `dataframe` in the district.
+
+    Raises
+    ------
+    ValueError
+        If `option` is not available.
+    """
+    if option not in OPTIONS:
+        raise ValueError((f"You have passed option={option} and the possible values are {OPTIONS}."))
+    if option == "distrito":
+        members = {district}
+    else:
+        stops = load_table("emt-data-clean", data_dir=data_dir)
+        column = "codigo_parada" if option == "busstop" else "cp_parada"
+        members = set(stops.loc[stops["distrito_parada"] == district, column].tolist())
+    nodes = dict.fromkeys(dataframe["from_node"].tolist() + dataframe["to_node"].tolist())
+    return [node for node in nodes if node in members]
+
+
+def _extensions(line: Tuple[int, ...], near: ndarray, adjacency: csr_matrix) -> List[tuple]:
+    """Lines one stop longer than `line`, with the segment each one adds."""
+    extensions = []
+    for end, front in ((line[0], True), (line[-1], False)):
+        for stop in near[end].tolist():
+            if stop in line or adjacency[end, stop] != 0:
+                continue
+            extensions.append(((stop,) + line if front else line + (stop,), end, stop))
+    return extensions
+
+
+def _init_worker(graph: CSRGraph, rows: ndarray, hops_path: str) -> None:
+    """Keep the graph and the memory-mapped hop rows of the sources in the worker."""
+    _WORKER_PLANNER.clear()
+    _WORKER_PLANNER.update(graph=graph, rows=rows, hops=load(hops_path, mmap_mode="r"))
+
+
+def _map_tasks(
+        tasks: List[tuple], graph: CSRGraph, rows: ndarray, hops_path: str, processes: int
+        ) -> Iterator[List[tuple]]:
+    """Yield the scored extensions of every task, serially or on a process pool."""
+    if processes <= 1 or len(tasks) <= 1:
+        _init_worker(graph, rows, hops_path)
+        try:
+            yield from map(_score_extensions, tasks)
+        finally:
+            _WORKER_PLANNER.clear()
+        return
+    with ProcessPoolExecutor(
+            max_workers=min(processes, len(tasks)), initializer=_init_worker,
+            initargs=(graph, rows, hops_path)
+            ) as executor:
+        yield from executor.map(_score_extensions, tasks)
+
+
+def _score_extensions(task: tuple) -> List[Tuple[Tuple[int, ...], Dict[str, float]]]:
+    """Rebuild the hop rows of a partial line and score each of its extensions."""
+    line, extensions = task
+    graph, rows, hops = _WORKER_PLANNER["graph"], _WORKER_PLANNER["rows"], _WORKER_PLANNER["hops"]
+    num_nodes = graph.number_of_nodes()
+    segments = list(zip(line[:-1], line[1:]))
+    for position, (first, second) in enumerate(segments):
+        hops = _add_segment(hops, rows, _adjacency(graph, segments[:position]), first, second)
+    adjacency = _adjacency(graph, segments)
+    return [
+        (new_line, _score(_relaxed(hops, rows, adjacency, first, second), len(rows), num_nodes))
+        for new_line, first, second in extensions
+    ]
+
+
+def _adjacency(graph: CSRGraph, segments: List[Tuple[int, int]]) -> csr_matrix:
+    """Adjacency of the graph with the `segments` of a new line added."""
+    adjacency = graph.adjacency()
+    if not segments:
+        return adjacency
+    first, second = asarray(segments).T
+    return adjacency + csr_matrix((ones(len(segments)), (first, second)), shape=adjacency.shape)
+
+
+def _relaxed(hops: ndarray, rows: ndarray, adjacency: csr_matrix, first: int, second: int) -> Iterator[ndarray]:
+    """Chunks of the hop rows once the segment `(first, second)` is added to `adjacency`."""
+    ends = shortest_path(adjacency, directed=False, unweighted=True, indices=[first, second])
+    ends = where(isinf(ends), _UNREACHABLE, ends).astype(int64)
+    for start in range(0, len(rows), _CHUNK_ROWS):
+        chunk_rows = rows[start:start + _CHUNK_ROWS]
+        via = minimum(
+            ends[0, chunk_rows][:, None] + 1 + ends[1][None, :],
+            ends[1, chunk_rows][:, None] + 1 + ends[0][None, :],
+        )
+        yield minimum(hops[start:start + _CHUNK_ROWS], minimum(via, _UNREACHABLE))
+
+
+def _add_segment(hops: ndarray, rows: ndarray, adjacency: csr_matrix, first: int, second: int) -> ndarray:
+    """Hop rows once the segment `(first, second)` is added to `adjacency`."""
+    updated = empty_like(hops)
+    for start, chunk in zip(range(0, len(rows), _CHUNK_ROWS), _relaxed(hops, rows, adjacency, first, second)):
+        updated[start:start + len(chunk)] = chunk
+    return updated
+
+
+def _chunks(hops: ndarray) -> Iterator[ndarray]:
+    """Hop rows in chunks of `_CHUNK_ROWS`."""
+    for start in range(0, hops.shape[0], _CHUNK_ROWS):
+        yield hops[start:start + _CHUNK_ROWS]
+
+
+_INVERSE = zeros(_UNREACHABLE + 1, dtype=float64)
+_INVERSE[1:_UNREACHABLE] = 1 / arange(1, _UNREACHABLE, dtype=float64)
+
+
+def _score(chunks: Iterator[ndarray], num_sources: int, num_nodes: int) -> Dict[str, float]:
+    """Efficiency and mean hop distance of the connected pairs of the hop rows."""
+    inverse, total, pairs = 0.0, 0, 0
+    for chunk in chunks:
+        inverse += _INVERSE[chunk].sum()
+        reached = chunk[(chunk > 0) & (chunk < _UNREACHABLE)]
+        total += int(reached.sum(dtype=int64))
+        pairs += len(reached)
+    return {
+        "efficiency": inverse / (num_sources * (num_nodes - 1)) if num_nodes > 1 else 0.0,
+        "mean_sp": total / pairs if pairs else nan,
+    }
+
+
+def main(argv: Optional[List[str]]=None) -> None:
+    """Command line entry point, see `python -m toolbox.planner --help`."""
+    parser = ArgumentParser(
+        prog="python -m toolbox.planner",
+        description="Propose new EMT lines that shorten the trips of the network or of a district.",
+    )
+    parser.add_argument("--option", choices=OPTIONS, default="busstop", help="Node type of the network.")
+    parser.add_argument("-k", "--stops", type=int, default=5, help="Number of stops of the new line.")
+    parser.add_argument("--objective", choices=OBJECTIVES, default="efficiency", help="Metric to improve.")
+    parser.add_argument("--district", type=int, default=None, help="Only score the trips leaving this district.")
+    parser.add_argument("--beam-width", type=int, default=20, help="Partial lines kept after every stop, 1 is greedy.")
+    parser.add_argument("--top", type=int, default=10, help="Number of proposals written.")
+    parser.add_argument("--neighbours", type=int, default=8, help="Closest nodes a line may continue to.")
+    parser.add_argument("-o", "--output", default="lines.csv", help="Output `.parquet`, `.feather` or `.csv` file.")
+    parser.add_argument("-p", "--processes", type=int, default=1, help="Number of worker processes.")
+    parser.add_argument("--data-dir", default="data", help="Folder with the `net_*.csv` files.")
+    args = parser.parse_args(argv)
+
+    dataframe = load_table(f"net_{args.option}", data_dir=args.data_dir)
+    sources = None
+    if args.district is not None:
+        sources = district_nodes(dataframe, args.option, args.district, data_dir=args.data_dir)
+        if not sources:
+            parser.error(f"the district {args.district} has no node in net_{args.option}.csv")
+    start = perf_counter()
+    proposals = propose_lines(
+        dataframe, num_stops=args.stops, objective=args.objective, sources=sources,
+        beam_width=args.beam_width, top=args.top, neighbours=args.neighbours, processes=args.processes
+    )
+    write_results(proposals, args.output)
+    logger.info(f"Wrote {len(proposals)} proposals to {args.output} in {perf_counter() - start:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+from argparse import ArgumentParser
+from hashlib import sha256
+from json import dumps, loads
+from os import getpid, path, replace
+from time import perf_counter
+from typing import Dict, Iterable, List, Optional, Set
+
+from loguru import logger
+from numpy import add, bincount, uint64, zeros
+from pandas import DataFrame, Series, concat, factorize, read_csv
+from pandas.util import hash_pandas_object
+from scipy.sparse.csgraph import connected_components
+
+from toolbox.cleaning import (
+    ITINERARY_COLUMNS, STOP_COLUMNS, _replacing, clean_itineraries, read_raw_itineraries, read_raw_stops,
+    write_clean_itineraries, write_clean_stops,
+)
+from toolbox.graph import CSRGraph
+from toolbox.pipeline import build_networks, write_networks
+from toolbox.storage import load_table
+
+MANIFEST_VERSION = 3
+MANIFEST_NAME = "refresh-manifest.json"
+REPORT_COLUMNS = ["kind", "key", "change", "detail"]
+
+
+def stop_hashes(raw: DataFrame) -> Series:
+    """Hash of every stop record of a chunk of `read_raw_stops`, keyed by `CODIGOESTACION`."""
+    hashes = hash_pandas_object(raw[STOP_COLUMNS], index=False)
+    return Series(
+        [f"{value:016x}" for value in hashes.tolist()], index=raw["CODIGOESTACION"].tolist()
+    )
+
+
+def itinerary_hashes(chunks: Iterable[DataFrame]) -> Series:
+    """
+    Hash of every itinerary, keyed by `<NUMEROLINEAUSUARIO>/<SENTIDO>`.
+
+    Parameters
+    ----------
+    chunks : Iterable[DataFrame]
+        Chunks returned by `read_raw_itineraries`, in any order.
+
+    Returns
+    -------
+    Series
+        The hash of every itinerary as 16 hexadecimal characters, sorted by key.
+
+    Notes
+    -----
+    The hash of an itinerary is the sum, modulo 2 ** 64, of the hashes of its
+    `(NUMEROORDEN, CODIGOESTACION)` rows, which identifies its stations in
+    order and can be accumulated over chunks holding any part of it.
+    """
+    totals: Dict[str, int] = {}
+    for chunk in chunks:
+        codes, keys = factorize(chunk["NUMEROLINEAUSUARIO"] + "/" + chunk["SENTIDO"].astype(str))
+        sums = zeros(len(keys), dtype=uint64)
+        add.at(sums, codes, hash_pandas_object(chunk[ITINERARY_COLUMNS], index=False).to_numpy())
+        for key, value in zip(keys.tolist(), sums.tolist()):
+            totals[key] = (totals.get(key, 0) + value) % 2 ** 64
+    return Series({key: f"{value:016x}" for key, value in sorted(totals.items())}, dtype=object)
+
+
+def read_manifest(data_dir: str="data") -> Optional[dict]:
+    """Hashes of the last refresh of `data_dir`, or None if there is none usable."""
+    manifest_path = path.join(data_dir, MANIFEST_NAME)
+    if not path.exists(manifest_path):
+        return None
+    with open(manifest_path, "r") as file:
+        manifest = loads(file.read())
+    if manifest.get("version") != MANIFEST_VERSION:
+        logger.warning(f"{manifest_path} has version {manifest.get('version')}, rebuilding everything")
+        return None
+    return manifest
+
+
+def refresh(data_dir: str="data", force: bool=False, chunk_size: int=50_000) -> DataFrame:
+    """
+    Bring the clean tables and the networks of `data_dir` up to date with the raw EMT exports.
+
+    Parameters
+    ----------
+    data_dir : str, optional
+        Folder with `emt-data.csv`, `emt-linea-data.csv`, `longitude_latitude.csv`
+        and the tables built from them. Default is 'data'.
+    force : bool, optional
+        Whether to rebuild the clean tables from scratch, ignoring the
+        manifest of the previous refresh. Default is False.
+    chunk_size : int, optional
+        Rows of an export or a clean table read at once. Default is 50000.
+
+    Returns
+    -------
+    DataFrame
+        The change report, one row per change with the columns `kind` ('stop',
+        'itinerary', 'coordinates', 'table' or 'network'), `key`, `change`
+        ('added', 'removed', 'modified', 'updated' or 'rebuilt') and `detail`.
+
+    Examples
+    --------
+    >>> report = refresh("data")
+    >>> report[report["kind"] == "network"]["key"].tolist()
+    []
+
+    Notes
+    -----
+    - Every stop of `emt-data.csv` is hashed over the columns of `STOP_COLUMNS`
+      and every itinerary, `NUMEROLINEAUSUARIO` and `SENTIDO`, over its
+      stations ordered by `NUMEROORDEN`. Columns such as `FECHAACTUAL` change
+      on every export and are left out, so they do not count as changes. The
+      hashes are kept in `refresh-manifest.json`, and without it, or with
+      `force`, the clean tables are rebuilt with `toolbox.cleaning`.
+    - The exports are read in chunks of `chunk_size` rows. When a stop changed,
+      `emt-data-clean.csv` is written again chunk by chunk, since its rows
+      follow the order of the export and a stop is cleaned from its own row
+      only. The segments of the lines with a modified itinerary are cleaned
+      again and merged, in line order, into `emt-linea-data-clean.csv` while
+      it is read in chunks. Both files end up exactly as a full run of
+      `clean-data.ipynb` would write them, and memory depends on the chunk
+      size and the changed lines, not on the size of the exports.
+    - The networks are joined again with `toolbox.pipeline.build_networks`,
+      which takes a fraction of a second, since area centroids and the scaled
+      coordinates depend on every stop. Only the networks whose table changed
+      are written, with their snapshot, and the others keep their files, so
+      their statistics in `toolbox.cache.StatsCache` remain valid. The report
+      gives the edges added and removed and the connected components before
+      and after for every rewritten network.
+    """
+    start = perf_counter()
+    raw_stops_path = path.join(data_dir, "emt-data.csv")
+    raw_itineraries_path = path.join(data_dir, "emt-linea-data.csv")
+    stops_path = path.join(data_dir, "emt-data-clean.csv")
+    segments_path = path.join(data_dir, "emt-linea-data-clean.csv")
+    manifest = None if force else read_manifest(data_dir)
+    if manifest is not None and not (path.exists(stops_path) and path.exists(segments_path)):
+        logger.warning(f"Clean tables missing in {data_dir}, rebuilding everything")
+        manifest = None
+    previous = manifest or {"stops": {}, "itineraries": {}}
+
+    hashes, lines = [], {}
+    for chunk in read_raw_stops(raw_stops_path, chunk_size=chunk_size):
+        chunk_hashes = stop_hashes(chunk)
+        changed = (chunk_hashes != chunk_hashes.index.map(previous["stops"].get)).to_numpy()
+        lines.update(zip(chunk["CODIGOESTACION"][changed].tolist(), chunk["LINEAS"][changed].tolist()))
+        hashes.append(chunk_hashes)
+    hashes = {
+        "stops": concat(hashes) if hashes else Series(dtype=object),
+        "itineraries": itinerary_hashes(read_raw_itineraries(raw_itineraries_path, chunk_size=chunk_size)),
+    }
+    with open(path.join(data_dir, "longitude_latitude.csv"), "rb") as file:
+        coordinates = sha256(file.read()).hexdigest()
+
+    report = []
+    if manifest is None:
+        write_clean_stops(raw_stops_path, stops_path, chunk_size=chunk_size)
+        write_clean_itineraries(raw_itineraries_path, segments_path, chunk_size=chunk_size)
+        report += [
+            {"kind": "table", "key": "emt-data-clean", "change": "rebuilt", "detail": ""},
+            {"kind": "table", "key": "emt-linea-data-clean", "change": "rebuilt", "detail": ""},
+        ]
+    else:
+        stops = _diff(manifest["stops"], hashes["stops"])
+        itineraries = _diff(manifest["itineraries"], hashes["itineraries"])
+        if manifest["coordinates"] != coordinates:
+            report.append({"kind": "coordinates", "key": "longitude_latitude", "change": "modified", "detail": ""})
+        report += [
+            {"kind": "stop", "key": key, "change": change, "detail": f"lines {lines[key]}" if key in lines else ""}
+            for key, change in stops.items()
+        ]
+        report += [
+            {"kind": "itinerary", "key": key, "change": change, "detail": ""}
+            for key, change in itineraries.items()
+        ]
+        if stops:
+            rows = write_clean_stops(raw_stops_path, stops_path, chunk_size=chunk_size)
+            report.append({
+                "kind": "table", "key": "emt-data-clean", "change": "updated",
+                "detail": f"{rows} rows, {len(stops)} stops changed",
+            })
+        if itineraries:
+            changed_lines = {key.rsplit("/", 1)[0] for key in itineraries}
+            rows = _update_segments(segments_path, raw_itineraries_path, changed_lines, chunk_size)
+            report.append({
+                "kind": "table", "key": "emt-linea-data-clean", "change": "updated",
+                "detail": f"{rows} rows of lines {', '.join(sorted(changed_lines))}",
+            })
+
+    if report:
+        networks, _ = build_networks(data_dir)
+        for name, network in networks.items():
+            change = _write_network(name, network, data_dir)
+            if change is not None:
+                report.append(change)
+    _write_manifest(data_dir, {
+        "version": MANIFEST_VERSION, "coordinates": coordinates,
+        "stops": hashes["stops"].to_dict(), "itineraries": hashes["itineraries"].to_dict(),
+    })
+    logger.info(f"Refreshed {data_dir} with {len(report)} changes in {perf_counter() - start:.2f} s")
+    return DataFrame(report, columns=REPORT_COLUMNS)
+
+
+def _diff(previous: Dict[str, str], current: Series) -> Dict[str, str]:
+    """Keys added, removed or modified between two hash tables, in key order."""
+    changes = {key: "removed" for key in previous.keys() - set(current.index)}
+    for key, value in current.items():
+        if key not in previous:
+            changes[key] = "added"
+        elif previous[key] != value:
+            changes[key] = "modified"
+    return dict(sorted(changes.items()))
+
+
+def _update_segments(segments_path: str, raw_path: str, lines: Set[str], chunk_size: int) -> int:
+    """
+    Replace the clean segments of `lines`, merging them in line order while the
+    clean table is read in chunks, and return the new rows.
+    """
+    fresh = clean_itineraries(concat([
+        chunk[chunk["NUMEROLINEAUSUARIO"].isin(lines)]
+        for chunk in read_raw_itineraries(raw_path, chunk_size=chunk_size)
+    ], ignore_index=True))
+    rows, pending = len(fresh), fresh
+    with _replacing(segments_path) as file:
+        DataFrame(columns=fresh.columns).to_csv(file, index=False)
+        for chunk in read_csv(segments_path, dtype=str, keep_default_na=False, chunksize=chunk_size):
+            chunk = chunk[~chunk["edge"].isin(lines)]
+            if len(chunk):
+                before = (pending["edge"] < chunk["edge"].iloc[-1]).to_numpy()
+                chunk = concat([chunk, pending[before]]).sort_values("edge", kind="stable")
+                pending = pending[~before]
+            chunk.to_csv(file, header=False, index=False)
+        pending.to_csv(file, header=False, index=False)
+    return rows
+
+
+def _write_network(name: str, network: DataFrame, data_dir: str) -> Optional[dict]:
+    """Write a network whose table changed and describe the change, or return None."""
+    network_path = path.join(data_dir, f"net_{name}.csv")
+    before = None
+    if path.exists(network_path):
+        with open(network_path, "r") as file:
+            if file.read() == network.to_csv(index=False):
+                return None
+        before = CSRGraph.from_dataframe(load_table(f"net_{name}", data_dir=data_dir))
+    write_networks({name: network}, data_dir)
+    after = CSRGraph.from_dataframe(load_table(f"net_{name}", data_dir=data_dir))
+    if before is None:
+        return {"kind": "network", "key": f"net_{name}", "change": "added", "detail": _describe(after)}
+    old_edges, new_edges = _edge_set(before), _edge_set(after)
+    detail = (
+        f"edges +{len(new_edges - old_edges)} -{len(old_edges - new_edges)}, "
+        f"{_describe(before)} -> {_describe(after)}"
+    )
+    return {"kind": "network", "key": f"net_{name}", "change": "modified", "detail": detail}
+
+
+def _edge_set(graph: CSRGraph) -> Set[tuple]:
+    """Pairs of node ids joined by an edge, in a canonical order."""
+    pairs = zip(graph.node_ids[graph.edge_src].tolist(), graph.node_ids[graph.edge_dst].tolist())
+    return {tuple(sorted(pair)) for pair in pairs}
+
+
+def _describe(graph: CSRGraph) -> str:
+    """Size and components of a graph for the report."""
+    num_components, labels = connected_components(graph.adjacency(), directed=False)
+    largest = bincount(labels).max() if len(labels) else 0
+    return (
+        f"{graph.number_of_nodes()} nodes, {graph.number_of_edges()} edges, "
+        f"{num_components} components (largest {largest})"
+    )
+
+
+def _write_manifest(data_dir: str, manifest: dict) -> None:
+    """Write the manifest atomically, so an interrupted refresh is done again."""
+    manifest_path = path.join(data_dir, MANIFEST_NAME)
+    temporary_path = f"{manifest_path}.{getpid()}.tmp"
+    with open(temporary_path, "w") as file:
+        file.write(dumps(manifest))
+    replace(temporary_path, manifest_path)
+
+
+def main(argv: Optional[List[str]]=None) -> None:
+    """Command line entry point, see `python -m toolbox.refresh --help`."""
+    parser = ArgumentParser(
+        prog="python -m toolbox.refresh",
+        description="Update the clean tables and the networks with the lines and stops changed in the EMT exports.",
+    )
+    parser.add_argument("--data-dir", default="data", help="Folder with the EMT exports and the built tables.")
+    parser.add_argument("--force", action="store_true", help="Rebuild the clean tables from scratch.")
+    parser.add_argument("--report", help="CSV file where the change report is written.")
+    parser.add_argument("--chunk-size", type=int, default=50_000, help="Rows of a file read at once.")
+    args = parser.parse_args(argv)
+
+    report = refresh(args.data_dir, force=args.force, chunk_size=args.chunk_size)
+    if args.report:
+        report.to_csv(args.report, index=False)
+    logger.info(f"Changes:\n{report.to_string(index=False)}" if len(report) else "No changes")
+
+
+if __name__ == "__main__":
+    main()
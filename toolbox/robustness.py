@@ -0,0 +1,678 @@
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from json import dumps, loads
+from os import getpid, replace
+from time import perf_counter
+from typing import Any, Dict, FrozenSet, Hashable, Iterable, Iterator, List, Optional, Tuple
+
+from loguru import logger
+from numpy import (
+    arange, argsort, array, bincount, concatenate, cumsum, float64, inf, int32, int64, isin, maximum,
+    ndarray, ones, quantile, repeat, sqrt, unique, where, zeros,
+)
+from numpy.random import SeedSequence, default_rng
+from pandas import DataFrame
+from scipy.sparse.csgraph import connected_components
+from scipy.stats import norm
+
+from toolbox.graph import CSRGraph
+from toolbox.incremental import CollapseEngine
+from toolbox.metrics import approximate_sweep, bfs_sweep
+
+PERCOLATION_MODES = ("node", "edge")
+ATTACK_STRATEGIES = ("betweenness", "degree")
+
+_WORKER_GRAPH = {}
+
+
+def percolation(
+        graph: CSRGraph, mode: str="node", trials: int=1000, seed: int=42, confidence: float=0.95,
+        batch_size: int=100, processes: int=1
+        ) -> Dict[str, ndarray]:
+    """
+    Giant component size under random failures, averaged over random orders.
+
+    Parameters
+    ----------
+    graph : CSRGraph
+        The input graph. Directed graphs are treated as undirected.
+    mode : str, optional
+        What fails: 'node' (stops, with all their segments) or 'edge' (segments).
+        Default is 'node'.
+    trials : int, optional
+        Number of random failure orders. Default is 1000.
+    seed : int, optional
+        Seed of the failure orders. Default is 42.
+    confidence : float, optional
+        Confidence level of the bands. Default is 0.95.
+    batch_size : int, optional
+        Trials a worker runs together, vectorized. Default is 100.
+    processes : int, optional
+        Number of worker processes sharing the batches. Default is 1.
+
+    Returns
+    -------
+    Dict[str, ndarray]
+        Arrays with one value per number of failed nodes (or edges), from none
+        to all of them:
+
+        - `removed`: fraction of failed nodes (or edges).
+        - `giant`: mean fraction of the nodes in the largest component.
+        - `giant_std`: standard deviation of that fraction among the trials.
+        - `giant_lower`, `giant_upper`: confidence interval of the mean.
+        - `band_lower`, `band_upper`: range of the central `confidence` share of
+          the trials.
+
+    Raises
+    ------
+    ValueError
+        If `mode` is not valid or `trials` is smaller than 1.
+
+    Notes
+    -----
+    - Newman and Ziff (2001): failing the elements in a random order is the same
+      as adding them back in the reverse order, and adding only ever merges
+      clusters. A union-find structure tracks the largest cluster while the
+      elements are added, so a whole trial costs about one pass over the graph
+      instead of a connected components search per failure.
+    - The union-find forests of all the trials of a batch share flat arrays and
+      every step adds one element to every trial with array operations.
+    - The orders of every batch are drawn from its own child of `seed`, so the
+      curve does not depend on `processes`.
+    """
+    if mode not in PERCOLATION_MODES:
+        raise ValueError((f"You have passed mode={mode} and the possible values are {PERCOLATION_MODES}."))
+    if trials < 1:
+        raise ValueError((f"You have passed trials={trials} and it has to be at least 1."))
+    sizes = [min(batch_size, trials - start) for start in range(0, trials, batch_size)]
+    batches = list(zip(sizes, SeedSequence(seed).spawn(len(sizes))))
+    giant = concatenate(list(_map_batches(graph, mode, batches, processes)))
+    # Column k holds the giant size with k elements added, reverse it to count failures.
+    fraction = giant[:, ::-1] / max(graph.number_of_nodes(), 1)
+    steps = fraction.shape[1] - 1
+    mean = fraction.mean(axis=0)
+    spread = fraction.std(axis=0, ddof=1) if trials > 1 else zeros(steps + 1, dtype=float64)
+    half_width = norm.ppf(0.5 + confidence / 2) * spread / sqrt(trials)
+    tail = (1 - confidence) / 2
+    return {
+        "removed": arange(steps + 1, dtype=float64) / max(steps, 1),
+        "giant": mean,
+        "giant_std": spread,
+        "giant_lower": maximum(mean - half_width, 0.0),
+        "giant_upper": mean + half_width,
+        "band_lower": quantile(fraction, tail, axis=0),
+        "band_upper": quantile(fraction, 1 - tail, axis=0),
+    }
+
+
+def _init_worker(graph: CSRGraph) -> None:
+    """Keep the read-only graph and its undirected CSR arrays in the worker process."""
+    _WORKER_GRAPH["graph"] = graph
+    _WORKER_GRAPH["indptr"], _WORKER_GRAPH["indices"] = _undirected_csr(graph)
+
+
+def _undirected_csr(graph: CSRGraph) -> Tuple[ndarray, ndarray]:
+    """CSR arrays with both arcs of every edge, reusing the graph ones if undirected."""
+    if not graph.is_directed():
+        return graph.indptr, graph.indices
+    arc_src = concatenate([graph.edge_src, graph.edge_dst])
+    arc_dst = concatenate([graph.edge_dst, graph.edge_src])
+    indptr = zeros(graph.number_of_nodes() + 1, dtype=int64)
+    indptr[1:] = cumsum(bincount(arc_src, minlength=graph.number_of_nodes()))
+    return indptr, arc_dst[argsort(arc_src, kind="stable")]
+
+
+def _map_batches(graph: CSRGraph, mode: str, batches: List[tuple], processes: int) -> Iterator[ndarray]:
+    """Yield the giant sizes of every batch, in order, serially or on a process pool."""
+    task = partial(_percolation_batch, mode=mode)
+    if processes <= 1 or len(batches) <= 1:
+        _init_worker(graph)
+        try:
+            yield from map(task, batches)
+        finally:
+            _WORKER_GRAPH.clear()
+        return
+    with ProcessPoolExecutor(
+            max_workers=min(processes, len(batches)), initializer=_init_worker, initargs=(graph,)
+            ) as executor:
+        yield from executor.map(task, batches)
+
+
+def _percolation_batch(batch: Tuple[int, SeedSequence], mode: str="node") -> ndarray:
+    """
+    Size of the largest cluster of every trial of a batch, as a
+    `(trials, elements + 1)` array whose column k is the size with k elements added.
+    """
+    num_trials, seed = batch
+    graph = _WORKER_GRAPH["graph"]
+    num_nodes = graph.number_of_nodes()
+    num_elements = num_nodes if mode == "node" else graph.number_of_edges()
+    orders = default_rng(seed).permuted(
+        repeat(arange(num_elements, dtype=int32)[None, :], num_trials, axis=0), axis=1
+    )
+    forest = _Forests(num_trials, num_nodes, occupied=mode == "edge")
+    giant = zeros((num_trials, num_elements + 1), dtype=int32)
+    giant[:, 0] = forest.giant
+    trials = arange(num_trials)
+    for step in range(num_elements):
+        if mode == "node":
+            forest.add_nodes(orders[:, step], _WORKER_GRAPH["indptr"], _WORKER_GRAPH["indices"])
+        else:
+            edges = orders[:, step]
+            forest.union(trials, graph.edge_src[edges], graph.edge_dst[edges])
+        giant[:, step + 1] = forest.giant
+    return giant
+
+
+class _Forests:
+    """
+    Union-find forests (union by size, path halving) of many independent trials
+    over the same nodes, stored in flat arrays where node `v` of trial `t` is
+    the slot `t * num_nodes + v`.
+    """
+
+    def __init__(self, num_trials: int, num_nodes: int, occupied: bool) -> None:
+        self.offset = arange(num_trials, dtype=int64) * num_nodes
+        self.parent = arange(num_trials * num_nodes, dtype=int64)
+        self.size = ones(num_trials * num_nodes, dtype=int64)
+        self.occupied = zeros(num_trials * num_nodes, dtype=bool)
+        self.occupied[:] = occupied
+        self.giant = zeros(num_trials, dtype=int64)
+        self.giant[:] = int(occupied and num_nodes > 0)
+
+    def find(self, slots: ndarray) -> ndarray:
+        """Root slot of every slot."""
+        roots = slots
+        while True:
+            parents = self.parent[roots]
+            moving = parents != roots
+            if not moving.any():
+                return roots
+            grandparents = self.parent[parents]
+            self.parent[roots[moving]] = grandparents[moving]
+            roots = where(moving, grandparents, roots)
+
+    def union(self, trials: ndarray, u: ndarray, v: ndarray) -> None:
+        """Merge the clusters of `u` and `v`, at most one pair per trial."""
+        root_u = self.find(self.offset[trials] + u)
+        root_v = self.find(self.offset[trials] + v)
+        distinct = root_u != root_v
+        trials, root_u, root_v = trials[distinct], root_u[distinct], root_v[distinct]
+        swap = self.size[root_u] < self.size[root_v]
+        big = where(swap, root_v, root_u)
+        small = where(swap, root_u, root_v)
+        self.parent[small] = big
+        self.size[big] += self.size[small]
+        self.giant[trials] = maximum(self.giant[trials], self.size[big])
+
+    def add_nodes(self, nodes: ndarray, indptr: ndarray, indices: ndarray) -> None:
+        """Occupy one node per trial and merge it with its occupied neighbours."""
+        trials = arange(len(nodes))
+        self.occupied[self.offset + nodes] = True
+        self.giant = maximum(self.giant, 1)
+        start, degree = indptr[nodes], indptr[nodes + 1] - indptr[nodes]
+        # The j-th neighbour of every new node is merged at once, so each call
+        # still holds at most one pair per trial.
+        for neighbour in range(int(degree.max(initial=0))):
+            has = degree > neighbour
+            current, others = trials[has], indices[start[has] + neighbour]
+            occupied = self.occupied[self.offset[current] + others]
+            self.union(current[occupied], nodes[has][occupied], others[occupied])
+
+
+class AttackEngine:
+    """
+    Targeted attack: repeatedly remove the most central node left.
+
+    Parameters
+    ----------
+    dataframe : DataFrame
+        Table with the `net_*.csv` layout, as `CollapseEngine` expects it.
+    strategy : str, optional
+        Centrality ranking the nodes, 'betweenness' or 'degree', as
+        `get_basic_statistics` computes them. Default is 'betweenness'.
+    recompute_every : int, optional
+        Removals between two betweenness recomputations. In between, the nodes
+        are ranked by the last computed scores. Degrees are always exact.
+        Default is 1.
+    efficiency : bool, optional
+        Whether to record the global efficiency, which keeps a hop matrix up to
+        date. Default is True.
+    measure_every : int, optional
+        Removals between two efficiency measurements, the other steps record
+        NaN. The giant component is measured at every step. Default is 1.
+    batch_size : int, optional
+        Number of sources traversed together. Default is 128.
+    processes : int, optional
+        Number of worker processes for the sweeps. Default is 1.
+
+    Raises
+    ------
+    ValueError
+        If `strategy` is not valid or `recompute_every` or `measure_every` is
+        smaller than 1.
+
+    Examples
+    --------
+    >>> from pandas import read_csv
+    >>> attack = AttackEngine(read_csv("data/net_distrito.csv"), strategy="degree")
+    >>> curve = attack.run(steps=5)
+    >>> curve[["node", "giant_fraction", "efficiency"]].round(4)
+       node  giant_fraction  efficiency
+    0   NaN          1.0000      0.5698
+    1   3.0          0.9524      0.5016
+    2   9.0          0.9048      0.4307
+    3   4.0          0.8571      0.3617
+    4  15.0          0.8095      0.3114
+    5   2.0          0.7619      0.2525
+
+    Notes
+    -----
+    - The removals are applied on a `CollapseEngine`, so the components are
+      split and only the sources whose shortest paths change are traversed
+      again, when the efficiency is measured. On a network with hubs like
+      `net_busstop.csv` that is most of them, so measuring every few removals
+      divides the cost of the run.
+    - Removing a node only changes the betweenness inside its own component.
+      A recomputation only runs the Brandes sweep on the components touched
+      since the previous one and keeps the scores of the rest, which are exact.
+    - `history` holds one row per step, the first one for the intact network:
+      `step`, `node`, `score` (normalized betweenness or degree of the removed
+      node), `num_nodes`, `num_components`, `giant_fraction` (share of the
+      baseline nodes in the largest component), `efficiency` (mean of `1/d`
+      over the ordered pairs of baseline nodes, 0 for unreachable pairs) and
+      `seconds`.
+    - `save` writes a JSON checkpoint and `resume` continues from it with the
+      same results as an uninterrupted run.
+    """
+
+    def __init__(
+            self, dataframe: DataFrame, strategy: str="betweenness", recompute_every: int=1,
+            efficiency: bool=True, measure_every: int=1, batch_size: int=128, processes: int=1
+            ) -> None:
+        if strategy not in ATTACK_STRATEGIES:
+            raise ValueError((f"You have passed strategy={strategy} and the possible values are {ATTACK_STRATEGIES}."))
+        if recompute_every < 1:
+            raise ValueError((f"You have passed recompute_every={recompute_every} and it has to be at least 1."))
+        if measure_every < 1:
+            raise ValueError((f"You have passed measure_every={measure_every} and it has to be at least 1."))
+        self.strategy = strategy
+        self.recompute_every = recompute_every
+        self.efficiency = efficiency
+        self.measure_every = measure_every
+        self.batch_size = batch_size
+        self.processes = processes
+        self.engine = CollapseEngine(dataframe, batch_size=batch_size, processes=processes, precompute=efficiency)
+        num_nodes = self.engine.graph.number_of_nodes()
+        self.scores = zeros(num_nodes, dtype=float64)
+        self.dirty = ones(num_nodes, dtype=bool)
+        self.removed: List[Hashable] = []
+        self.history: List[Dict[str, Any]] = [self._measure(None, float("nan"), perf_counter())]
+
+    def advance(self) -> Dict[str, Any]:
+        """
+        Remove the highest ranked node left.
+
+        Returns
+        -------
+        Dict[str, Any]
+            The row added to `history`.
+        """
+        start = perf_counter()
+        engine = self.engine
+        if self.strategy == "degree":
+            self.scores = engine.degree.astype(float64)
+        elif len(self.removed) % self.recompute_every == 0:
+            self._update_betweenness()
+        target = int(where(engine.node_alive, self.scores, -inf).argmax())
+        label = engine.labels[target]
+        self.dirty |= engine.labels == label
+        node = engine.graph.node_ids[target:target + 1].tolist()[0]
+        engine.remove_nodes([node])
+        self.removed.append(node)
+        num_nodes = engine.graph.number_of_nodes()
+        score = self.scores[target]
+        if self.strategy == "betweenness" and num_nodes > 2:
+            score /= (num_nodes - 1) * (num_nodes - 2)
+        self.history.append(self._measure(node, float(score), start))
+        return self.history[-1]
+
+    def run(
+            self, steps: Optional[int]=None, checkpoint_path: Optional[str]=None, checkpoint_every: int=10
+            ) -> DataFrame:
+        """
+        Keep removing nodes and return the attack curve.
+
+        Parameters
+        ----------
+        steps : int, optional
+            Total number of removals, counting the ones already done. Default is
+            None, which goes on until no node is left.
+        checkpoint_path : str, optional
+            JSON file where the progress is saved. Default is None.
+        checkpoint_every : int, optional
+            Removals between two checkpoints. Default is 10.
+
+        Returns
+        -------
+        DataFrame
+            `history` as a table.
+        """
+        while self.engine.node_alive.any() and (steps is None or len(self.removed) < steps):
+            self.advance()
+            if checkpoint_path is not None and len(self.removed) % checkpoint_every == 0:
+                self.save(checkpoint_path)
+        if checkpoint_path is not None:
+            self.save(checkpoint_path)
+        return DataFrame(self.history)
+
+    def save(self, checkpoint_path: str) -> None:
+        """Write the progress to `checkpoint_path`, replacing it atomically."""
+        state = {
+            "fingerprint": self.engine.graph.fingerprint(),
+            "strategy": self.strategy,
+            "recompute_every": self.recompute_every,
+            "efficiency": self.efficiency,
+            "measure_every": self.measure_every,
+            "removed": self.engine.graph.index_of(self.removed).tolist(),
+            "scores": self.scores.tolist(),
+            "dirty": self.dirty.nonzero()[0].tolist(),
+            "history": self.history,
+        }
+        suffix = f".{getpid()}.tmp"
+        with open(f"{checkpoint_path}{suffix}", "w") as file:
+            file.write(dumps(state))
+        replace(f"{checkpoint_path}{suffix}", checkpoint_path)
+        logger.info(f"Attack checkpoint at step {len(self.removed)} written to {checkpoint_path}")
+
+    @classmethod
+    def resume(
+            cls, checkpoint_path: str, dataframe: DataFrame, batch_size: int=128, processes: int=1
+            ) -> "AttackEngine":
+        """
+        Rebuild an attack from a checkpoint written by `save`.
+
+        Parameters
+        ----------
+        checkpoint_path : str
+            The checkpoint file.
+        dataframe : DataFrame
+            The same table the attack was started with.
+        batch_size : int, optional
+            Number of sources traversed together. Default is 128.
+        processes : int, optional
+            Number of worker processes for the sweeps. Default is 1.
+
+        Returns
+        -------
+        AttackEngine
+            The attack, ready to `run` the remaining steps.
+
+        Raises
+        ------
+        ValueError
+            If `dataframe` does not build the graph of the checkpoint.
+        """
+        with open(checkpoint_path, "r") as file:
+            state = loads(file.read())
+        attack = cls(
+            dataframe, strategy=state["strategy"], recompute_every=state["recompute_every"],
+            efficiency=state["efficiency"], measure_every=state["measure_every"],
+            batch_size=batch_size, processes=processes
+        )
+        if attack.engine.graph.fingerprint() != state["fingerprint"]:
+            raise ValueError((f"You have passed checkpoint_path={checkpoint_path} and it was written for another graph."))
+        attack.removed = attack.engine.graph.node_ids[state["removed"]].tolist()
+        attack.engine.remove_nodes(attack.removed)
+        attack.scores = array(state["scores"], dtype=float64)
+        attack.dirty[:] = False
+        attack.dirty[state["dirty"]] = True
+        attack.history = state["history"]
+        return attack
+
+    def _update_betweenness(self) -> None:
+        """Run the Brandes sweep on the alive nodes of the touched components."""
+        engine = self.engine
+        positions = (self.dirty & engine.node_alive).nonzero()[0]
+        self.dirty[:] = False
+        if not len(positions):
+            return
+        subgraph = engine.subgraph(engine.graph.node_ids[positions])
+        sweep = bfs_sweep(subgraph, batch_size=self.batch_size, processes=self.processes)
+        # Undo the normalization so that scores of different sweeps compare.
+        num_nodes = len(positions)
+        scale = (num_nodes - 1) * (num_nodes - 2) if num_nodes > 2 else 1
+        self.scores[positions] = sweep["betweenness"] * scale
+
+    def _measure(self, node: Optional[Hashable], score: float, start: float) -> Dict[str, Any]:
+        """Row of `history` for the current state of the attack."""
+        engine = self.engine
+        labels = engine.labels[engine.labels >= 0]
+        sizes = bincount(labels) if len(labels) else zeros(1, dtype=int64)
+        num_nodes = engine.graph.number_of_nodes()
+        efficiency = float("nan")
+        if self.efficiency and len(self.removed) % self.measure_every == 0:
+            efficiency = float(engine.efficiency().mean())
+        return {
+            "step": len(self.removed),
+            "node": node,
+            "score": score,
+            "num_nodes": int(engine.node_alive.sum()),
+            "num_components": int((sizes > 0).sum()),
+            "giant_fraction": int(sizes.max()) / max(num_nodes, 1),
+            "efficiency": efficiency,
+            "seconds": perf_counter() - start,
+        }
+
+
+class CascadeEngine:
+    """
+    Cascading overload failures driven by betweenness load (Motter and Lai, 2002).
+
+    The load of a node is its betweenness, the number of shortest paths through
+    it, and its capacity is `(1 + alpha)` times its load in the intact network.
+    After an initial removal the loads are recomputed, every node over capacity
+    fails and the process repeats until no node fails.
+
+    Parameters
+    ----------
+    graph : CSRGraph
+        The input graph.
+    approximate : int, optional
+        Number of pivot sources used to estimate the loads, as in
+        `get_basic_statistics`. Default is None, which computes them exactly.
+    seed : int, optional
+        Seed of the pivot sampling. Default is 42.
+    batch_size : int, optional
+        Number of sources traversed together. Default is 128.
+    processes : int, optional
+        Number of worker processes for the sweeps. Default is 1.
+
+    Examples
+    --------
+    >>> import networkx as nx
+    >>> engine = CascadeEngine(CSRGraph.from_networkx(nx.karate_club_graph()))
+    >>> engine.run(initial=[0], alpha=0.2)["failed"]
+    [1, 3, 4, 10, 23, 24, 27, 28, 30, 9]
+    >>> engine.sweep({"hub": [0], "pair": [0, 33]}, alphas=[0.0, 0.5, 1.0]).round(4)
+       name  alpha  initial  failed  rounds  giant_fraction
+    0   hub    0.0        1      11       1          0.4412
+    1   hub    0.5        1       7       2          0.5000
+    2   hub    1.0        1       5       2          0.5588
+    3  pair    0.0        2      12       1          0.0882
+    4  pair    0.5        2      10       1          0.1471
+    5  pair    1.0        2       8       2          0.2059
+
+    Notes
+    -----
+    - Removing nodes only changes the loads inside the components they belonged
+      to, so every round only runs the Brandes sweep over those components and
+      keeps the loads of the rest.
+    - The loads of every set of failed nodes reached so far are memoized. The
+      cascades of a sweep start from the same initial removal and, for close
+      values of `alpha`, go through the same intermediate sets, so most rounds
+      of a sweep are read from memory. `clear` releases them.
+    - A node fails when its load exceeds its capacity by more than a relative
+      `1e-9`, so rounding in the recomputed loads does not trigger failures.
+    - With `approximate` the loads are estimates; capacities and loads are
+      estimated from the same pivots (a fresh sample per component), so close
+      calls can differ from the exact cascade.
+    """
+
+    def __init__(
+            self, graph: CSRGraph, approximate: Optional[int]=None, seed: int=42,
+            batch_size: int=128, processes: int=1
+            ) -> None:
+        self.graph = graph
+        self.approximate = approximate
+        self.seed = seed
+        self.batch_size = batch_size
+        self.processes = processes
+        num_nodes = graph.number_of_nodes()
+        _, labels = connected_components(graph.adjacency(), directed=False)
+        self.initial_load = self._loads(arange(num_nodes))
+        self._states: Dict[FrozenSet[int], Tuple[ndarray, ndarray]] = {
+            frozenset(): (self.initial_load, labels.astype(int32))
+        }
+
+    def run(self, initial: Iterable[Hashable], alpha: float) -> Dict[str, Any]:
+        """
+        Simulate the cascade started by removing `initial`.
+
+        Parameters
+        ----------
+        initial : Iterable[Hashable]
+            Original ids of the nodes removed at the start.
+        alpha : float
+            Tolerance parameter, the spare capacity of every node.
+
+        Returns
+        -------
+        Dict[str, Any]
+            - `alpha`: the tolerance parameter.
+            - `initial`: number of initially removed nodes.
+            - `failed`: ids of the nodes that failed by overload, in order.
+            - `rounds`: number of rounds with failures.
+            - `round_failures`: nodes failed in every round.
+            - `giant_fraction`: share of the nodes in the largest component left.
+
+        Raises
+        ------
+        KeyError
+            If some initial node is not in the graph.
+        ValueError
+            If `alpha` is negative.
+        """
+        if alpha < 0:
+            raise ValueError((f"You have passed alpha={alpha} and it has to be non negative."))
+        capacity = (1 + alpha) * self.initial_load
+        initial = self.graph.index_of(initial)
+        failed = frozenset(initial.tolist())
+        order, round_failures = [], []
+        loads, labels = self._state(failed, frozenset())
+        while True:
+            alive = labels >= 0
+            overloaded = (alive & (loads > capacity + 1e-9 * maximum(capacity, 1.0))).nonzero()[0]
+            if not len(overloaded):
+                break
+            order.extend(overloaded.tolist())
+            round_failures.append(len(overloaded))
+            previous = failed
+            failed = failed | frozenset(overloaded.tolist())
+            loads, labels = self._state(failed, previous)
+        sizes = bincount(labels[labels >= 0]) if (labels >= 0).any() else zeros(1, dtype=int64)
+        return {
+            "alpha": alpha,
+            "initial": len(failed - frozenset(order)),
+            "failed": self.graph.node_ids[order].tolist(),
+            "rounds": len(round_failures),
+            "round_failures": round_failures,
+            "giant_fraction": int(sizes.max()) / max(self.graph.number_of_nodes(), 1),
+        }
+
+    def sweep(self, initial_sets: Dict[str, Iterable[Hashable]], alphas: Iterable[float]) -> DataFrame:
+        """
+        Run the cascade of every initial set for every tolerance.
+
+        Parameters
+        ----------
+        initial_sets : Dict[str, Iterable[Hashable]]
+            Initial removals by name.
+        alphas : Iterable[float]
+            Tolerance parameters.
+
+        Returns
+        -------
+        DataFrame
+            One row per initial set and tolerance with the columns `name`,
+            `alpha`, `initial`, `failed` (number of overload failures), `rounds`
+            and `giant_fraction`.
+        """
+        alphas = sorted(alphas)
+        rows = []
+        for name, initial in initial_sets.items():
+            initial = list(initial)
+            for alpha in alphas:
+                cascade = self.run(initial, alpha)
+                rows.append({
+                    "name": name, "alpha": alpha, "initial": cascade["initial"],
+                    "failed": len(cascade["failed"]), "rounds": cascade["rounds"],
+                    "giant_fraction": cascade["giant_fraction"],
+                })
+        return DataFrame(rows)
+
+    def clear(self) -> None:
+        """Forget the memoized states, except the intact network."""
+        self._states = {frozenset(): self._states[frozenset()]}
+
+    def _state(self, failed: FrozenSet[int], previous: FrozenSet[int]) -> Tuple[ndarray, ndarray]:
+        """Loads and component labels (-1 for failed nodes) once `failed` are removed."""
+        if failed in self._states:
+            return self._states[failed]
+        previous_loads, previous_labels = self._states[previous]
+        removed = array(sorted(failed - previous), dtype=int64)
+        alive = previous_labels >= 0
+        alive[removed] = False
+        touched = unique(previous_labels[removed])
+        positions = (alive & isin(previous_labels, touched)).nonzero()[0]
+        loads = previous_loads.copy()
+        loads[~alive] = 0.0
+        loads[positions] = self._loads(positions)
+        keep = alive.nonzero()[0]
+        adjacency = self.graph.adjacency()[keep][:, keep]
+        _, labels = connected_components(adjacency, directed=False)
+        all_labels = zeros(len(alive), dtype=int32) - 1
+        all_labels[keep] = labels
+        self._states[failed] = (loads, all_labels)
+        return self._states[failed]
+
+    def _loads(self, positions: ndarray) -> ndarray:
+        """Betweenness, as a count of shortest paths, of the subgraph induced by `positions`."""
+        num_nodes = len(positions)
+        if num_nodes <= 2:
+            return zeros(num_nodes, dtype=float64)
+        subgraph = _induced_subgraph(self.graph, positions)
+        if self.approximate is None:
+            betweenness = bfs_sweep(
+                subgraph, batch_size=self.batch_size, processes=self.processes
+            )["betweenness"]
+        else:
+            betweenness = approximate_sweep(
+                subgraph, k=min(self.approximate, num_nodes), seed=self.seed,
+                batch_size=self.batch_size, processes=self.processes
+            )["betweenness"]
+        # Undo the normalization so that loads of different subgraphs compare.
+        return betweenness * ((num_nodes - 1) * (num_nodes - 2))
+
+
+def _induced_subgraph(graph: CSRGraph, positions: ndarray) -> CSRGraph:
+    """Graph induced by the sorted node `positions`, renumbered from 0."""
+    inside = zeros(graph.number_of_nodes(), dtype=bool)
+    inside[positions] = True
+    edges = (inside[graph.edge_src] & inside[graph.edge_dst]).nonzero()[0]
+    index = zeros(graph.number_of_nodes(), dtype=int32)
+    index[positions] = arange(len(positions), dtype=int32)
+    return CSRGraph(
+        node_ids=graph.node_ids[positions], edge_src=index[graph.edge_src[edges]],
+        edge_dst=index[graph.edge_dst[edges]], weight=graph.weight[edges], directed=graph.directed
+    )
@@ -0,0 +1,277 @@
+from hashlib import sha256
+from json import dumps, loads
+from math import prod
+from os import getpid, path, replace
+from typing import Dict, Optional
+
+from numpy import (
+    arange, argsort, ascontiguousarray, asarray, bincount, cumsum, diff, dtype, int32, int64, memmap,
+    ndarray, ones, repeat, searchsorted, uint8, unique, zeros,
+)
+from pandas import DataFrame, factorize
+
+from toolbox.graph import CSRGraph, _last_distinct
+from toolbox.storage import load_table
+
+SNAPSHOT_VERSION = 1
+
+_MAGIC = b"EMTGRAPH"
+_ALIGNMENT = 64
+_CHECKSUM_BYTES = 1 << 24
+
+
+class GraphSnapshot:
+    """
+    Graph of a network together with the lines serving every edge, storable as
+    a single file that loads by memory-mapping it.
+
+    Parameters
+    ----------
+    graph : CSRGraph
+        The graph of the network.
+    n_buses : ndarray
+        Number of lines between the two ends of every edge, the `n_buses` column.
+    lines : ndarray
+        Sorted line codes, padded with zeros to 5 characters.
+    line_ptr : ndarray
+        `(num_edges + 1,)` offsets of the lines of every edge in `line_ids`.
+    line_ids : ndarray
+        Positions in `lines` of the lines of every edge, edge after edge.
+    path : str, optional
+        File the snapshot was loaded from or saved to. Default is None.
+    checksum : str, optional
+        SHA-256 of the arrays in that file. Default is None.
+
+    Examples
+    --------
+    >>> from pandas import read_csv
+    >>> snapshot = GraphSnapshot.from_dataframe(read_csv("data/net_distrito.csv"))
+    >>> checksum = snapshot.save("/tmp/net_distrito.graph")
+    >>> GraphSnapshot.load("/tmp/net_distrito.graph").graph.number_of_nodes()
+    21
+
+    Notes
+    -----
+    - The file starts with the 8 bytes `EMTGRAPH`, the length of a JSON header
+      as a little-endian uint64 and the header, which holds the format version,
+      the direction, the checksum and the dtype, shape and offset of every
+      array. The arrays follow, each one aligned to 64 bytes.
+    - `load` memory-maps the file read-only and every array is a view of the
+      map, so nothing is parsed nor copied and the processes loading the same
+      file, such as several Streamlit workers, share its physical pages.
+    - The checksum covers every array byte. Verifying it reads the file once,
+      which is what detects truncated or corrupted snapshots.
+    - Node ids are stored as they are when numeric and as fixed-width unicode
+      otherwise. The rows of the source table are not stored, so the loaded
+      graph has no `row_edge`.
+    """
+
+    def __init__(
+            self, graph: CSRGraph, n_buses: ndarray, lines: ndarray, line_ptr: ndarray,
+            line_ids: ndarray, path: Optional[str]=None, checksum: Optional[str]=None
+            ) -> None:
+        self.graph = graph
+        self.n_buses = n_buses
+        self.lines = lines
+        self.line_ptr = line_ptr
+        self.line_ids = line_ids
+        self.path = path
+        self.checksum = checksum
+
+    @classmethod
+    def from_dataframe(cls, dataframe: DataFrame, directed: bool=False) -> "GraphSnapshot":
+        """
+        Build the snapshot of a table with the `net_*.csv` layout.
+
+        Parameters
+        ----------
+        dataframe : DataFrame
+            Table with the `net_*.csv` columns, including `edge` with the line of
+            every row and, optionally, `n_buses`.
+        directed : bool, optional
+            Whether the edges are directed. Default is False.
+
+        Returns
+        -------
+        GraphSnapshot
+            The snapshot, held in memory until `save` is called.
+        """
+        graph = CSRGraph.from_dataframe(dataframe, directed=directed)
+        num_edges = graph.number_of_edges()
+        codes, lines = factorize(dataframe["edge"].astype(str).str.zfill(5), sort=True)
+        pairs = unique(graph.row_edge.astype(int64) * len(lines) + codes)
+        edges, line_ids = pairs // len(lines), (pairs % len(lines)).astype(int32)
+        line_ptr = zeros(num_edges + 1, dtype=int64)
+        line_ptr[1:] = cumsum(bincount(edges, minlength=num_edges))
+        if "n_buses" in dataframe:
+            n_buses = dataframe["n_buses"].to_numpy(dtype=int32)
+            n_buses = n_buses[_last_distinct(graph.row_edge, n_buses[:, None], num_edges)]
+        else:
+            n_buses = ones(num_edges, dtype=int32)
+        return cls(graph, n_buses, asarray(lines, dtype=str), line_ptr, line_ids)
+
+    def line_count(self) -> ndarray:
+        """Number of lines serving every edge."""
+        return diff(self.line_ptr)
+
+    def line_edges(self) -> Dict[str, ndarray]:
+        """Edges served by every line, keyed by the padded line code."""
+        edges = repeat(arange(self.graph.number_of_edges(), dtype=int32), self.line_count())
+        order = argsort(self.line_ids, kind="stable")
+        bounds = searchsorted(self.line_ids[order], arange(len(self.lines) + 1))
+        return {
+            line: edges[order[lower:upper]]
+            for line, lower, upper in zip(self.lines.tolist(), bounds[:-1], bounds[1:])
+        }
+
+    def save(self, snapshot_path: str) -> str:
+        """
+        Write the snapshot to a file, atomically.
+
+        Parameters
+        ----------
+        snapshot_path : str
+            Destination file, usually `net_<name>.graph`.
+
+        Returns
+        -------
+        str
+            Checksum of the written arrays.
+
+        Raises
+        ------
+        ValueError
+            If the node ids are neither numeric nor strings.
+        """
+        arrays = self._arrays()
+        specs, size = {}, 0
+        for name, values in arrays.items():
+            size = _aligned(size)
+            specs[name] = {"dtype": values.dtype.str, "shape": list(values.shape), "offset": size}
+            size += values.nbytes
+        payload = bytearray(size)
+        for name, values in arrays.items():
+            offset = specs[name]["offset"]
+            payload[offset:offset + values.nbytes] = values.tobytes()
+        checksum = sha256(payload).hexdigest()
+        header = dumps({
+            "version": SNAPSHOT_VERSION, "directed": self.graph.is_directed(),
+            "checksum": checksum, "arrays": specs,
+        }).encode()
+        prefix = _MAGIC + len(header).to_bytes(8, "little") + header
+        temporary_path = f"{snapshot_path}.{getpid()}.tmp"
+        with open(temporary_path, "wb") as file:
+            file.write(prefix + bytes(_aligned(len(prefix)) - len(prefix)))
+            file.write(payload)
+        replace(temporary_path, snapshot_path)
+        self.path, self.checksum = snapshot_path, checksum
+        return checksum
+
+    def _arrays(self) -> Dict[str, ndarray]:
+        """Every array of the snapshot, contiguous and with a fixed-size dtype."""
+        graph = self.graph
+        node_ids = graph.node_ids
+        if node_ids.dtype.kind == "O":
+            if not all(isinstance(node, str) for node in node_ids.tolist()):
+                raise ValueError("The node ids have to be all numbers or all strings to be stored.")
+            node_ids = asarray(node_ids.tolist(), dtype=str)
+        arrays = {
+            "node_ids": node_ids, "edge_src": graph.edge_src, "edge_dst": graph.edge_dst,
+            "weight": graph.weight, "indptr": graph.indptr, "indices": graph.indices,
+            "arc_edge": graph.arc_edge, "n_buses": self.n_buses, "lines": self.lines,
+            "line_ptr": self.line_ptr, "line_ids": self.line_ids,
+        }
+        if graph.pos is not None:
+            arrays["pos"] = graph.pos
+        return {name: ascontiguousarray(values) for name, values in arrays.items()}
+
+    @classmethod
+    def load(cls, snapshot_path: str, verify: bool=True) -> "GraphSnapshot":
+        """
+        Memory-map a snapshot written by `save`.
+
+        Parameters
+        ----------
+        snapshot_path : str
+            File to load.
+        verify : bool, optional
+            Whether to check the arrays against the stored checksum. Default is True.
+
+        Returns
+        -------
+        GraphSnapshot
+            The snapshot, with read-only arrays backed by the file.
+
+        Raises
+        ------
+        ValueError
+            If the file is not a snapshot, was written by another version of the
+            format or does not match its checksum.
+        """
+        data = memmap(snapshot_path, dtype=uint8, mode="r")
+        if bytes(data[:len(_MAGIC)]) != _MAGIC:
+            raise ValueError((f"You have passed snapshot_path={snapshot_path} and it is not a graph snapshot."))
+        header_end = len(_MAGIC) + 8 + int.from_bytes(bytes(data[len(_MAGIC):len(_MAGIC) + 8]), "little")
+        header = loads(bytes(data[len(_MAGIC) + 8:header_end]))
+        if header["version"] != SNAPSHOT_VERSION:
+            raise ValueError((
+                f"You have passed snapshot_path={snapshot_path} with version {header['version']} "
+                f"and the supported version is {SNAPSHOT_VERSION}."
+            ))
+        payload = data[_aligned(header_end):]
+        if verify:
+            digest = sha256()
+            for start in range(0, len(payload), _CHECKSUM_BYTES):
+                digest.update(payload[start:start + _CHECKSUM_BYTES])
+            if digest.hexdigest() != header["checksum"]:
+                raise ValueError((
+                    f"You have passed snapshot_path={snapshot_path} and its content does not match "
+                    f"its checksum, write it again."
+                ))
+        arrays = {}
+        for name, spec in header["arrays"].items():
+            array_dtype = dtype(spec["dtype"])
+            size = array_dtype.itemsize * prod(spec["shape"])
+            arrays[name] = payload[spec["offset"]:spec["offset"] + size].view(array_dtype).reshape(spec["shape"])
+        graph = CSRGraph(
+            node_ids=arrays["node_ids"], edge_src=arrays["edge_src"], edge_dst=arrays["edge_dst"],
+            weight=arrays["weight"], pos=arrays.get("pos"), directed=header["directed"],
+            csr=(arrays["indptr"], arrays["indices"], arrays["arc_edge"]),
+        )
+        return cls(
+            graph, arrays["n_buses"], arrays["lines"], arrays["line_ptr"], arrays["line_ids"],
+            path=snapshot_path, checksum=header["checksum"]
+        )
+
+
+def load_network(name: str, data_dir: str="data", verify: bool=True) -> GraphSnapshot:
+    """
+    Snapshot of a network of `data_dir`, memory-mapped when its file is up to date.
+
+    Parameters
+    ----------
+    name : str
+        Name of the table, for instance 'net_busstop'.
+    data_dir : str, optional
+        Folder with the tables and the snapshots. Default is 'data'.
+    verify : bool, optional
+        Whether to check the snapshot against its checksum. Default is True.
+
+    Returns
+    -------
+    GraphSnapshot
+        The snapshot read from `<name>.graph`, or built from the table with
+        `toolbox.storage.load_table` when that file is missing or older than
+        the CSV file.
+    """
+    snapshot_path = path.join(data_dir, f"{name}.graph")
+    csv_path = path.join(data_dir, f"{name}.csv")
+    if path.exists(snapshot_path) and (
+            not path.exists(csv_path) or path.getmtime(snapshot_path) >= path.getmtime(csv_path)):
+        return GraphSnapshot.load(snapshot_path, verify=verify)
+    return GraphSnapshot.from_dataframe(load_table(name, data_dir=data_dir))
+
+
+def _aligned(offset: int) -> int:
+    """Smallest multiple of the alignment not lower than `offset`."""
+    return -(-offset // _ALIGNMENT) * _ALIGNMENT
@@ -0,0 +1,372 @@
+from collections.abc import Mapping
+from typing import Any, Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Union
+
+from networkx import (
+    Graph, DiGraph, NetworkXError, density,
+    degree_centrality, in_degree_centrality, out_degree_centrality,
+)
+from numpy import array
+from numpy import mean as npmean
+from numpy import median as npmedian
+from numpy import std as npstd
+
+from toolbox.cache import StatsCache
+from toolbox.graph import CSRGraph
+from toolbox.metrics import approximate_sweep, bfs_sweep, efficiency_sweep, leading_eigenvector
+
+
+class GraphStats(Mapping):
+    """
+    Lazy, memoized statistics of a graph.
+
+    It behaves as the dictionary returned by `get_basic_statistics`, but every
+    metric is computed the first time it is read and kept afterwards. Metrics
+    that come from the same computation are produced together: reading
+    `diameter` after `mean_sp` reuses the BFS sweep that produced `mean_sp`.
+
+    Parameters
+    ----------
+    network : Graph, DiGraph or CSRGraph
+        The input graph. A `CSRGraph`, such as the scenario returned by
+        `CollapseEngine.subgraph`, is used as it is, without building a
+        NetworkX graph nor copying its arrays.
+    metrics : List[str], optional
+        Metrics to compute right away. When given, only these metrics are
+        exposed and they are computed with the fewest passes over the graph.
+        Default is None, which exposes every metric and computes them on access.
+    distances_path : str, optional
+        `.npy` file where the all-pairs distance matrix (`sp`) is memory-mapped.
+        Default is None, which keeps it in memory.
+    processes : int, optional
+        Number of worker processes used for the shortest path sweep. Default is 1.
+    approximate : int, optional
+        Number of sampled pivot nodes used to estimate the path metrics.
+        Default is None, which computes them exactly.
+    seed : int, optional
+        Seed of the pivot sampling when `approximate` is set. Default is 42.
+    confidence : float, optional
+        Confidence level of the error bounds when `approximate` is set. Default is 0.95.
+    cache : StatsCache, optional
+        On-disk cache where the computed metrics are read from and written to.
+        Default is None.
+    precomputed : Dict[str, Any], optional
+        Metrics already known for this graph, for instance from a `CollapseEngine`.
+        They are exposed as they are and never recomputed nor cached. Default is None.
+    eig_start : Dict[Hashable, float], optional
+        Eigenvector centrality of a similar graph used as warm start of the
+        eigensolver. Nodes missing from it start at 0. Default is None.
+    weight : str, optional
+        Edge attribute used as length of the path metrics (`mean_sp`,
+        `mean_net_sp`, `diameter` and `closeness_centrality`), for instance
+        `metres` or `seconds`. Default is None, which counts hops. With a
+        `CSRGraph` the lengths are its `weight` array whatever the name.
+
+    Raises
+    ------
+    ValueError
+        If any of the `metrics` is not available for the graph, or `weight` is
+        combined with `approximate`.
+
+    Examples
+    --------
+    >>> import networkx as nx
+    >>> G = nx.Graph()
+    >>> G.add_edges_from([(1, 2), (2, 3), (3, 4), (4, 5)])
+    >>> statistics = GraphStats(G)
+    >>> statistics["diameter"]
+    4
+    >>> statistics.computed()
+    ['mean_sp', 'mean_net_sp', 'diameter', 'closeness_centrality']
+    >>> dict(GraphStats(G, metrics=["num_nodes", "mean_net_sp"]))
+    {'num_nodes': 5, 'mean_net_sp': 2.0}
+
+    Notes
+    -----
+    - Metrics are grouped by the computation producing them: the graph summary,
+      the degree statistics, the BFS sweep (`mean_sp`, `mean_net_sp`, `diameter`,
+      `closeness_centrality`), the Brandes accumulation (`betweeness_centrality`),
+      the distance matrix (`sp`), the efficiency over all pairs
+      (`global_efficiency`, `reachability`) and the eigenvector centrality with
+      its solver diagnostics (`eig_diagnostics`).
+    - `global_efficiency` and `reachability` count hops and, unlike the path
+      metrics, also work on disconnected graphs: unreachable pairs count as 0.
+    - The BFS sweep only accumulates betweenness and keeps the distance matrix
+      when those metrics are wanted, either because they were selected with
+      `metrics` or because they are being read. Reading them after the other
+      path metrics costs a second full sweep, so list them in `metrics` or in
+      the same `compute` call when they are going to be needed.
+    - With a `cache`, the metrics already stored for the same graph and parameters
+      are loaded on creation and every newly computed group is stored back.
+    - The eigenvector centrality comes from ARPACK, or from LOBPCG when there is
+      an `eig_start` for an undirected graph, since LOBPCG makes the most of a
+      good starting vector (see `toolbox.metrics.leading_eigenvector`).
+    - With `weight` the path metrics come from Dijkstra and there is no `sp`
+      nor `betweeness_centrality`.
+    """
+
+    def __init__(
+            self, network: Union[Graph, DiGraph, CSRGraph], metrics: Optional[List[str]]=None,
+            distances_path: Optional[str]=None, processes: int=1,
+            approximate: Optional[int]=None, seed: int=42, confidence: float=0.95,
+            cache: Optional[StatsCache]=None, precomputed: Optional[Dict[str, Any]]=None,
+            eig_start: Optional[Dict[Hashable, float]]=None, weight: Optional[str]=None
+            ) -> None:
+        self.network = network
+        self.distances_path = distances_path
+        self.processes = processes
+        self.approximate = approximate if approximate is not None and approximate < network.number_of_nodes() else None
+        self.seed = seed
+        self.confidence = confidence
+        self.eig_start = eig_start
+        self.weight = weight
+        if weight is not None and self.approximate is not None:
+            raise ValueError("The weighted path metrics can not be approximated, use approximate=None.")
+        self._values = {}
+        self._wanted = set()
+        self._graph = network if isinstance(network, CSRGraph) else None
+        self._providers = self._build_providers()
+        self._deferred = False
+        self.cache = cache
+        if cache is not None:
+            self._cache_key = cache.key(self.graph, {
+                "approximate": self.approximate, "seed": self.seed, "confidence": self.confidence,
+                "weight": self.weight,
+            })
+            self._values.update(cache.load(self._cache_key, self.graph.node_ids.tolist()))
+        self._precomputed = dict(precomputed or {})
+        self._values.update(self._precomputed)
+        self.metrics = None
+        if metrics is not None:
+            unknown = [metric for metric in metrics if metric not in self._providers]
+            if unknown:
+                raise ValueError((
+                    f"You have passed metrics={unknown} that are not available. "
+                    f"The possible values are {list(self._providers)}."
+                ))
+            self.metrics = list(metrics)
+            self.compute(self.metrics)
+
+    def _build_providers(self) -> Dict[str, Callable[[], None]]:
+        """Map every available metric, in display order, to the method computing it."""
+        suffixes = ["", "_in", "_out"] if self.network.is_directed() else [""]
+        providers = dict.fromkeys(["graph_type", "num_nodes", "num_edges", "density"], self._summary)
+        providers.update(dict.fromkeys([f"centrality{suffix}" for suffix in suffixes], self._degrees))
+        for suffix in suffixes:
+            providers.update(dict.fromkeys([
+                f"ncn{suffix}", f"mean_ncn{suffix}", f"median_ncn{suffix}",
+                f"max_ncn{suffix}", f"min_ncn{suffix}", f"std_ncn{suffix}",
+            ], self._degrees))
+        if self.weight is not None:
+            providers.update(dict.fromkeys(["mean_sp", "mean_net_sp", "diameter"], self._paths))
+            providers["closeness_centrality"] = self._paths
+        elif self.approximate is None:
+            providers["sp"] = self._paths
+            providers.update(dict.fromkeys(["mean_sp", "mean_net_sp", "diameter"], self._paths))
+            providers.update(dict.fromkeys(["betweeness_centrality", "closeness_centrality"], self._paths))
+        else:
+            providers.update(dict.fromkeys([
+                "pivots", "mean_sp", "mean_sp_error", "mean_net_sp", "mean_net_sp_error",
+                "diameter", "diameter_bounds", "betweeness_centrality", "betweeness_centrality_error",
+                "closeness_centrality", "closeness_centrality_error",
+            ], self._approximate_paths))
+        providers.update(dict.fromkeys(["global_efficiency", "reachability"], self._efficiency))
+        providers.update(dict.fromkeys(["eig_centrality", "eig_diagnostics"], self._eigenvector))
+        return providers
+
+    @property
+    def graph(self) -> CSRGraph:
+        """Array-backed copy of the network, built on first use."""
+        if self._graph is None:
+            self._graph = CSRGraph.from_networkx(self.network, weight=self.weight or "weight")
+        return self._graph
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self._keys():
+            raise KeyError(key)
+        if key not in self._values:
+            self._wanted.add(key)
+            self._providers[key]()
+            self._values.update(self._precomputed)
+            if not self._deferred:
+                self._persist()
+        return self._values[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._keys())
+
+    def __len__(self) -> int:
+        return len(self._keys())
+
+    def _keys(self) -> List[str]:
+        return self.metrics if self.metrics is not None else list(self._providers)
+
+    def compute(self, metrics: Iterable[str]) -> "GraphStats":
+        """
+        Compute several metrics sharing as much work as possible.
+
+        Parameters
+        ----------
+        metrics : Iterable[str]
+            Names of the metrics to compute.
+
+        Returns
+        -------
+        GraphStats
+            The same object, for chaining.
+        """
+        metrics = list(metrics)
+        missing = [metric for metric in metrics if metric not in self._values]
+        self._wanted.update(metrics)
+        self._deferred = True
+        try:
+            for metric in metrics:
+                self[metric]
+        finally:
+            self._deferred = False
+        if missing:
+            self._persist()
+        return self
+
+    def computed(self) -> List[str]:
+        """Names of the metrics already computed, in display order."""
+        return [key for key in self._keys() if key in self._values]
+
+    def to_dict(self) -> dict:
+        """Compute every exposed metric and return them as a plain dictionary."""
+        self.compute(self._keys())
+        return {key: self._values[key] for key in self._keys()}
+
+    def _persist(self) -> None:
+        """Write the computed metrics to the cache, if any."""
+        if self.cache is not None:
+            values = {key: value for key, value in self._values.items() if key not in self._precomputed}
+            self.cache.store(self._cache_key, values, self.graph.node_ids.tolist())
+
+    def _summary(self) -> None:
+        if isinstance(self.network, CSRGraph):
+            num_nodes, num_edges = self.graph.number_of_nodes(), self.graph.number_of_edges()
+            pairs = num_nodes * (num_nodes - 1) if self.graph.is_directed() else num_nodes * (num_nodes - 1) / 2
+            self._values.update({
+                "graph_type": "direct" if self.graph.is_directed() else "undirect",
+                "num_nodes": num_nodes,
+                "num_edges": num_edges,
+                "density": num_edges / pairs if pairs else 0,
+            })
+            return
+        self._values.update({
+            "graph_type": "direct" if self.network.is_directed() else "undirect",
+            "num_nodes": self.network.number_of_nodes(),
+            "num_edges": self.network.number_of_edges(),
+            "density": density(self.network),
+        })
+
+    def _degrees(self) -> None:
+        if isinstance(self.network, CSRGraph):
+            self._csr_degrees()
+            return
+        network = self.network
+        degrees = [("", network.degree())] if not network.is_directed() else [
+            ("", network.degree()), ("_in", network.in_degree()), ("_out", network.out_degree())
+        ]
+        degrees_centrality = [("", degree_centrality(network))] if not network.is_directed() else [
+            ("", degree_centrality(network)),
+            ("_in", in_degree_centrality(network)),
+            ("_out", out_degree_centrality(network))
+        ]
+        for centrality_suffix, d_centrality in degrees_centrality:
+            self._values[f"centrality{centrality_suffix}"] = d_centrality
+        for degree_suffix, degree in degrees:
+            number_close_nodes = [ncn for _, ncn in degree]
+            self._values[f"ncn{degree_suffix}"] = number_close_nodes
+            self._values[f"mean_ncn{degree_suffix}"] = npmean(number_close_nodes)
+            self._values[f"median_ncn{degree_suffix}"] = npmedian(number_close_nodes)
+            self._values[f"max_ncn{degree_suffix}"] = max(number_close_nodes)
+            self._values[f"min_ncn{degree_suffix}"] = min(number_close_nodes)
+            self._values[f"std_ncn{degree_suffix}"] = npstd(number_close_nodes)
+
+    def _csr_degrees(self) -> None:
+        """Degree statistics read from the arrays of a `CSRGraph`, as `_degrees` does for NetworkX."""
+        graph = self.graph
+        nodes = graph.node_ids.tolist()
+        scale = 1 / (len(nodes) - 1) if len(nodes) > 1 else 1
+        degrees = [("", graph.degree())] if not graph.is_directed() else [
+            ("", graph.degree()), ("_in", graph.in_degree()), ("_out", graph.out_degree())
+        ]
+        for suffix, degree in degrees:
+            number_close_nodes = degree.tolist()
+            self._values[f"centrality{suffix}"] = dict(zip(nodes, (degree * scale).tolist()))
+            self._values[f"ncn{suffix}"] = number_close_nodes
+            self._values[f"mean_ncn{suffix}"] = npmean(number_close_nodes)
+            self._values[f"median_ncn{suffix}"] = npmedian(number_close_nodes)
+            self._values[f"max_ncn{suffix}"] = max(number_close_nodes)
+            self._values[f"min_ncn{suffix}"] = min(number_close_nodes)
+            self._values[f"std_ncn{suffix}"] = npstd(number_close_nodes)
+
+    def _paths(self) -> None:
+        weighted = self.weight is not None
+        with_betweenness = "betweeness_centrality" in self._wanted and not weighted
+        with_distances = "sp" in self._wanted and not weighted
+        sweep = bfs_sweep(
+            graph=self.graph, keep_distances=with_distances, distances_path=self.distances_path,
+            processes=self.processes, betweenness=with_betweenness, weighted=weighted
+        )
+        nodes = self.graph.node_ids.tolist()
+        if with_distances:
+            self._values["sp"] = sweep["distances"]
+            mean_shorter_paths = sweep["distances"].mean_sp()
+        else:
+            mean_shorter_paths = sweep["mean_sp"]
+        self._values["mean_sp"] = mean_shorter_paths.tolist()
+        self._values["mean_net_sp"] = npmean(mean_shorter_paths)
+        _check_connected(sweep["reachable"], len(nodes))
+        diameter = sweep["eccentricity"].max()
+        self._values["diameter"] = float(diameter) if weighted else int(diameter)
+        self._values["closeness_centrality"] = dict(zip(nodes, sweep["closeness"].tolist()))
+        if with_betweenness:
+            self._values["betweeness_centrality"] = dict(zip(nodes, sweep["betweenness"].tolist()))
+
+    def _approximate_paths(self) -> None:
+        sweep = approximate_sweep(
+            graph=self.graph, k=self.approximate, seed=self.seed,
+            confidence=self.confidence, processes=self.processes
+        )
+        nodes = self.graph.node_ids.tolist()
+        self._values.update({
+            "pivots": [nodes[position] for position in sweep["sources"]],
+            "mean_sp": sweep["mean_sp"].tolist(),
+            "mean_sp_error": sweep["mean_sp_error"].tolist(),
+            "mean_net_sp": sweep["mean_net_sp"],
+            "mean_net_sp_error": sweep["mean_net_sp_error"],
+        })
+        _check_connected(sweep["reachable"], len(nodes))
+        self._values.update({
+            "diameter": sweep["diameter"],
+            "diameter_bounds": sweep["diameter_bounds"],
+            "betweeness_centrality": dict(zip(nodes, sweep["betweenness"].tolist())),
+            "betweeness_centrality_error": dict(zip(nodes, sweep["betweenness_error"].tolist())),
+            "closeness_centrality": dict(zip(nodes, sweep["closeness"].tolist())),
+            "closeness_centrality_error": dict(zip(nodes, sweep["closeness_error"].tolist())),
+        })
+
+    def _efficiency(self) -> None:
+        sweep = efficiency_sweep(graph=self.graph, processes=self.processes)
+        self._values["global_efficiency"] = sweep["global_efficiency"]
+        self._values["reachability"] = sweep["reachability"]
+
+    def _eigenvector(self) -> None:
+        nodes = self.graph.node_ids.tolist()
+        start, method = None, "arpack"
+        if self.eig_start is not None:
+            start = array([self.eig_start.get(node, 0.0) for node in nodes])
+            method = "arpack" if self.network.is_directed() else "lobpcg"
+        result = leading_eigenvector(self.graph, start=start, method=method)
+        self._values["eig_centrality"] = dict(zip(nodes, result.pop("centrality").tolist()))
+        self._values["eig_diagnostics"] = result
+
+
+def _check_connected(reachable, num_nodes: int) -> None:
+    """Raise as `networkx.eccentricity` does when some source does not reach every node."""
+    if (reachable < num_nodes).any():
+        raise NetworkXError(
+            "Found infinite path length because the graph is not connected"
+        )
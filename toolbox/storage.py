@@ -0,0 +1,195 @@
+from argparse import ArgumentParser
+from importlib.util import find_spec
+from os import path, replace
+from typing import Dict, List, Optional
+
+from loguru import logger
+from pandas import DataFrame, read_csv, read_feather, read_parquet
+
+COLUMNAR_FORMATS = (".parquet", ".feather")
+
+_NETWORK_DTYPES = {
+    "from_node": "int32", "to_node": "int32", "edge": "category",
+    "from_lat": "float32", "from_lon": "float32", "to_lat": "float32", "to_lon": "float32",
+    "n_buses": "int32",
+}
+_STOPS_DTYPES = {
+    "codigo_estacion": "int32", "codigo_parada": "int32", "nombre_parada": "category",
+    "linea": "category", "cp_parada": "int32", "distrito_parada": "int32",
+}
+_ITINERARY_DTYPES = {
+    "linea": "category", "stopNum": "int32", "latitude": "float32", "longitude": "float32",
+    "distance": "int32",
+}
+TABLE_DTYPES: Dict[str, Dict[str, str]] = {
+    "net_busstop": _NETWORK_DTYPES,
+    "net_cp": _NETWORK_DTYPES,
+    "net_distrito": _NETWORK_DTYPES,
+    "emt-data-clean": _STOPS_DTYPES,
+    "df_combinado_latlon": {**_STOPS_DTYPES, "longitud": "float32", "latitud": "float32"},
+    "longitude_latitude": {"codigo_parada": "int32", "longitud": "float32", "latitud": "float32"},
+    "emt-linea-data-clean": {"from_codigo_estacion": "int32", "to_codigo_estacion": "int32", "edge": "category"},
+    "stops_toA": _ITINERARY_DTYPES,
+    "stops_toB": _ITINERARY_DTYPES,
+    "df_distritos": {"numero_distrito": "int32"},
+}
+
+
+def load_table(name: str, data_dir: str="data", columns: Optional[List[str]]=None) -> DataFrame:
+    """
+    Load a table of `data_dir`, from its columnar copy when there is one.
+
+    Parameters
+    ----------
+    name : str
+        Name of the table without extension, for instance 'net_busstop'.
+    data_dir : str, optional
+        Folder with the tables. Default is 'data'.
+    columns : List[str], optional
+        Columns to read. Default is None, which reads every column.
+
+    Returns
+    -------
+    DataFrame
+        The table with the compact dtypes of `TABLE_DTYPES`: codes as `int32`,
+        coordinates as `float32` and names and line ids as `category`.
+
+    Raises
+    ------
+    FileNotFoundError
+        If the table has neither a columnar copy nor a CSV file.
+
+    Examples
+    --------
+    >>> load_table("net_distrito")["from_lat"].dtype
+    dtype('float32')
+
+    Notes
+    -----
+    - `.parquet` is preferred over `.feather`, and a columnar copy older than
+      the CSV file, for instance after `python -m toolbox.pipeline` rewrote it,
+      is ignored. Without `pyarrow` the CSV file is read.
+    - Both files are cast to the same dtypes, so callers see the same frame
+      whatever file it comes from, including numeric categories that the
+      columnar formats give back as plain numbers. Line ids keep the values
+      the CSV parser gives them and only change their storage to `category`.
+    """
+    csv_path = path.join(data_dir, f"{name}.csv")
+    for extension in COLUMNAR_FORMATS:
+        columnar_path = path.join(data_dir, f"{name}{extension}")
+        if not path.exists(columnar_path):
+            continue
+        if path.exists(csv_path) and path.getmtime(columnar_path) < path.getmtime(csv_path):
+            logger.warning(f"{columnar_path} is older than {csv_path}, reading the CSV file")
+            break
+        try:
+            if extension == ".parquet":
+                return _cast(name, read_parquet(columnar_path, columns=columns))
+            return _cast(name, read_feather(columnar_path, columns=columns))
+        except ImportError as err:
+            logger.warning(f"Can not read {columnar_path}, reading the CSV file: {err}")
+            break
+    table = read_csv(csv_path, usecols=columns)
+    return _cast(name, table)
+
+
+def columnar_engine(extension: str) -> str:
+    """
+    Library pandas uses to read and write files with a columnar `extension`.
+
+    Parameters
+    ----------
+    extension : str
+        '.parquet' or '.feather'.
+
+    Returns
+    -------
+    str
+        'pyarrow', or 'fastparquet' for '.parquet' files when it is the one installed.
+
+    Raises
+    ------
+    ImportError
+        If none of the libraries able to handle `extension` is installed.
+    """
+    candidates = ("pyarrow", "fastparquet") if extension == ".parquet" else ("pyarrow",)
+    for module in candidates:
+        if find_spec(module) is not None:
+            return module
+    raise ImportError(f"{extension} files need {' or '.join(candidates)}, see requirements.txt.")
+
+
+def convert_tables(
+        data_dir: str="data", names: Optional[List[str]]=None, extension: str=".parquet"
+        ) -> List[str]:
+    """
+    Write the columnar copy of every table, with the compact dtypes of `TABLE_DTYPES`.
+
+    Parameters
+    ----------
+    data_dir : str, optional
+        Folder with the CSV tables, where the copies are written. Default is 'data'.
+    names : List[str], optional
+        Tables to convert. Default is None, which converts every table of
+        `TABLE_DTYPES` found in `data_dir`.
+    extension : str, optional
+        '.parquet' or '.feather', see `columnar_engine`. Default is '.parquet'.
+
+    Returns
+    -------
+    List[str]
+        Paths of the written files.
+
+    Raises
+    ------
+    ValueError
+        If `extension` is not supported.
+    ImportError
+        If `pyarrow` is not installed, before any table is read.
+    """
+    if extension not in COLUMNAR_FORMATS:
+        raise ValueError((
+            f"You have passed extension={extension} and the possible values are {COLUMNAR_FORMATS}."
+        ))
+    engine = columnar_engine(extension)
+    if names is None:
+        names = [name for name in TABLE_DTYPES if path.exists(path.join(data_dir, f"{name}.csv"))]
+    paths = []
+    for name in names:
+        csv_path = path.join(data_dir, f"{name}.csv")
+        table = _cast(name, read_csv(csv_path))
+        columnar_path = path.join(data_dir, f"{name}{extension}")
+        if extension == ".parquet":
+            table.to_parquet(f"{columnar_path}.tmp", engine=engine, index=False)
+        else:
+            table.to_feather(f"{columnar_path}.tmp")
+        replace(f"{columnar_path}.tmp", columnar_path)
+        logger.info(
+            f"{csv_path} ({path.getsize(csv_path) / 2 ** 20:.1f} MB) -> "
+            f"{columnar_path} ({path.getsize(columnar_path) / 2 ** 20:.1f} MB)"
+        )
+        paths.append(columnar_path)
+    return paths
+
+
+def _cast(name: str, table: DataFrame) -> DataFrame:
+    """Cast the columns of `table` present in `TABLE_DTYPES` to their compact dtype."""
+    dtypes = {column: dtype for column, dtype in TABLE_DTYPES.get(name, {}).items() if column in table}
+    return table.astype(dtypes)
+
+
+def main(argv: Optional[List[str]]=None) -> None:
+    """Command line entry point, see `python -m toolbox.storage --help`."""
+    parser = ArgumentParser(
+        prog="python -m toolbox.storage",
+        description="Write compact columnar copies of the CSV tables, read first by `load_table`.",
+    )
+    parser.add_argument("tables", nargs="*", help="Tables to convert, all of them by default.")
+    parser.add_argument("--data-dir", default="data", help="Folder with the CSV tables.")
+    parser.add_argument("--format", choices=[extension[1:] for extension in COLUMNAR_FORMATS], default="parquet")
+    args = parser.parse_args(argv)
+    convert_tables(args.data_dir, names=args.tables or None, extension=f".{args.format}")
+
+
+if __name__ == "__main__":
+    main()